@@ -0,0 +1,349 @@
+"""
+HTTP JSON API for the social network, an alternative front end to menu.py.
+
+    python api_server.py --port 8000
+
+Routes (request and response bodies are JSON):
+
+    POST   /users                    {"user_id", "first_name", "last_name", "email"}
+    GET    /users/<user_id>
+    PUT    /users/<user_id>          {"first_name", "last_name", "email"}
+    DELETE /users/<user_id>          also deletes the user's statuses
+    GET    /users/<user_id>/statuses ?limit=N (1 to MAX_LIMIT), newest first
+    POST   /statuses                 {"status_id", "user_id", "status_text"}
+    GET    /statuses/<status_id>
+    PUT    /statuses/<status_id>     {"status_text"}
+    DELETE /statuses/<status_id>
+
+ThreadingHTTPServer serves each connection on its own thread, and every
+thread shares the pooled MongoClient from socialnetwork_model. Threads are
+not pooled or capped. What is bounded is the database work: every request
+gets a database deadline, and once max_in_flight requests are being served
+new ones are turned away with 503 instead of queueing up behind a slow
+database.
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+from loguru import logger
+import main
+import log_config
+from socialnetwork_model import tenant_from_env
+
+
+RESOURCES = {"users": "user", "statuses": "status"}
+# Most statuses GET /users/<user_id>/statuses returns; larger limits are capped.
+MAX_LIMIT = 100
+# Body fields each write route needs, keyed by (method, resource, path length).
+REQUIRED_FIELDS = {
+    ("POST", "users", 1): ("user_id", "first_name", "last_name", "email"),
+    ("PUT", "users", 2): ("first_name", "last_name", "email"),
+    ("POST", "statuses", 1): ("status_id", "user_id", "status_text"),
+    ("PUT", "statuses", 2): ("status_text",),
+}
+
+
+def check_fields(body, names):
+    """
+    Raises KeyError for the first of names missing from body, and ValueError,
+    with a message for the client, if one isn't a non-empty string.
+    """
+    for name in names:
+        value = body[name]
+        if not isinstance(value, str) or not value:
+            raise ValueError(f'{name} must be a non-empty string')
+
+
+class SocialNetworkAPI:
+    """
+    Maps HTTP requests onto the user and status collections. Kept separate
+    from the HTTP handler so it can be called (and tested) without sockets.
+    """
+    def __init__(self, user_collection, status_collection, max_in_flight=64,
+                 db_timeout=2.0, rate_limiter=None):
+        self.user_collection = user_collection
+        self.status_collection = status_collection
+        self.rate_limiter = rate_limiter
+        self.db_timeout = db_timeout
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+
+    def handle(self, method, path, body=None):
+        """
+        Serves one request and returns (http_status, payload).
+        Returns 503 straight away if too many requests are in flight.
+        """
+        # A non-blocking acquire can't be a with block; finally releases the slot.
+        if not self.slots.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return 503, {"error": "server busy, retry later"}
+        try:
+            with pymongo.timeout(self.db_timeout):
+                return self.route(method, path, body or {})
+        except KeyError as error:
+            return 400, {"error": f'missing field {error}'}
+        except ValueError as error:
+            # e.g. a status_id that doesn't name its user on a routed collection
+            return 400, {"error": str(error)}
+        except PyMongoError as error:
+            logger.error(f'{method} {path} failed: {error}')
+            if error.timeout:
+                return 504, {"error": "database timeout"}
+            return 503, {"error": "database unavailable"}
+        finally:
+            self.slots.release()
+
+    def route(self, method, path, body):
+        """
+        Dispatches to the handler for method and path.
+        """
+        url = urlsplit(path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+        if parts:
+            check_fields(body, REQUIRED_FIELDS.get((method, parts[0], len(parts)), ()))
+        if parts == ["users"] and method == "POST":
+            return self.add_user(body)
+        if parts == ["statuses"] and method == "POST":
+            return self.add_status(body)
+        if len(parts) == 3 and parts[0] == "users" and parts[2] == "statuses" \
+                and method == "GET":
+            return self.latest_statuses(parts[1], query)
+        if len(parts) == 2 and parts[0] in RESOURCES:
+            handler = getattr(self, f'{method.lower()}_{RESOURCES[parts[0]]}', None)
+            if handler is not None:
+                return handler(parts[1], body)
+        return 404, {"error": "no such route"}
+
+    def add_user(self, body):
+        """
+        POST /users
+        """
+        added = self.user_collection.add_user(body["user_id"], body["first_name"],
+                                              body["last_name"], body["email"])
+        if added is None:
+            return 400, {"error": f'{body["email"]} is not a valid email address'}
+        if not added:
+            return 409, {"error": f'{body["user_id"]} already exists'}
+        return 201, {"user_id": body["user_id"]}
+
+    def get_user(self, user_id, _body):
+        """
+        GET /users/<user_id>
+        """
+        result = self.user_collection.search_user(user_id)
+        user = next(iter(result), None) if result is not None else None
+        if user is None:
+            return 404, {"error": f'{user_id} does not exist'}
+        return 200, user
+
+    def put_user(self, user_id, body):
+        """
+        PUT /users/<user_id>
+        """
+        updated = self.user_collection.update_user(user_id, body["first_name"],
+                                                   body["last_name"], body["email"])
+        if updated is None:
+            return 404, {"error": f'{user_id} does not exist'}
+        if not updated:
+            return 400, {"error": f'{body["email"]} is not a valid email address'}
+        return 200, {"user_id": user_id}
+
+    def delete_user(self, user_id, _body):
+        """
+        DELETE /users/<user_id>, statuses first like main.delete_user.
+        """
+        deleted_statuses = self.status_collection.delete_statuses_by_user(user_id)
+        if self.user_collection.delete_user(user_id) is None:
+            return 404, {"error": f'{user_id} does not exist'}
+        return 200, {"user_id": user_id, "deleted_statuses": deleted_statuses}
+
+    def add_status(self, body):
+        """
+        POST /statuses, only for users that exist and are under their rate limit.
+        """
+        if self.rate_limiter is not None and not self.rate_limiter.allow(body["user_id"]):
+            return 429, {"error": f'{body["user_id"]} is posting too fast'}
+        if not self.user_collection.existing_user_ids([body["user_id"]]):
+            return 404, {"error": f'{body["user_id"]} does not exist'}
+        if not self.status_collection.add_status(body["status_id"], body["user_id"],
+                                                 body["status_text"]):
+            return 409, {"error": f'{body["status_id"]} already exists'}
+        return 201, {"status_id": body["status_id"]}
+
+    def get_status(self, status_id, _body):
+        """
+        GET /statuses/<status_id>
+        """
+        result = self.status_collection.search_status(status_id)
+        if result is None:
+            return 404, {"error": f'{status_id} does not exist'}
+        result = iter(result)
+        try:
+            status = next(result, None)
+        finally:
+            # With blobs, search_status returns a generator over the cursor;
+            # closing it closes the cursor instead of leaving it to the server.
+            if hasattr(result, "close"):
+                result.close()
+        if status is None:
+            return 404, {"error": f'{status_id} does not exist'}
+        return 200, status
+
+    def put_status(self, status_id, body):
+        """
+        PUT /statuses/<status_id>, charged to the user the status is stored under.
+        """
+        if self.rate_limiter is not None:
+            owner = self.status_collection.status_user(status_id)
+            if owner is None:
+                return 404, {"error": f'{status_id} does not exist'}
+            if not self.rate_limiter.allow(owner):
+                return 429, {"error": f'{owner} is posting too fast'}
+        if self.status_collection.update_status(status_id, body["status_text"]) is None:
+            return 404, {"error": f'{status_id} does not exist'}
+        return 200, {"status_id": status_id}
+
+    def delete_status(self, status_id, _body):
+        """
+        DELETE /statuses/<status_id>
+        """
+        if self.status_collection.delete_status(status_id) is None:
+            return 404, {"error": f'{status_id} does not exist'}
+        return 200, {"status_id": status_id}
+
+    def latest_statuses(self, user_id, query):
+        """
+        GET /users/<user_id>/statuses?limit=N, with N capped at MAX_LIMIT.
+        limit=0 would mean no limit to MongoDB, so it is rejected.
+        """
+        limit = query.get("limit", ["10"])[0]
+        if not limit.isdigit() or not int(limit):
+            return 400, {"error": "limit must be a positive number"}
+        return 200, list(self.status_collection.latest_statuses(user_id,
+                                                                min(int(limit), MAX_LIMIT)))
+
+
+def read_body(content_length, rfile):
+    """
+    Reads a request body of content_length bytes (the raw header, or None)
+    from rfile and returns it as a dict, or None if there is no body.
+    Raises ValueError, with a message for the client, if the length isn't
+    a number or the body isn't a UTF-8 JSON object.
+    """
+    content_length = (content_length or "0").strip()
+    if not content_length.isdigit():
+        raise ValueError("Content-Length must be a number")
+    length = int(content_length)
+    if not length:
+        return None
+    try:
+        body = json.loads(rfile.read(length).decode("utf-8"))
+    except UnicodeDecodeError as error:
+        raise ValueError("body is not valid UTF-8") from error
+    except json.JSONDecodeError as error:
+        raise ValueError("body is not valid JSON") from error
+    if not isinstance(body, dict):
+        raise ValueError("body must be a JSON object")
+    return body
+
+
+def make_handler(api, request_timeout):
+    """
+    Builds a request handler class bound to api. request_timeout is the
+    socket timeout for reading a request from a slow client.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        """
+        Translates HTTP into SocialNetworkAPI.handle calls.
+        """
+        timeout = request_timeout
+        protocol_version = "HTTP/1.1"
+
+        def serve(self):
+            """
+            Reads the JSON body, calls the api and writes the JSON reply.
+            """
+            try:
+                body = read_body(self.headers.get("Content-Length"), self.rfile)
+            except ValueError as error:
+                self.close_connection = True
+                self.reply(400, {"error": str(error)})
+                return
+            self.reply(*api.handle(self.command, self.path, body))
+
+        def reply(self, status, payload):
+            """
+            Sends payload as JSON with the given status.
+            """
+            data = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status in (429, 503):
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = serve
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            logger.debug(format % args)
+
+    return Handler
+
+
+def make_server(host="127.0.0.1", port=8000, *, request_timeout=10.0, tenant=None,
+                **api_options):
+    """
+    Creates a threaded HTTP server wired to the collections of tenant
+    (by default the one named by SOCIALNETWORK_TENANT). The api options
+    (max_in_flight, db_timeout, rate_limiter) go to SocialNetworkAPI.
+    """
+    tenant = tenant_from_env() if tenant is None else tenant
+    user_collection = main.init_user_collection(tenant)
+    api = SocialNetworkAPI(user_collection,
+                           main.init_status_collection(tenant=tenant,
+                                                       user_collection=user_collection),
+                           **api_options)
+    server = ThreadingHTTPServer((host, port), make_handler(api, request_timeout))
+    server.daemon_threads = True
+    return server
+
+
+def main_cli():
+    """
+    Command line entry point.
+    """
+    log_config.configure()
+    parser = argparse.ArgumentParser(description="Serve the social network over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--db-timeout", type=float, default=2.0,
+                        help="seconds each request may spend in MongoDB")
+    parser.add_argument("--post-rate", type=float,
+                        help="statuses per second each user may post (default: no limit)")
+    parser.add_argument("--post-burst", type=int, default=10)
+    parser.add_argument("--shared-limits", action="store_true",
+                        help="keep rate limits in MongoDB, shared by every server process")
+    args = parser.parse_args()
+    limiter = None
+    if args.post_rate:
+        limiter = main.init_rate_limiter(args.post_rate, args.post_burst, args.shared_limits,
+                                         tenant_from_env())
+    httpd = make_server(args.host, args.port, max_in_flight=args.max_in_flight,
+                        db_timeout=args.db_timeout, rate_limiter=limiter)
+    print(f'Serving on http://{args.host}:{args.port}')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,314 @@
+"""
+Non-interactive batch runner for the operations menu.py offers.
+
+Reads newline-delimited JSON, one operation per line, for example:
+
+    {"op": "add_user", "user_id": "velma2", "first_name": "Velma",
+     "last_name": "Dinkley", "email": "velma2@gmail.com"}
+    {"op": "add_status", "status_id": "velma2_00001", "user_id": "velma2",
+     "status_text": "Jinkies!"}
+    {"op": "search_status", "status_id": "velma2_00001"}
+
+The field names are the parameter names of the matching main.py function.
+Runs of consecutive add_user or add_status operations are sent to MongoDB as
+one insert_many (the user existence check for a run of statuses is one query),
+and a latency report is printed at the end instead of a line per operation.
+A failing operation never stops the run: it is counted with its error code
+(a server code such as 11000 or 121, or a name such as "unknown_user"), and
+--failed writes every failed operation back out as NDJSON with an "error"
+field, ready to fix and re-run:
+
+    python batch.py operations.ndjson --failed failed.ndjson
+    cat operations.ndjson | python batch.py -
+"""
+import argparse
+import json
+import sys
+import time
+
+from pymongo.errors import PyMongoError
+
+import main
+import log_config
+from socialnetwork_model import tenant_from_env
+from user_status import status_owner
+
+BATCHED_OPS = {
+    "add_user": ("user_id", "first_name", "last_name", "email"),
+    "add_status": ("status_id", "user_id", "status_text"),
+}
+
+
+class BatchRunner:
+    """
+    Executes operations against a user and a status collection and
+    keeps the latency of every operation, grouped by op name.
+    """
+    def __init__(self, user_collection, status_collection, batch_size=1000):
+        self.user_collection = user_collection
+        self.status_collection = status_collection
+        self.batch_size = batch_size
+        self.latencies = {}
+        self.failures = {}
+        self.failed = []
+        self.pending = []
+
+    def record(self, op_name, seconds, succeeded=True):
+        """
+        Records the latency of one operation and whether it succeeded.
+        """
+        self.latencies.setdefault(op_name, []).append(seconds)
+        if not succeeded:
+            self.failures[op_name] = self.failures.get(op_name, 0) + 1
+
+    def fail(self, operation, code):
+        """
+        Keeps a failed operation and its error code for the report.
+        """
+        self.failed.append((operation, code))
+
+    def submit(self, operation):
+        """
+        Queues a batchable operation or flushes the queue and runs it.
+        """
+        op_name = operation.get("op")
+        if self.pending and (op_name != self.pending[0]["op"]
+                             or len(self.pending) >= self.batch_size):
+            self.flush()
+        if op_name in BATCHED_OPS:
+            if all(field in operation for field in BATCHED_OPS[op_name]):
+                self.pending.append(operation)
+            else:
+                self.record(op_name, 0.0, False)
+                self.fail(operation, "missing_fields")
+        else:
+            self.run_one(operation)
+
+    def flush(self):
+        """
+        Sends the queued add_user or add_status operations as one bulk insert.
+        Every operation in the batch is charged an equal share of its time.
+        If the whole batch fails, every operation in it is failed with the
+        error's code and the run goes on.
+        """
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        op_name = batch[0]["op"]
+        start = time.perf_counter()
+        try:
+            codes = self.add_users(batch) if op_name == "add_user" else self.add_statuses(batch)
+        except (ValueError, PyMongoError) as error:
+            codes = [error_code(error)] * len(batch)
+        share = (time.perf_counter() - start) / len(batch)
+        for operation, code in zip(batch, codes):
+            self.record(op_name, share, code is None)
+            if code is not None:
+                self.fail(operation, code)
+
+    def add_users(self, batch):
+        """
+        Inserts a batch of add_user operations. Returns one error code per
+        operation, None for those inserted, else the server's code (11000 for
+        a duplicate user_id, 121 for a schema violation).
+        """
+        return self.user_collection.add_users_codes(
+            [(op["user_id"], op["first_name"], op["last_name"], op["email"]) for op in batch])
+
+    def add_statuses(self, batch):
+        """
+        Inserts a batch of add_status operations whose user exists (and, for
+        a routed collection, whose status_id encodes that user). Returns one
+        error code per operation, None for those inserted, else the server's
+        code for the rows it refused.
+        """
+        known = self.user_collection.existing_user_ids({op["user_id"] for op in batch})
+        codes = [None if op["user_id"] in known else "unknown_user" for op in batch]
+        if self.status_collection.routed:
+            for index, op in enumerate(batch):
+                if codes[index] is None and status_owner(op["status_id"]) != op["user_id"]:
+                    codes[index] = "owner_mismatch"
+        accepted = [index for index, code in enumerate(codes) if code is None]
+        refused = self.status_collection.add_statuses_codes(
+            [(batch[index]["status_id"], batch[index]["user_id"], batch[index]["status_text"])
+             for index in accepted])
+        for index, code in zip(accepted, refused):
+            codes[index] = code
+        return codes
+
+    def run_one(self, operation):
+        """
+        Runs a single non-batched operation.
+        """
+        op_name = operation.get("op")
+        handler = getattr(self, f'op_{op_name}', None)
+        if handler is None:
+            self.record("unknown", 0.0, False)
+            self.fail(operation, "unknown_op")
+            return
+        start = time.perf_counter()
+        try:
+            succeeded = handler(operation)
+        except KeyError:
+            succeeded = False
+            self.fail(operation, "missing_fields")
+        except (ValueError, PyMongoError) as error:
+            succeeded = False
+            self.fail(operation, error_code(error))
+        self.record(op_name, time.perf_counter() - start, succeeded)
+
+    def op_update_user(self, op):
+        """
+        main.update_user without the print. An update the users schema
+        refuses is failed as "rejected".
+        """
+        updated = self.user_collection.update_user(op["user_id"], op["first_name"],
+                                                   op["last_name"], op["email"])
+        if updated is False:
+            self.fail(op, "rejected")
+        return bool(updated)
+
+    def op_update_status(self, op):
+        """
+        main.update_status without the print.
+        """
+        return self.status_collection.update_status(op["status_id"],
+                                                    op["status_text"]) is not None
+
+    def op_delete_user(self, op):
+        """
+        main.delete_user without the print: the user's statuses go first,
+        in one delete_many.
+        """
+        self.status_collection.delete_statuses_by_user(op["user_id"])
+        return self.user_collection.delete_user(op["user_id"]) is not None
+
+    def op_delete_status(self, op):
+        """
+        main.delete_status without the print.
+        """
+        return self.status_collection.delete_status(op["status_id"]) is not None
+
+    def op_search_user(self, op):
+        """
+        main.search_user without the print; the cursor is drained.
+        """
+        result = self.user_collection.search_user(op["user_id"])
+        return result is not None and bool(list(result))
+
+    def op_search_status(self, op):
+        """
+        main.search_status without the print; the cursor is drained.
+        """
+        result = self.status_collection.search_status(op["status_id"])
+        return result is not None and bool(list(result))
+
+    def op_search_status_by_id(self, op):
+        """
+        Fetches all statuses of a user.
+        """
+        list(self.status_collection.search_status_by_id(op["user_id"]))
+        return True
+
+    def run(self, lines):
+        """
+        Runs every operation in an iterable of NDJSON lines. Blank lines
+        are skipped; lines that aren't valid JSON count as "invalid" failures.
+        """
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                operation = json.loads(line)
+            except json.JSONDecodeError:
+                operation = None
+            if not isinstance(operation, dict):
+                self.record("invalid", 0.0, False)
+                self.fail({"line": line.rstrip("\n")}, "invalid_json")
+                continue
+            self.submit(operation)
+        self.flush()
+
+    def report(self, wall_seconds, out=sys.stdout):
+        """
+        Prints count, failures and latency percentiles per op, and totals.
+        """
+        print(f'{"op":<22}{"count":>8}{"failed":>8}{"mean ms":>10}'
+              f'{"p50 ms":>10}{"p99 ms":>10}', file=out)
+        total = 0
+        for op_name, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            total += len(ordered)
+            print(f'{op_name:<22}{len(ordered):>8}{self.failures.get(op_name, 0):>8}'
+                  f'{1000 * sum(ordered) / len(ordered):>10.3f}'
+                  f'{1000 * percentile(ordered, 50):>10.3f}'
+                  f'{1000 * percentile(ordered, 99):>10.3f}', file=out)
+        rate = total / wall_seconds if wall_seconds else 0.0
+        print(f'{total} operations in {wall_seconds:.2f}s ({rate:.0f} ops/s)', file=out)
+        errors = {}
+        for operation, code in self.failed:
+            key = (operation.get("op", "invalid"), str(code))
+            errors[key] = errors.get(key, 0) + 1
+        for (op_name, code), count in sorted(errors.items()):
+            print(f'{op_name:<22}{count:>8} failed with {code}', file=out)
+
+    def write_failed(self, out):
+        """
+        Writes every failed operation as NDJSON, with its error code in "error".
+        """
+        for operation, code in self.failed:
+            out.write(json.dumps({**operation, "error": code}) + "\n")
+
+
+def error_code(error):
+    """
+    Returns the server error code of error, or its class name if it has none.
+    """
+    return getattr(error, "code", None) or type(error).__name__
+
+
+def percentile(ordered, pct):
+    """
+    Returns the pct percentile of an already sorted list (nearest rank).
+    """
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def main_cli():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Run menu.py operations from NDJSON.")
+    parser.add_argument("operations", help="NDJSON file, or - for stdin")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--failed", help="write the failed operations to this NDJSON file")
+    args = parser.parse_args()
+    log_config.configure()
+
+    tenant = tenant_from_env()
+    user_collection = main.init_user_collection(tenant)
+    runner = BatchRunner(user_collection,
+                         main.init_status_collection(tenant=tenant,
+                                                     user_collection=user_collection),
+                         args.batch_size)
+    start = time.perf_counter()
+    if args.operations == "-":
+        runner.run(sys.stdin)
+    else:
+        try:
+            with open(args.operations, 'r', encoding="utf-8") as file:
+                runner.run(file)
+        except FileNotFoundError:
+            print("Operations file not found.", file=sys.stderr)
+            return
+    runner.report(time.perf_counter() - start)
+    if args.failed:
+        with open(args.failed, 'w', encoding="utf-8") as file:
+            runner.write_failed(file)
+
+
+if __name__ == "__main__":
+    main_cli()
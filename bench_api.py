@@ -0,0 +1,126 @@
+"""
+Load generator for api_server.py. Seeds users and statuses through the API,
+then hammers it with a read-heavy mix from several threads and reports
+requests/sec and latency percentiles:
+
+    python api_server.py --port 8000 &
+    python bench_api.py --url http://127.0.0.1:8000 --threads 16 --requests 20000
+
+The seeded users (bench_user_<n>) are deleted again at the end.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from batch import percentile
+
+
+class Client:
+    """
+    One keep-alive HTTP connection to the API.
+    """
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def request(self, method, path, body=None):
+        """
+        Sends a request and returns the HTTP status.
+        """
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        self.connection.request(method, path, body=data, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status
+
+
+def seed(url, users, statuses_per_user):
+    """
+    Creates the benchmark users and their statuses.
+    """
+    client = Client(url)
+    for n in range(users):
+        user_id = f'bench_user_{n}'
+        client.request("POST", "/users", {"user_id": user_id, "first_name": "Bench",
+                                          "last_name": str(n), "email": f'{user_id}@test.com'})
+        for m in range(statuses_per_user):
+            client.request("POST", "/statuses", {"status_id": f'{user_id}_{m}',
+                                                 "user_id": user_id,
+                                                 "status_text": "load testing the api"})
+
+
+def cleanup(url, users):
+    """
+    Deletes the benchmark users and, with them, their statuses.
+    """
+    client = Client(url)
+    for n in range(users):
+        client.request("DELETE", f'/users/bench_user_{n}')
+
+
+def worker(url, count, users, statuses_per_user, write_ratio, results):
+    """
+    Sends count requests and appends (latency, status) pairs to results.
+    """
+    client = Client(url)
+    rng = random.Random()
+    samples = []
+    for _ in range(count):
+        n = rng.randrange(users)
+        status_id = f'bench_user_{n}_{rng.randrange(statuses_per_user)}'
+        roll = rng.random()
+        if roll < write_ratio:
+            method, path, body = "PUT", f'/statuses/{status_id}', {"status_text": "updated"}
+        elif roll < 0.5 + write_ratio / 2:
+            method, path, body = "GET", f'/statuses/{status_id}', None
+        else:
+            method, path, body = "GET", f'/users/bench_user_{n}', None
+        start = time.perf_counter()
+        status = client.request(method, path, body)
+        samples.append((time.perf_counter() - start, status))
+    results.extend(samples)
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Load test api_server.py.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--statuses-per-user", type=int, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    seed(args.url, args.users, args.statuses_per_user)
+    results = []
+    per_thread = args.requests // args.threads
+    threads = [threading.Thread(target=worker,
+                                args=(args.url, per_thread, args.users,
+                                      args.statuses_per_user, args.write_ratio, results))
+               for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cleanup(args.url, args.users)
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status >= 500)
+    print(f'{len(results)} requests from {args.threads} threads in {elapsed:.2f}s: '
+          f'{len(results) / elapsed:.0f} req/s, {errors} 5xx responses')
+    for pct in (50, 95, 99, 99.9):
+        print(f'p{pct:<5} {1000 * percentile(latencies, pct):8.2f} ms')
+
+
+if __name__ == "__main__":
+    main()
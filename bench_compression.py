@@ -0,0 +1,104 @@
+"""
+Load time, on-disk size and query latency for each compression profile
+(socialnetwork_model.COMPRESSION_PROFILES). Needs a running mongod started
+with mongo_config_dev.yml, which enables every wire compressor:
+
+    python bench_compression.py --status-file status_updates.csv
+
+Without --status-file, 100k synthetic statuses are generated. For each
+profile a fresh client (with the profile's wire compressors) loads the
+statuses into a status collection created with the profile's block
+compressor, then times random search_status and search_status_by_id calls.
+Writes to a scratch BenchCompression database which is dropped at the end.
+"""
+import argparse
+import random
+import time
+
+from pymongo import MongoClient
+
+from batch import percentile
+from dedupe_report import read_rows
+from socialnetwork_model import (COMPRESSION_PROFILES, STATUS_SCHEMA, block_compressor,
+                                 client_options, install_validator)
+from user_status import StatusCollection
+
+WORDS = ("picayune island melt combative locket good needle deceive spotless bead "
+         "jinkies zoinks mystery machine scooby snack haunted lighthouse").split()
+
+
+def synthetic_rows(count, users=5000, seed=7):
+    """
+    Returns count (status_id, user_id, status_text) rows shaped like the seed data.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for number in range(count):
+        user_id = f'bench_user_{number % users}'
+        rows.append((f'{user_id}_{number}', user_id, " ".join(rng.sample(WORDS, 5))))
+    return rows
+
+
+def run_profile(name, args, rows):
+    """
+    Loads rows under profile name and returns (load seconds, on-disk MB,
+    p50 ms, p99 ms, wire compressors offered).
+    """
+    client = MongoClient(host=args.host, port=args.port, **client_options(name))
+    client.drop_database("BenchCompression")
+    database = client.BenchCompression
+    try:
+        install_validator(database, "status", STATUS_SCHEMA, block_compressor(name))
+        status_collection = StatusCollection(database)
+        start = time.perf_counter()
+        for first in range(0, len(rows), args.chunk_size):
+            status_collection.add_statuses(rows[first:first + args.chunk_size])
+        load_seconds = time.perf_counter() - start
+
+        database.command("fsync")
+        stats = database.command("collStats", "status")
+        disk_mb = (stats["storageSize"] + stats["totalIndexSize"]) / 1e6
+
+        rng = random.Random(11)
+        latencies = []
+        for _ in range(args.queries):
+            status_id, user_id, _ = rng.choice(rows)
+            start = time.perf_counter()
+            if rng.random() < 0.5:
+                list(status_collection.search_status(status_id))
+            else:
+                list(status_collection.search_status_by_id(user_id))
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return (load_seconds, disk_mb, 1000 * percentile(latencies, 50),
+                1000 * percentile(latencies, 99),
+                client_options(name).get("compressors", "none"))
+    finally:
+        client.drop_database("BenchCompression")
+        client.close()
+
+
+def main():
+    """
+    Runs every requested profile and prints one row each.
+    """
+    parser = argparse.ArgumentParser(description="Compare compression profiles.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--status-file")
+    parser.add_argument("--statuses", type=int, default=100000)
+    parser.add_argument("--profiles", nargs="+", default=list(COMPRESSION_PROFILES))
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = read_rows(args.status_file) if args.status_file else synthetic_rows(args.statuses)
+    print(f'{len(rows)} statuses')
+    print(f'{"profile":<10}{"wire":<10}{"load s":>8}{"disk MB":>9}{"p50 ms":>8}{"p99 ms":>8}')
+    for name in args.profiles:
+        load_seconds, disk_mb, p50, p99, wire = run_profile(name, args, rows)
+        print(f'{name:<10}{wire:<10}{load_seconds:>8.2f}{disk_mb:>9.2f}{p50:>8.2f}{p99:>8.2f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Round trips and wall time for scanning every status of heavy users, by
+cursor batch size. Needs a running mongod (mongo_config_dev.yml):
+
+    python bench_cursor.py --users 5 --statuses-per-user 10000
+
+For each batch size it streams every user's statuses with
+main.stream_statuses into a null stream, and prints the getMore round trips
+per user, the milliseconds per user, and the same for the old path (a
+default-size cursor printed document by document). Writes to a scratch
+BenchCursor database which is dropped at the end.
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from pymongo import MongoClient, monitoring
+
+import main
+from user_status import StatusCollection
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """
+    Counts find and getMore commands.
+    """
+    def __init__(self):
+        self.finds = 0
+        self.get_mores = 0
+
+    def reset(self):
+        """
+        Zeroes the counters.
+        """
+        self.finds = self.get_mores = 0
+
+    def started(self, event):
+        if event.command_name == "find":
+            self.finds += 1
+        elif event.command_name == "getMore":
+            self.get_mores += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def measure(counter, name, scan, user_ids):
+    """
+    Runs scan(user_id) for every user and prints the getMores and
+    milliseconds per user.
+    """
+    counter.reset()
+    start = time.perf_counter()
+    for user_id in user_ids:
+        scan(user_id)
+    elapsed = time.perf_counter() - start
+    users = len(user_ids)
+    print(f'{name:<32}{counter.get_mores / users:>10.1f}{1000 * elapsed / users:>10.1f}')
+
+
+def main_cli():
+    """
+    Seeds the scratch database and compares cursor batch sizes.
+    """
+    parser = argparse.ArgumentParser(description="Round trips for heavy users.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--statuses-per-user", type=int, default=10000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[0, 500, 1000, 5000])
+    args = parser.parse_args()
+
+    counter = RoundTripCounter()
+    client = MongoClient(host=args.host, port=args.port, event_listeners=[counter])
+    client.drop_database("BenchCursor")
+    status_collection = StatusCollection(client.BenchCursor)
+    user_ids = [f'heavy_user_{n}' for n in range(args.users)]
+    for user_id in user_ids:
+        status_collection.add_statuses(
+            [(f'{user_id}_{m}', user_id, "picayune island melt combative locket")
+             for m in range(args.statuses_per_user)])
+
+    try:
+        print(f'{args.statuses_per_user} statuses per user')
+        print(f'{"scan":<32}{"getMores":>10}{"ms/user":>10}')
+        with open(os.devnull, "w", encoding="utf-8") as null:
+            def old_path(user_id):
+                with contextlib.redirect_stdout(null):
+                    for status in status_collection.search_status_by_id(
+                            user_id, {"USER_ID": 1, "STATUS_TEXT": 1}):
+                        main.print_status(status)
+            measure(counter, "default cursor, print per row", old_path, user_ids)
+            for batch_size in args.batch_sizes:
+                measure(counter, f'stream, batch_size={batch_size}',
+                        lambda user_id, size=batch_size: main.stream_statuses(
+                            user_id, status_collection, null, batch_size=size),
+                        user_ids)
+        # Text written to memory, to show the chunked writes aren't the cost.
+        measure(counter, "stream to StringIO, 1000",
+                lambda user_id: main.stream_statuses(user_id, status_collection,
+                                                     io.StringIO()), user_ids)
+    finally:
+        client.drop_database("BenchCursor")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,95 @@
+"""
+Logging overhead per StatusCollection.add_status call. The database is a
+do-nothing stand-in, so what's left is the cost of the code around the
+insert, logging included:
+
+    python bench_logging.py --calls 200000
+
+Compares logging off, synchronous file sinks writing every record, and
+log_config.configure() with enqueued JSON sinks at several debug sample
+rates. "us/call" is what the caller waits for; "drain" is the time per call
+the writer thread needed afterwards to catch up, off the request path.
+Log files go to a temporary directory.
+
+Expect enqueued sinks at full volume to cost the caller more CPU than a
+synchronous write to a fast local disk: every record is pickled onto the
+queue. What enqueueing buys is that a slow or stalled disk no longer blocks
+requests; sampling is what keeps the per-call cost down.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from loguru import logger
+
+import log_config
+from user_status import StatusCollection
+
+
+class NullCollection:
+    """
+    Accepts writes and does nothing with them.
+    """
+    def insert_one(self, document):
+        """
+        Drops document.
+        """
+
+    def create_index(self, keys):
+        """
+        Ignores the index on keys.
+        """
+
+
+def per_call_us(calls):
+    """
+    Runs add_status calls times. Returns the mean time per call and the
+    time per call spent afterwards waiting for enqueued records to be
+    written, both in microseconds.
+    """
+    status_collection = StatusCollection({"status": NullCollection()})
+    start = time.perf_counter()
+    for n in range(calls):
+        status_collection.add_status(f'bench_user_{n}', "bench_user", "Jinkies!")
+    done = time.perf_counter()
+    logger.complete()
+    return 1e6 * (done - start) / calls, 1e6 * (time.perf_counter() - done) / calls
+
+
+def main():
+    """
+    Times add_status under each logging setup.
+    """
+    parser = argparse.ArgumentParser(description="Logging overhead per add_status.")
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_file = os.path.join(log_dir, "bench.log")
+
+        setups = [
+            ("logging off", log_config.disable),
+            ("sync text, every record", lambda: log_config.configure(
+                log_file=log_file, sample_rate=1.0, enqueue=False, serialize=False,
+                force=True)),
+            ("sync JSON, every record", lambda: log_config.configure(
+                log_file=log_file, sample_rate=1.0, enqueue=False, force=True)),
+        ]
+        for rate in (1.0, 0.1, 0.01):
+            setups.append((f'enqueued JSON, sample {rate:g}',
+                           lambda rate=rate: log_config.configure(
+                               log_file=log_file, sample_rate=rate, force=True)))
+
+        baseline = None
+        print(f'{"setup":<34}{"us/call":>10}{"overhead":>10}{"drain":>10}')
+        for name, setup in setups:
+            setup()
+            per_call, drain = per_call_us(args.calls)
+            baseline = per_call if baseline is None else baseline
+            print(f'{name:<34}{per_call:>10.2f}{per_call - baseline:>10.2f}{drain:>10.2f}')
+        logger.remove()
+
+
+if __name__ == "__main__":
+    main()
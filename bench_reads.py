@@ -0,0 +1,128 @@
+"""
+Search throughput by read preference against a replica set. Seeds a scratch
+BenchReads database, then runs search_status / search_status_by_id from
+several threads for a few seconds per read preference, and prints reads/sec,
+latency percentiles and how the reads spread over the members:
+
+    python bench_reads.py --uri "mongodb://localhost:27017,localhost:27018/?replicaSet=rs0"
+
+Run it with one, two, then three data-bearing members to see reads scale out
+with secondaryPreferred / nearest while primary stays flat. The scratch
+database is dropped at the end.
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+
+from pymongo import MongoClient, WriteConcern, monitoring
+
+from batch import percentile
+from socialnetwork_model import search_read_preference
+from user_status import StatusCollection
+from users import UserCollection
+
+
+class ServerCounter(monitoring.CommandListener):
+    """
+    Counts the find commands each member served.
+    """
+    def __init__(self):
+        self.servers = Counter()
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name == "find":
+            with self._lock:
+                self.servers[f'{event.connection_id[0]}:{event.connection_id[1]}'] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def run(status_collection, user_ids, statuses_per_user, threads, seconds):
+    """
+    Runs random searches from threads threads for seconds seconds.
+    Returns the sorted latencies in seconds.
+    """
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def worker():
+        rng = random.Random()
+        own = []
+        while time.perf_counter() < stop_at:
+            user_id = rng.choice(user_ids)
+            start = time.perf_counter()
+            if rng.random() < 0.5:
+                list(status_collection.search_status(
+                    f'{user_id}_{rng.randrange(statuses_per_user)}') or [])
+            else:
+                list(status_collection.search_status_by_id(user_id, {"STATUS_TEXT": 1}))
+            own.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sorted(latencies)
+
+
+def main():
+    """
+    Seeds the scratch database and compares read preferences.
+    """
+    parser = argparse.ArgumentParser(description="Search throughput by read preference.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/?replicaSet=rs0")
+    parser.add_argument("--modes", nargs="+",
+                        default=["primary", "secondaryPreferred", "nearest"])
+    parser.add_argument("--max-staleness", type=int, default=90)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--statuses-per-user", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    counter = ServerCounter()
+    client = MongoClient(args.uri, event_listeners=[counter])
+    client.drop_database("BenchReads")
+    # Seed with w="majority" so the secondaries have the data before we read.
+    database = client.get_database("BenchReads", write_concern=WriteConcern("majority"))
+    user_ids = [f'reads_user_{n}' for n in range(args.users)]
+    UserCollection(database).add_users(
+        [(user_id, "Reads", "Benchmark", f'{user_id}@example.com') for user_id in user_ids])
+    seeder = StatusCollection(database)
+    for user_id in user_ids:
+        seeder.add_statuses([(f'{user_id}_{m}', user_id, "picayune island melt combative")
+                             for m in range(args.statuses_per_user)])
+    members = len(client.admin.command("replSetGetStatus")["members"])
+
+    try:
+        print(f'{members} members, {args.threads} threads, {args.seconds:.0f}s per mode')
+        print(f'{"read preference":<22}{"reads/s":>10}{"p50 ms":>9}{"p99 ms":>9}  served by')
+        for mode in args.modes:
+            status_collection = StatusCollection(
+                database, users=UserCollection(database),
+                read_preference=search_read_preference(mode, args.max_staleness))
+            counter.servers.clear()
+            latencies = run(status_collection, user_ids, args.statuses_per_user,
+                            args.threads, args.seconds)
+            spread = ", ".join(f'{server} {count}'
+                               for server, count in sorted(counter.servers.items()))
+            print(f'{mode:<22}{len(latencies) / args.seconds:>10.0f}'
+                  f'{1000 * percentile(latencies, 50):>9.2f}'
+                  f'{1000 * percentile(latencies, 99):>9.2f}  {spread}')
+    finally:
+        client.drop_database("BenchReads")
+
+
+if __name__ == "__main__":
+    main()
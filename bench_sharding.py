@@ -0,0 +1,180 @@
+"""
+Simulates a status collection split across several shards and compares
+routed single-status lookups (shard key known) with broadcast ones.
+
+By default the shards are in-memory dicts. Pass --uris with one MongoDB URI
+per shard (e.g. several local mongod processes on different ports) to run the
+same comparison against real servers:
+
+    python bench_sharding.py test_status_file.csv --shards 4
+    python bench_sharding.py status_updates.csv \\
+        --uris mongodb://localhost:27018 mongodb://localhost:27019
+"""
+import argparse
+import time
+import zlib
+from csv import DictReader
+
+from pymongo import MongoClient
+
+from user_status import status_owner
+
+
+class MemoryShard:
+    """
+    One partition of the status collection kept in a dict.
+    """
+    def __init__(self):
+        self.statuses = {}
+
+    def insert_many(self, documents):
+        """
+        Stores documents by _id.
+        """
+        for document in documents:
+            self.statuses[document["_id"]] = document
+
+    def find_one(self, query):
+        """
+        Looks a status up by _id.
+        """
+        return self.statuses.get(query["_id"])
+
+    def drop(self):
+        """
+        Empties the shard.
+        """
+        self.statuses.clear()
+
+
+class MongoShard:
+    """
+    One partition of the status collection living on its own mongod.
+    """
+    def __init__(self, uri):
+        self.client = MongoClient(uri)
+        self.collection = self.client.ShardSimulation["status"]
+        self.collection.drop()
+
+    def insert_many(self, documents):
+        """
+        Bulk inserts documents.
+        """
+        if documents:
+            self.collection.insert_many(documents, ordered=False)
+
+    def find_one(self, query):
+        """
+        Looks a status up with the given filter.
+        """
+        return self.collection.find_one(query)
+
+    def drop(self):
+        """
+        Drops the shard's collection and closes the client.
+        """
+        self.collection.drop()
+        self.client.close()
+
+
+class ShardedStatuses:
+    """
+    Routes statuses to shards by a hash of USER_ID, like a hashed shard key.
+    Counts how many shards each lookup had to contact.
+    """
+    def __init__(self, shards):
+        self.shards = shards
+        self.contacted = 0
+
+    def shard_for(self, user_id):
+        """
+        Returns the shard owning user_id.
+        """
+        return self.shards[zlib.crc32(user_id.encode("utf-8")) % len(self.shards)]
+
+    def load(self, rows):
+        """
+        Partitions CSV rows across the shards and bulk inserts them.
+        """
+        partitions = {id(shard): [] for shard in self.shards}
+        for row in rows:
+            shard = self.shard_for(row["USER_ID"])
+            partitions[id(shard)].append(
+                {"_id": row["STATUS_ID"], "USER_ID": row["USER_ID"],
+                 "STATUS_TEXT": row["STATUS_TEXT"]})
+        for shard in self.shards:
+            shard.insert_many(partitions[id(shard)])
+
+    def routed_lookup(self, status_id):
+        """
+        Sends the lookup only to the shard owning the status.
+        """
+        user_id = status_owner(status_id)
+        self.contacted += 1
+        return self.shard_for(user_id).find_one({"_id": status_id, "USER_ID": user_id})
+
+    def broadcast_lookup(self, status_id):
+        """
+        Asks every shard, the way mongos has to when the filter has no shard key.
+        """
+        found = None
+        for shard in self.shards:
+            self.contacted += 1
+            document = shard.find_one({"_id": status_id})
+            if document is not None:
+                found = document
+        return found
+
+
+def run(rows, sharded, lookups):
+    """
+    Times routed and broadcast lookups of the first lookups status ids
+    and returns {"routed": (seconds, shards contacted), "broadcast": (...)}.
+    """
+    status_ids = [row["STATUS_ID"] for row in rows[:lookups]]
+    results = {}
+    for name, lookup in (("routed", sharded.routed_lookup),
+                         ("broadcast", sharded.broadcast_lookup)):
+        sharded.contacted = 0
+        start = time.perf_counter()
+        for status_id in status_ids:
+            lookup(status_id)
+        results[name] = (time.perf_counter() - start, sharded.contacted)
+    return results
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("status_file")
+    parser.add_argument("--shards", type=int, default=4,
+                        help="number of in-memory shards (ignored with --uris)")
+    parser.add_argument("--uris", nargs="+", help="one MongoDB URI per shard")
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    with open(args.status_file, 'r', encoding="utf-8") as file:
+        rows = list(DictReader(file))
+    if args.uris:
+        shards = [MongoShard(uri) for uri in args.uris]
+    else:
+        shards = [MemoryShard() for _ in range(args.shards)]
+    sharded = ShardedStatuses(shards)
+    sharded.load(rows)
+    try:
+        results = run(rows, sharded, args.lookups)
+    finally:
+        for shard in shards:
+            shard.drop()
+
+    count = min(args.lookups, len(rows))
+    print(f'{len(shards)} shards, {count} lookups')
+    for name, (seconds, contacted) in results.items():
+        print(f'{name:>9}: {seconds * 1e6 / count:8.1f} us/lookup, '
+              f'{contacted / count:.1f} shards contacted per lookup')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmarks the TrendingEngine against exact counting on a status CSV
+(status_updates.csv has 100,000 rows):
+
+    python bench_trending.py status_updates.csv --k 20
+    python bench_trending.py status_updates.csv --k 20 --mongo
+
+Exact counts come from a Counter, or with --mongo from an aggregation
+pipeline over a scratch BenchTrending database loaded with the same rows.
+"""
+import argparse
+import time
+from collections import Counter
+from csv import DictReader
+
+from pymongo import MongoClient
+
+from trending import TrendingEngine, extract_terms
+from user_status import StatusCollection
+
+
+def exact_with_counter(texts, k):
+    """
+    Counts every term exactly in Python.
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update(extract_terms(text))
+    return counts.most_common(k)
+
+
+def exact_with_pipeline(collection, k):
+    """
+    Counts words exactly with an aggregation pipeline. It splits on spaces,
+    which matches extract_terms for the generated status texts.
+    """
+    pipeline = [
+        {"$project": {"terms": {"$setUnion": [{"$split": [{"$toLower": "$STATUS_TEXT"}, " "]}]}}},
+        {"$unwind": "$terms"},
+        {"$match": {"$expr": {"$gte": [{"$strLenCP": "$terms"}, 3]}}},
+        {"$group": {"_id": "$terms", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": k},
+    ]
+    return [(row["_id"], row["count"]) for row in collection.aggregate(pipeline,
+                                                                      allowDiskUse=True)]
+
+
+def exact_top(rows, k, mongo=False):
+    """
+    Returns the exact top k terms of rows and the seconds counting took,
+    with mongo from the pipeline (not counting the time to load the rows).
+    """
+    start = time.perf_counter()
+    if not mongo:
+        exact = exact_with_counter((text for _, _, text in rows), k)
+        return exact, time.perf_counter() - start
+    client = MongoClient()
+    client.drop_database("BenchTrending")
+    try:
+        status_collection = StatusCollection(client.BenchTrending)
+        for chunk in range(0, len(rows), 10000):
+            status_collection.add_statuses(rows[chunk:chunk + 10000])
+        start = time.perf_counter()
+        exact = exact_with_pipeline(status_collection.database, k)
+        return exact, time.perf_counter() - start
+    finally:
+        client.drop_database("BenchTrending")
+
+
+def print_comparison(approximate, exact):
+    """
+    Prints the recall and worst overcount of the approximate top terms,
+    then both lists side by side.
+    """
+    exact_counts = dict(exact)
+    found = sum(1 for term, _ in approximate if term in exact_counts)
+    errors = [count - exact_counts[term] for term, count in approximate if term in exact_counts]
+    print(f'recall {found}/{len(exact)}, '
+          f'max overcount {max(errors, default=0)}')
+    for (term, count), (exact_term, exact_count) in zip(approximate, exact):
+        print(f'  {term:<20}{count:>8}   {exact_term:<20}{exact_count:>8}')
+
+
+def main():
+    """
+    Runs the engine and an exact count over the same rows and compares them.
+    """
+    parser = argparse.ArgumentParser(description="Trending engine vs exact counts.")
+    parser.add_argument("status_file")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--width", type=int, default=8192)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--mongo", action="store_true",
+                        help="use an aggregation pipeline for the exact counts")
+    args = parser.parse_args()
+
+    with open(args.status_file, 'r', encoding="utf-8") as file:
+        rows = [(row["STATUS_ID"], row["USER_ID"], row["STATUS_TEXT"])
+                for row in DictReader(file)]
+    texts = [text for _, _, text in rows]
+
+    engine = TrendingEngine(k=args.k, width=args.width, depth=args.depth)
+    start = time.perf_counter()
+    for text in texts:
+        engine.observe(text)
+    approximate = engine.top()
+    engine_seconds = time.perf_counter() - start
+
+    exact, exact_seconds = exact_top(rows, args.k, args.mongo)
+
+    print(f'{len(texts)} statuses, top {args.k}')
+    print(f'sketch: {engine_seconds:.2f}s, {engine.memory_bytes() / 1024:.0f} KiB')
+    print(f'exact ({"pipeline" if args.mongo else "Counter"}): {exact_seconds:.2f}s')
+    print_comparison(approximate, exact)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares UserDirectory with UserCollection.search_user: memory per user
+and lookup latency. Needs a running mongod (mongo_config_dev.yml):
+
+    python bench_user_directory.py --users 100000
+
+Writes to a scratch BenchDirectory database which is dropped at the end.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from pymongo import MongoClient
+
+from user_directory import UserDirectory
+from users import UserCollection
+
+FIRST_NAMES = ["Livia", "Hedda", "Alfie", "Atalanti", "Serena", "Velma", "Jerry", "Scooby"]
+LAST_NAMES = ["Atalanti", "Alfie", "Williams", "Dinkley", "Mouse", "Doo", "Pendragon"]
+
+
+def allocated_by(build):
+    """
+    Returns (result, bytes still allocated) for calling build().
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return result, size
+
+
+def time_lookups(lookup, user_ids):
+    """
+    Returns the mean seconds per lookup(user_id).
+    """
+    start = time.perf_counter()
+    for user_id in user_ids:
+        lookup(user_id)
+    return (time.perf_counter() - start) / len(user_ids)
+
+
+def main():
+    """
+    Seeds the scratch database, then measures both access paths.
+    """
+    parser = argparse.ArgumentParser(description="UserDirectory vs search_user.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    client = MongoClient(host=args.host, port=args.port)
+    client.drop_database("BenchDirectory")
+    user_collection = UserCollection(client.BenchDirectory)
+    rng = random.Random(42)
+    rows = []
+    for n in range(args.users):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        rows.append((f'{first}.{last}{n}', first, last, f'{first}.{last}{n}@example.com'))
+    for start in range(0, len(rows), 10000):
+        user_collection.add_users(rows[start:start + 10000])
+
+    dicts, dict_bytes = allocated_by(
+        lambda: {user["_id"]: user for user in user_collection.database.find()})
+    directory = UserDirectory(user_collection)
+    _, directory_bytes = allocated_by(directory.refresh)
+    print(f'{len(directory)} users')
+    print(f'memory per user: pymongo dicts {dict_bytes / len(dicts):.0f} B, '
+          f'UserDirectory {directory_bytes / len(directory):.0f} B')
+    del dicts
+
+    sample = [rng.choice(rows)[0] for _ in range(args.lookups)]
+    directory_seconds = time_lookups(directory.lookup, sample)
+    search_seconds = time_lookups(lambda user_id: list(user_collection.search_user(user_id)),
+                                  sample[:min(len(sample), 2000)])
+    print(f'lookup: UserDirectory {directory_seconds * 1e6:.2f} us, '
+          f'search_user {search_seconds * 1e6:.0f} us '
+          f'({search_seconds / directory_seconds:.0f}x)')
+
+    client.drop_database("BenchDirectory")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
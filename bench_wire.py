@@ -0,0 +1,111 @@
+"""
+Measures the bytes sent to and received from MongoDB per operation, with
+and without field projections. Needs a running mongod (mongo_config_dev.yml):
+
+    python bench_wire.py --users 1000 --statuses-per-user 100
+
+Writes to a scratch BenchWire database which is dropped at the end.
+"""
+import argparse
+
+import bson
+from pymongo import MongoClient, monitoring
+
+from user_status import StatusCollection
+from users import UserCollection
+
+
+class WireCounter(monitoring.CommandListener):
+    """
+    Adds up the BSON size of every command sent and every reply received.
+    """
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.commands = 0
+
+    def reset(self):
+        """
+        Zeroes the counters.
+        """
+        self.sent = self.received = self.commands = 0
+
+    def started(self, event):
+        self.sent += len(bson.encode(event.command))
+        self.commands += 1
+
+    def succeeded(self, event):
+        self.received += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+def measure(counter, name, operation, user_ids):
+    """
+    Runs operation(user_id) for every user id and prints the average
+    bytes and round trips per call.
+    """
+    counter.reset()
+    for user_id in user_ids:
+        operation(user_id)
+    calls = len(user_ids)
+    print(f'{name:<48}{counter.sent / calls:>10.0f}{counter.received / calls:>12.0f}'
+          f'{counter.commands / calls:>10.1f}')
+
+
+def main():
+    """
+    Seeds the scratch database and compares full documents with projections.
+    """
+    parser = argparse.ArgumentParser(description="Bytes on the wire per operation.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--statuses-per-user", type=int, default=100)
+    args = parser.parse_args()
+
+    counter = WireCounter()
+    client = MongoClient(host=args.host, port=args.port, event_listeners=[counter])
+    client.drop_database("BenchWire")
+    database = client.BenchWire
+    user_collection = UserCollection(database)
+    status_collection = StatusCollection(database)
+    user_ids = [f'wire_user_{n}' for n in range(args.users)]
+    user_collection.add_users([(user_id, "Wire", "Benchmark", f'{user_id}@example.com')
+                               for user_id in user_ids])
+    for user_id in user_ids:
+        status_collection.add_statuses(
+            [(f'{user_id}_{m}', user_id, "picayune island melt combative locket")
+             for m in range(args.statuses_per_user)])
+    raw_users = database["users"]
+    raw_status = database["status"]
+
+    print(f'{"operation":<48}{"sent B":>10}{"received B":>12}{"cmds":>10}')
+    measure(counter, "user check, count_documents (before)",
+            lambda user_id: raw_users.count_documents({"_id": user_id}), user_ids)
+    measure(counter, "user check, find_one whole document",
+            lambda user_id: raw_users.find_one({"_id": user_id}), user_ids)
+    measure(counter, "user check, user_exists _id only (after)",
+            user_collection.user_exists, user_ids)
+    measure(counter, "search_user, whole document (before)",
+            lambda user_id: list(user_collection.search_user(user_id)), user_ids)
+    measure(counter, "search_user, EMAIL only (after)",
+            lambda user_id: list(user_collection.search_user(user_id, {"EMAIL": 1})),
+            user_ids)
+    measure(counter, "statuses of a user, whole documents (before)",
+            lambda user_id: list(status_collection.search_status_by_id(user_id)), user_ids)
+    measure(counter, "statuses of a user, _id only (after)",
+            lambda user_id: list(status_collection.search_status_by_id(user_id, {"_id": 1})),
+            user_ids)
+    measure(counter, "status check, count_documents (before)",
+            lambda user_id: raw_status.count_documents({"_id": f'{user_id}_0'}), user_ids)
+    measure(counter, "status check, status_exists _id only (after)",
+            lambda user_id: status_collection.status_exists(f'{user_id}_0'), user_ids)
+
+    client.drop_database("BenchWire")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Bulk write helpers shared by the collection classes and the importers
+"""
+from pymongo.errors import BulkWriteError
+
+# Server error codes of writes that fail on their own row: a duplicate _id,
+# or a document rejected by the collection's $jsonSchema.
+DUPLICATE_KEY = 11000
+DOCUMENT_VALIDATION_FAILURE = 121
+ROW_ERRORS = (DUPLICATE_KEY, DOCUMENT_VALIDATION_FAILURE)
+
+
+def row_errors(error):
+    """
+    Returns {operation index: error code} for the rows of an unordered bulk
+    write that failed on their own. Re-raises error if any row failed for
+    another reason.
+    """
+    failed = {}
+    for write_error in error.details["writeErrors"]:
+        if write_error["code"] not in ROW_ERRORS:
+            raise error
+        failed[write_error["index"]] = write_error["code"]
+    return failed
+
+
+def insert_many_errors(collection, documents):
+    """
+    Runs an unordered insert_many of documents and returns one error code
+    per document: None for those inserted, else the server's code,
+    DUPLICATE_KEY or DOCUMENT_VALIDATION_FAILURE.
+    """
+    codes = [None] * len(documents)
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as error:
+        for index, code in row_errors(error).items():
+            codes[index] = code
+    return codes
+
+
+def insert_many_results(collection, documents):
+    """
+    Runs an unordered insert_many of documents and returns a list of booleans,
+    one per document: False for those rejected as duplicates or by the
+    collection's schema.
+    """
+    return [code is None for code in insert_many_errors(collection, documents)]
@@ -0,0 +1,357 @@
+"""
+Publishes insert/update/delete events from the users and status collections
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+from loguru import logger
+
+
+class WatchedCollection:
+    """
+    What a ChangeFeed keeps for one collection: its subscribers, the
+    MODIFIED_AT watermark, the writes published within LOOKBACK of it (in
+    publish order, so a poll doesn't publish them twice) and, while polling,
+    the ids known to exist and the ids seen by the last delete sweep.
+    """
+    def __init__(self, watermark):
+        self.subscribers = []
+        self.watermark = watermark
+        self.published = {}
+        self.known = None
+        self.swept = None
+
+    def remember(self, _id, modified_at):
+        """
+        Records that the write of _id stamped modified_at was published. The
+        entry moves to the end, so published stays in publish order.
+        """
+        self.published.pop(_id, None)
+        self.published[_id] = modified_at
+
+    def forget_published(self, horizon):
+        """
+        Drops the published writes stamped at or before horizon. They are in
+        publish order, so this stops at the first recent one and costs O(1)
+        per write over time.
+        """
+        while self.published:
+            oldest = next(iter(self.published))
+            if self.published[oldest] > horizon:
+                return
+            del self.published[oldest]
+
+
+class PollSchedule:
+    """
+    When a ChangeFeed reads again: every poll_interval seconds (also the
+    pause before resuming a change stream), and a hard delete sweep every
+    sweep_interval seconds of clock (None turns sweeps off).
+    """
+    def __init__(self, poll_interval, sweep_interval, clock):
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.next_sweep = None
+
+    def wait(self, stop):
+        """
+        Waits poll_interval seconds or until the stop event is set. Returns
+        True if it was set.
+        """
+        return stop.wait(self.poll_interval)
+
+    def sweep_due(self):
+        """
+        Returns True, and schedules the next sweep, if a sweep is due now.
+        """
+        if self.sweep_interval is None:
+            return False
+        now = self.clock()
+        if self.next_sweep is not None and now < self.next_sweep:
+            return False
+        self.next_sweep = now + self.sweep_interval
+        return True
+
+
+class ChangeFeed:
+    """
+    Listens for writes to the users and status collections and hands every
+    change to the subscribers registered for that collection. In-process caches,
+    counters and search indexes subscribe here instead of re-querying, so they
+    stay fresh when another process writes through main.py.
+
+    A change stream needs a replica set. On a standalone local mongod (our
+    mongo_config_dev.yml) the feed falls back to polling: every poll_interval
+    seconds it reads the documents whose MODIFIED_AT (stamped by every write
+    through UserCollection, StatusCollection and delta_import) is past a
+    per-collection watermark, from the MODIFIED_AT index, and tells inserts
+    from updates by whether it already knew the _id. Hard deletes leave
+    nothing to read, so every sweep_interval seconds the feed compares the
+    ids in the _id index with the previous sweep (None turns that off). The
+    feed also falls back, from the last event's time, when a change stream
+    can't be resumed, so the events in between are not lost.
+
+    Every event is a dict:
+    {"collection": "status", "operation": "insert", "_id": ..., "document": {...}}
+    "document" is None for deletes.
+    """
+    # Polls re-read this far behind the watermark, so a write stamped by a
+    # process whose clock lags a little is still seen; what was already
+    # published is skipped.
+    LOOKBACK = timedelta(seconds=2)
+
+    # Change stream errors a resume token can't recover from.
+    NON_RESUMABLE = (280, 286)  # ChangeStreamFatalError, ChangeStreamHistoryLost
+
+    def __init__(self, database, collections=("users", "status"), poll_interval=1.0,
+                 sweep_interval=60.0, clock=time.monotonic):
+        self.database = database
+        started_at = utc(datetime.now(timezone.utc))
+        self.watched = {name: WatchedCollection(started_at) for name in collections}
+        self.schedule = PollSchedule(poll_interval, sweep_interval, clock)
+        self.resume_token = None
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def collections(self):
+        """
+        The names of the collections this feed watches.
+        """
+        return tuple(self.watched)
+
+    def subscribe(self, callback, collection=None):
+        """
+        Registers callback to receive events. If collection is None, the
+        callback receives the events of every collection this feed watches.
+        """
+        names = self.collections if collection is None else (collection,)
+        for name in names:
+            self.watched[name].subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Removes callback from every collection it was subscribed to.
+        """
+        for watched in self.watched.values():
+            if callback in watched.subscribers:
+                watched.subscribers.remove(callback)
+
+    def publish(self, event):
+        """
+        Sends one event to the subscribers of its collection. A subscriber that
+        raises is logged and skipped so it can't starve the others.
+        """
+        watched = self.watched.get(event["collection"])
+        for callback in list(watched.subscribers if watched is not None else ()):
+            try:
+                callback(event)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f'Change feed subscriber {callback!r} failed')
+
+    def start(self):
+        """
+        Starts listening in a background daemon thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Asks the listener thread to stop and waits for it.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """
+        Tails the change stream, or polls from the watermark if the server
+        doesn't support one or the stream can't be resumed. Blocks until
+        stop() is called.
+        """
+        try:
+            self.watch()
+        except OperationFailure as error:
+            logger.info(f'Change streams unavailable ({error}); polling instead')
+            self.poll()
+
+    def watch(self):
+        """
+        Publishes events from a database-level change stream filtered to our
+        collections. Resumes from the last token seen after a network error,
+        or after a server error once events have been received. An error the
+        token can't recover from, or one opening the stream, is raised.
+        """
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.collections)}}}]
+        self.mode = "change_stream"
+        while not self._stop.is_set():
+            try:
+                with self.database.watch(pipeline, full_document="updateLookup",
+                                         resume_after=self.resume_token,
+                                         max_await_time_ms=500) as stream:
+                    while stream.alive and not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        self.resume_token = stream.resume_token
+                        event = self.to_event(change)
+                        if event is not None:
+                            self.advance(event, change.get("clusterTime"))
+                            self.publish(event)
+            except OperationFailure as error:
+                if self.resume_token is None or error.code in self.NON_RESUMABLE:
+                    raise
+                logger.warning(f'Change stream failed, resuming: {error}')
+                self.schedule.wait(self._stop)
+            except PyMongoError as error:
+                logger.warning(f'Change stream interrupted, resuming: {error}')
+                self.schedule.wait(self._stop)
+
+    def advance(self, event, cluster_time):
+        """
+        Moves the watermark of the event's collection to cluster_time, so a
+        fallback to polling starts from the last event, and remembers the
+        write so that polling doesn't publish it again. Writes that fall
+        behind the watermark's LOOKBACK are forgotten as it moves, so a
+        long-running stream keeps only the last few seconds of them.
+        """
+        watched = self.watched[event["collection"]]
+        if cluster_time is not None:
+            watched.watermark = utc(cluster_time.as_datetime())
+        document = event["document"]
+        if document is not None and "MODIFIED_AT" in document:
+            watched.remember(event["_id"], utc(document["MODIFIED_AT"]))
+        watched.forget_published(watched.watermark - self.LOOKBACK)
+        if watched.known is not None:
+            if event["operation"] == "delete":
+                watched.known.discard(event["_id"])
+            else:
+                watched.known.add(event["_id"])
+
+    @staticmethod
+    def to_event(change):
+        """
+        Converts a raw change stream document into our event format.
+        Returns None for operations we don't publish (drop, rename...).
+        """
+        operation = change["operationType"]
+        if operation not in ("insert", "update", "replace", "delete"):
+            return None
+        return {
+            "collection": change["ns"]["coll"],
+            "operation": "update" if operation == "replace" else operation,
+            "_id": change["documentKey"]["_id"],
+            "document": change.get("fullDocument"),
+        }
+
+    def poll(self):
+        """
+        Polling fallback for standalone servers. Catches up from the
+        watermarks straight away, then polls every poll_interval seconds.
+        """
+        self.mode = "polling"
+        for name in self.collections:
+            try:
+                self.database[name].create_index("MODIFIED_AT")
+            except PyMongoError as error:
+                logger.warning(f'Change feed could not index {name}.MODIFIED_AT: {error}')
+        while True:
+            try:
+                self.poll_once()
+            except PyMongoError as error:
+                logger.warning(f'Change feed poll failed: {error}')
+            if self.schedule.wait(self._stop):
+                return
+
+    def poll_once(self):
+        """
+        Publishes the writes since the last poll, and the hard deletes when a
+        sweep is due. Returns the number of events.
+        """
+        published = sum(self.poll_changes(name) for name in self.collections)
+        if self.schedule.sweep_due():
+            published += sum(self.sweep_deletes(name) for name in self.collections)
+        return published
+
+    def poll_changes(self, name):
+        """
+        Publishes the documents of collection name written since its
+        watermark, oldest first: an insert if the _id is new to the feed,
+        else an update. CREATED_AT can be backdated, so it can't tell them apart.
+
+        The first poll records the ids that exist (from the _id index) and,
+        for the catch-up writes it reads itself, falls back to treating a
+        write as the insert when MODIFIED_AT equals CREATED_AT.
+        """
+        watched = self.watched[name]
+        watermark = watched.watermark
+        known = watched.known
+        if known is None:
+            watched.known = self.existing_ids(name)
+        cursor = self.database[name].find(
+            {"MODIFIED_AT": {"$gt": watermark - self.LOOKBACK}}).sort("MODIFIED_AT", ASCENDING)
+        count = 0
+        for document in cursor:
+            modified_at = utc(document["MODIFIED_AT"])
+            if watched.published.get(document["_id"]) == modified_at:
+                continue
+            watched.remember(document["_id"], modified_at)
+            if known is None:
+                created_at = document.get("CREATED_AT")
+                operation = "insert" if created_at is not None and \
+                    utc(created_at) == modified_at else "update"
+            else:
+                operation = "update" if document["_id"] in known else "insert"
+            watched.known.add(document["_id"])
+            self.publish({"collection": name, "operation": operation,
+                          "_id": document["_id"], "document": document})
+            watermark = max(watermark, modified_at)
+            count += 1
+        watched.watermark = watermark
+        watched.forget_published(watermark - self.LOOKBACK)
+        return count
+
+    def sweep_deletes(self, name):
+        """
+        Publishes a delete for every id of collection name gone since the
+        previous sweep. Reads the _id index only; the first sweep just
+        records the ids.
+        """
+        watched = self.watched[name]
+        ids = self.existing_ids(name)
+        previous, watched.swept = watched.swept, ids
+        if previous is None:
+            return 0
+        if watched.known is not None:
+            watched.known.difference_update(previous - ids)
+        for _id in previous - ids:
+            self.publish({"collection": name, "operation": "delete",
+                          "_id": _id, "document": None})
+        return len(previous - ids)
+
+    def existing_ids(self, name):
+        """
+        Returns the set of ids in collection name, read from the _id index only.
+        """
+        return {document["_id"] for document in
+                self.database[name].find({}, {"_id": 1}, hint=[("_id", ASCENDING)])}
+
+
+def utc(moment):
+    """
+    Returns moment as a naive UTC datetime, the way pymongo returns dates,
+    so stamps read back and computed ones compare.
+    """
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
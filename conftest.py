@@ -0,0 +1,92 @@
+"""
+pytest hooks: skips the tests marked mongo when no mongod answers, drops
+this worker's test database at the end of the session and reports the time
+spent in each test module. Run the suite on every core with pytest-xdist:
+
+    pytest -n auto
+"""
+from collections import defaultdict
+
+import pymongo
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from socialnetwork_model import MONGO_URI
+from test_model import TEST_DATABASE_NAME, mongo
+
+# How long to wait for a mongod before skipping the mongo tests, instead of
+# letting each of them block for the client's 30s server selection.
+PING_TIMEOUT_MS = 2000
+
+
+def pytest_configure(config):
+    """
+    Registers the mongo marker.
+    """
+    config.addinivalue_line("markers", "mongo: needs a running mongod, skipped without one")
+
+
+def mongo_reachable():
+    """
+    Pings the server once, giving up after PING_TIMEOUT_MS.
+    """
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=PING_TIMEOUT_MS)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+def pytest_collection_modifyitems(items):
+    """
+    Skips the tests marked mongo if no mongod answers the ping.
+    """
+    needs_mongo = [item for item in items if item.get_closest_marker("mongo")]
+    if not needs_mongo or mongo_reachable():
+        return
+    skip = pytest.mark.skip(reason=f'no mongod answered within {PING_TIMEOUT_MS} ms')
+    for item in needs_mongo:
+        item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def drop_test_database():
+    """
+    Drops the worker's uniquely named TestDatabase after its last test.
+    """
+    yield
+    # Never reached a mongod: only the mock-based modules ran, nothing to drop.
+    if not mongo.topology_description.has_known_servers:
+        return
+    try:
+        with pymongo.timeout(5):
+            mongo.drop_database(TEST_DATABASE_NAME)
+    except PyMongoError as error:
+        print(f'Could not drop {TEST_DATABASE_NAME}: {error}')
+
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    Prints the setup + call + teardown time of every test module, slowest
+    first. Under xdist the workers' reports are summed on the controller,
+    so this is CPU time across workers, not wall time.
+    """
+    durations = defaultdict(float)
+    tests = defaultdict(int)
+    for reports in terminalreporter.stats.values():
+        for report in reports:
+            if not isinstance(report, pytest.TestReport):
+                continue
+            module = report.nodeid.split("::")[0]
+            durations[module] += report.duration
+            if report.when == "call":
+                tests[module] += 1
+    if not durations:
+        return
+    terminalreporter.write_sep("=", "time per test module")
+    for module, seconds in sorted(durations.items(), key=lambda item: -item[1]):
+        terminalreporter.write_line(f'{seconds:9.2f}s {tests[module]:5d} tests  {module}')
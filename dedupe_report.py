@@ -0,0 +1,134 @@
+"""
+Storage and working-set savings of content-addressed status texts
+(status_blobs.StatusBlobCollection) on a status CSV:
+
+    python dedupe_report.py status_updates.csv --min-length 0 32 64
+
+For each min_length it prints the BSON bytes of the status documents plus
+their blobs, compared with storing every text inline. BSON bytes are what
+the documents take uncompressed in the WiredTiger cache, i.e. the working
+set of a full scan. With --mongo the statuses are also loaded both ways into
+a scratch DedupeReport database and the on-disk (compressed) sizes from
+collStats are printed; the database is dropped at the end.
+"""
+import argparse
+import csv
+import sys
+from datetime import datetime, timezone
+
+import bson
+from pymongo import MongoClient
+
+from status_blobs import StatusBlobCollection, text_ref
+from user_status import StatusCollection
+
+
+def read_rows(path):
+    """
+    Returns the (status_id, user_id, status_text) rows of a status CSV.
+    """
+    with open(path, 'r', encoding="utf-8", newline="") as file:
+        return [(row["STATUS_ID"], row["USER_ID"], row["STATUS_TEXT"])
+                for row in csv.DictReader(file)]
+
+
+def bson_sizes(rows, min_length=None):
+    """
+    Returns (status bytes, blob bytes) for rows stored inline
+    (min_length None) or with texts of min_length bytes or more in blobs.
+    """
+    created_at = datetime.now(timezone.utc)
+    status_bytes = blob_bytes = 0
+    blobs = set()
+    for status_id, user_id, status_text in rows:
+        document = {"_id": status_id, "USER_ID": user_id, "CREATED_AT": created_at}
+        if min_length is None or len(status_text.encode("utf-8")) < min_length:
+            document["STATUS_TEXT"] = status_text
+        else:
+            ref = text_ref(status_text)
+            document["STATUS_TEXT_REF"] = ref
+            if ref not in blobs:
+                blobs.add(ref)
+                blob_bytes += len(bson.encode({"_id": ref, "STATUS_TEXT": status_text}))
+        status_bytes += len(bson.encode(document))
+    return status_bytes, blob_bytes
+
+
+def print_offline(rows, min_lengths):
+    """
+    Prints the BSON sizes inline and for each min_length.
+    """
+    texts = [status_text for _, _, status_text in rows]
+    distinct = len(set(texts))
+    print(f'{len(rows)} statuses, {distinct} distinct texts '
+          f'({100 * (1 - distinct / max(len(rows), 1)):.1f}% repeats)')
+    inline, _ = bson_sizes(rows)
+    print(f'{"layout":<24}{"status MB":>11}{"blob MB":>10}{"total MB":>10}{"saved":>8}')
+    print(f'{"inline":<24}{inline / 1e6:>11.2f}{0:>10.2f}{inline / 1e6:>10.2f}{"":>8}')
+    for min_length in min_lengths:
+        statuses, blobs = bson_sizes(rows, min_length)
+        total = statuses + blobs
+        print(f'{f"blobs, min_length={min_length}":<24}{statuses / 1e6:>11.2f}'
+              f'{blobs / 1e6:>10.2f}{total / 1e6:>10.2f}'
+              f'{100 * (1 - total / max(inline, 1)):>7.1f}%')
+
+
+def storage_size(database, names):
+    """
+    Returns the summed collStats storageSize (on disk, compressed) of names.
+    """
+    return sum(database.command("collStats", name)["storageSize"] for name in names)
+
+
+def print_mongo(rows, min_lengths, client, chunk_size=5000):
+    """
+    Loads rows inline and with blobs into a scratch database and prints the
+    on-disk sizes.
+    """
+    client.drop_database("DedupeReport")
+    database = client.DedupeReport
+    try:
+        layouts = [("inline", None)] + [(f'blobs, min_length={n}', n) for n in min_lengths]
+        print(f'{"layout":<24}{"on disk MB":>11}')
+        for number, (name, min_length) in enumerate(layouts):
+            collection_name = f'status_{number}'
+            blobs = None
+            if min_length is not None:
+                blobs = StatusBlobCollection(database, min_length,
+                                             collection_name=f'{collection_name}_blobs')
+            status_collection = StatusCollection(database, collection_name=collection_name,
+                                                 blobs=blobs)
+            for start in range(0, len(rows), chunk_size):
+                status_collection.add_statuses(rows[start:start + chunk_size])
+            names = [collection_name] + ([blobs.database.name] if blobs else [])
+            database.command("fsync")
+            print(f'{name:<24}{storage_size(database, names) / 1e6:>11.2f}')
+    finally:
+        client.drop_database("DedupeReport")
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Savings of deduplicated status texts.")
+    parser.add_argument("status_file")
+    parser.add_argument("--min-length", type=int, nargs="+", default=[0, 32, 64])
+    parser.add_argument("--mongo", action="store_true",
+                        help="also load into MongoDB and compare on-disk sizes")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    args = parser.parse_args()
+
+    try:
+        rows = read_rows(args.status_file)
+    except FileNotFoundError as error:
+        print(f'File not found: {error.filename}', file=sys.stderr)
+        return
+    print_offline(rows, args.min_length)
+    if args.mongo:
+        print_mongo(rows, args.min_length, MongoClient(host=args.host, port=args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Incremental import of the nightly accounts/status CSV exports.
+
+Every imported document carries a ROW_HASH of its fields. A sync hashes each
+CSV row, compares the hashes with the ones already imported, and sends only
+the difference as unordered bulk writes: InsertOne for new rows, UpdateOne
+for changed rows and DeleteOne for rows gone from the export. A nightly
+export with 1% churn therefore writes 1% of the rows:
+
+    python delta_import.py accounts.csv status_updates.csv --manifest-dir .sync
+
+The imported hashes are read from the database (one _id/ROW_HASH projection
+scan) or, with --manifest-dir, from a JSON manifest written after the last
+sync, checked against the _id index only. Documents without a ROW_HASH
+(added through the app rather than imported) are never updated or deleted,
+and only writes the server applied are counted or recorded.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from csv import DictReader
+from datetime import datetime, timezone
+
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import log_config
+import main
+from socialnetwork_model import tenant_from_env
+from bulk_writes import row_errors
+
+# CSV column -> document field, _id first.
+USER_FIELDS = (("USER_ID", "_id"), ("NAME", "NAME"), ("LASTNAME", "LASTNAME"),
+               ("EMAIL", "EMAIL"))
+STATUS_FIELDS = (("STATUS_ID", "_id"), ("USER_ID", "USER_ID"), ("STATUS_TEXT", "STATUS_TEXT"))
+
+
+def row_hash(values):
+    """
+    Returns the 16-byte BLAKE2b hash of a row's values, in field order.
+    """
+    return hashlib.blake2b(json.dumps(values).encode("utf-8"), digest_size=16).digest()
+
+
+def read_documents(path, fields):
+    """
+    Reads a CSV export into {_id: (document fields without _id, ROW_HASH)}.
+    A repeated _id keeps its last row, like a re-export would. Raises
+    ValueError if the header lacks any of the columns.
+    """
+    documents = {}
+    with open(path, 'r', encoding="utf-8", newline="") as file:
+        reader = DictReader(file)
+        header = reader.fieldnames or []
+        missing = [column for column, _ in fields if column not in header]
+        if missing:
+            raise ValueError(f'Missing column in {path}: {", ".join(missing)}')
+        for row in reader:
+            values = [row[column] for column, _ in fields]
+            document = {field: value for (_, field), value in zip(fields[1:], values[1:])}
+            documents[values[0]] = (document, row_hash(values))
+    return documents
+
+
+class DeltaResult:
+    """
+    Counts what one sync did.
+    """
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.rejected = 0
+        self.missing = 0
+
+    def writes(self):
+        """
+        Returns how many documents were written.
+        """
+        return self.inserted + self.updated + self.deleted
+
+    def __str__(self):
+        return (f'{self.inserted} inserted, {self.updated} updated, {self.deleted} deleted, '
+                f'{self.unchanged} unchanged, {self.rejected} rejected, '
+                f'{self.missing} missing')
+
+
+def synced_hashes(documents, imported, applied, missing):
+    """
+    Returns the {_id: ROW_HASH} manifest after a sync. Only writes that took
+    effect (applied) move a hash forward; a rejected update keeps the old
+    one, and a document that has gone (missing) is left out so the next
+    sync inserts it again.
+    """
+    hashes = {key: digest for key, digest in imported.items() if key not in missing}
+    for key in applied:
+        if key in documents:
+            hashes[key] = documents[key][1]
+        else:
+            hashes.pop(key, None)
+    return hashes
+
+
+class DeltaImporter:
+    """
+    Syncs one collection with a CSV export. collection is the pymongo
+    collection (UserCollection.database or StatusCollection.database).
+    prepare(documents) turns a batch of CSV documents into the fields to
+    write; optional_fields missing from an update are unset. Every write is
+    stamped with MODIFIED_AT, and inserts with CREATED_AT, like the
+    collection classes do.
+    on_written(inserted, updated, deleted) is called after each batch with
+    the affected {_id: document} dicts and id list, so side indexes (the
+    status tags) can follow. prepare, on_written and optional_fields are
+    the HOOKS, passed by keyword.
+    """
+    HOOKS = ("prepare", "on_written", "optional_fields")
+
+    def __init__(self, collection, fields, batch_size=1000, manifest_path=None, **hooks):
+        unknown = set(hooks) - set(self.HOOKS)
+        if unknown:
+            raise TypeError(f'Unknown DeltaImporter hooks: {", ".join(sorted(unknown))}')
+        self.collection = collection
+        self.fields = fields
+        self.batch_size = batch_size
+        self.manifest_path = manifest_path
+        self.prepare = hooks.get("prepare")
+        self.on_written = hooks.get("on_written")
+        self.optional_fields = hooks.get("optional_fields", ())
+
+    def imported_hashes(self):
+        """
+        Returns {_id: ROW_HASH} of the previously imported documents, from
+        the manifest if there is one, else from the collection. Manifest
+        entries whose document has been removed since (through the app, the
+        purge worker) are dropped, so those rows are imported again; that
+        check only reads the _id index, not the documents.
+        """
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding="utf-8") as file:
+                manifest = json.load(file)
+            existing = {document["_id"] for document in self.collection.find(
+                {}, {"_id": 1}, hint=[("_id", 1)])}
+            return {key: bytes.fromhex(value) for key, value in manifest.items()
+                    if key in existing}
+        return {document["_id"]: document["ROW_HASH"] for document in self.collection.find(
+            {"ROW_HASH": {"$exists": True}}, {"ROW_HASH": 1})}
+
+    def save_manifest(self, hashes):
+        """
+        Writes the manifest atomically: a crash mid-write leaves the old one.
+        """
+        temporary = f'{self.manifest_path}.tmp'
+        with open(temporary, 'w', encoding="utf-8") as file:
+            json.dump({key: value.hex() for key, value in hashes.items()}, file)
+        os.replace(temporary, self.manifest_path)
+
+    def plan(self, documents, imported):
+        """
+        Returns (inserts, updates, delete ids): the {_id: document} rows
+        that are new or changed, and the imported ids no longer exported.
+        """
+        inserts, updates = {}, {}
+        for key, (document, digest) in documents.items():
+            previous = imported.get(key)
+            if previous is None:
+                inserts[key] = (document, digest)
+            elif previous != digest:
+                updates[key] = (document, digest)
+        deletes = [key for key in imported if key not in documents]
+        return inserts, updates, deletes
+
+    def operations(self, inserts, updates, deletes):
+        """
+        Yields batches of (operation, kind, _id, document, ROW_HASH) for the
+        plan, each batch holding one kind of operation.
+        prepare is called once per batch, so it can batch its own writes.
+        """
+        created_at = datetime.now(timezone.utc)
+        for kind, planned in (("insert", list(inserts.items())), ("update", list(updates.items()))):
+            for first in range(0, len(planned), self.batch_size):
+                chunk = planned[first:first + self.batch_size]
+                documents = [document for _, (document, _) in chunk]
+                fields = self.prepare(documents) if self.prepare else documents
+                yield [(self.operation(kind, key, values, digest, created_at), kind, key,
+                        document, digest)
+                       for (key, (document, digest)), values in zip(chunk, fields)]
+        for first in range(0, len(deletes), self.batch_size):
+            yield [(DeleteOne({"_id": key, "ROW_HASH": {"$exists": True}}), "delete", key, None,
+                    None) for key in deletes[first:first + self.batch_size]]
+
+    def operation(self, kind, key, values, digest, created_at):
+        """
+        Returns the InsertOne or UpdateOne writing values and digest to key.
+        An update only matches imported documents, and unsets the
+        optional_fields missing from values.
+        """
+        if kind == "insert":
+            return InsertOne({"_id": key, **values, "ROW_HASH": digest,
+                              "CREATED_AT": created_at, "MODIFIED_AT": created_at})
+        update = {"$set": {**values, "ROW_HASH": digest, "MODIFIED_AT": created_at}}
+        stale = {field: "" for field in self.optional_fields if field not in values}
+        if stale:
+            update["$unset"] = stale
+        return UpdateOne({"_id": key, "ROW_HASH": {"$exists": True}}, update)
+
+    def present(self, keys):
+        """
+        Returns which of keys are imported documents still in the collection.
+        """
+        return {document["_id"] for document in self.collection.find(
+            {"_id": {"$in": list(keys)}, "ROW_HASH": {"$exists": True}}, {"_id": 1})}
+
+    def write(self, batch, result):
+        """
+        Sends one batch as an unordered bulk write. Rows rejected by the
+        schema or racing an app write are counted, not raised. Returns the
+        server's counts (nInserted, nMatched, nRemoved) and the indexes of
+        the rejected operations.
+        """
+        rejected = set()
+        try:
+            counts = self.collection.bulk_write([entry[0] for entry in batch],
+                                                ordered=False).bulk_api_result
+        except BulkWriteError as error:
+            rejected.update(row_errors(error))
+            counts = error.details
+        result.rejected += len(rejected)
+        return counts, rejected
+
+    def sync(self, path, dry_run=False):
+        """
+        Brings the collection in line with the CSV export at path and
+        returns a DeltaResult. With dry_run nothing is written.
+        """
+        documents = read_documents(path, self.fields)
+        imported = self.imported_hashes()
+        inserts, updates, deletes = self.plan(documents, imported)
+        result = DeltaResult()
+        result.unchanged = len(documents) - len(inserts) - len(updates)
+        if dry_run:
+            result.inserted, result.updated, result.deleted = \
+                len(inserts), len(updates), len(deletes)
+            return result
+
+        applied, missing = set(), set()
+        for batch in self.operations(inserts, updates, deletes):
+            batch_applied, batch_missing = self.flush(batch, result)
+            applied.update(batch_applied)
+            missing.update(batch_missing)
+
+        if self.manifest_path:
+            self.save_manifest(synced_hashes(documents, imported, applied, missing))
+        return result
+
+    def flush(self, batch, result):
+        """
+        Writes a batch, counts what took effect and tells on_written about
+        it. Updates and deletes are only sent for imported documents that are
+        still there; an update matching nothing (the document went away
+        meanwhile) is not counted. Returns the ids written and the ids whose
+        document has gone.
+        """
+        if not batch:
+            return set(), set()
+        kind = batch[0][1]
+        missing = set()
+        if kind != "insert":
+            present = self.present(entry[2] for entry in batch)
+            missing = {entry[2] for entry in batch if entry[2] not in present}
+            batch = [entry for entry in batch if entry[2] in present]
+            if not batch:
+                result.missing += len(missing)
+                return set(), missing
+        counts, rejected = self.write(batch, result)
+        sent = [entry for index, entry in enumerate(batch) if index not in rejected]
+        if kind == "update" and counts["nMatched"] < len(sent):
+            current = {document["_id"]: document.get("ROW_HASH") for document in
+                       self.collection.find({"_id": {"$in": [entry[2] for entry in sent]}},
+                                            {"ROW_HASH": 1})}
+            missing.update(entry[2] for entry in sent if entry[2] not in current)
+            sent = [entry for entry in sent if current.get(entry[2]) == entry[4]]
+        result.missing += len(missing)
+
+        written = {"insert": {}, "update": {}, "delete": []}
+        for _, _, key, document, _ in sent:
+            if kind == "delete":
+                written["delete"].append(key)
+            else:
+                written[kind][key] = document
+        result.inserted += counts["nInserted"]
+        result.updated += len(written["update"])
+        result.deleted += counts["nRemoved"]
+        if self.on_written is not None:
+            self.on_written(written["insert"], written["update"], written["delete"])
+        return {entry[2] for entry in sent}, missing
+
+
+def user_importer(user_collection, status_collection=None, batch_size=1000,
+                  manifest_path=None):
+    """
+    Returns a DeltaImporter for the accounts export. Statuses of users gone
+    from the export are deleted with them when status_collection is given.
+    """
+    def on_written(_inserted, _updated, deleted):
+        for user_id in deleted:
+            status_collection.delete_statuses_by_user(user_id)
+
+    return DeltaImporter(user_collection.database, USER_FIELDS, batch_size, manifest_path,
+                         on_written=on_written if status_collection is not None else None)
+
+
+def status_importer(status_collection, batch_size=1000, manifest_path=None):
+    """
+    Returns a DeltaImporter for the status export. Texts follow the
+    collection's blob mode, and the tag index is kept in step.
+    """
+    def prepare(documents):
+        text_fields = status_collection.text_fields(
+            [document["STATUS_TEXT"] for document in documents])
+        return [{"USER_ID": document["USER_ID"], **fields}
+                for document, fields in zip(documents, text_fields)]
+
+    def on_written(inserted, updated, deleted):
+        tags = status_collection.tags
+        if tags is None:
+            return
+        tags.index_statuses([(key, document["USER_ID"], document["STATUS_TEXT"])
+                             for key, document in inserted.items()])
+        for key, document in updated.items():
+            tags.reindex_status(key, document["STATUS_TEXT"])
+        tags.remove_statuses(deleted)
+
+    optional_fields = ("STATUS_TEXT", "STATUS_TEXT_REF") if status_collection.blobs else ()
+    return DeltaImporter(status_collection.database, STATUS_FIELDS, batch_size,
+                         manifest_path, prepare=prepare, on_written=on_written,
+                         optional_fields=optional_fields)
+
+
+def main_cli():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Import only what changed in the CSV exports.")
+    parser.add_argument("user_file")
+    parser.add_argument("status_file", nargs="?")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--manifest-dir", help="keep row hashes here instead of reading them "
+                                               "back from the database")
+    parser.add_argument("--dry-run", action="store_true", help="only count the changes")
+    args = parser.parse_args()
+    log_config.configure()
+
+    def manifest(name):
+        if not args.manifest_dir:
+            return None
+        os.makedirs(args.manifest_dir, exist_ok=True)
+        return os.path.join(args.manifest_dir, f'{name}.json')
+
+    tenant = tenant_from_env()
+    user_collection = main.init_user_collection(tenant)
+    status_collection = main.init_status_collection(tenant=tenant,
+                                                    user_collection=user_collection)
+    jobs = [(args.user_file, user_importer(user_collection, status_collection,
+                                           args.batch_size, manifest("users")))]
+    if args.status_file:
+        jobs.append((args.status_file, status_importer(status_collection, args.batch_size,
+                                                       manifest("status"))))
+    for path, importer in jobs:
+        start = time.perf_counter()
+        try:
+            result = importer.sync(path, args.dry_run)
+        except FileNotFoundError as error:
+            print(f'File not found: {error.filename}', file=sys.stderr)
+            return
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return
+        print(f'{path}: {result} in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == "__main__":
+    main_cli()
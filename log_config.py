@@ -0,0 +1,77 @@
+"""
+Logging setup for the whole app. Modules only import loguru's logger; the
+entry points (menu.py, api_server.py, batch.py) call configure() once:
+
+- the file sink writes one JSON object per line (loguru's serialize=True),
+  with the operation name, ids and duration_ms under "extra";
+- both sinks are enqueued, so the file I/O happens on loguru's writer
+  thread instead of inline on every database call;
+- the per-operation DEBUG records from timed() are sampled, so a busy
+  process logs a steady fraction of them instead of all of them.
+"""
+import atexit
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+from loguru import logger
+
+LOG_FILE = 'loguru_file_{time:YYYY-MM-DD}.log'
+
+# Fraction of timed() operations logged at DEBUG. Failures are always logged.
+DEBUG_SAMPLE_RATE = float(os.environ.get("SOCIALNETWORK_LOG_SAMPLE", "0.01"))
+
+# Whether configure() has run, and the sample rate it set.
+_STATE = {"configured": False, "sample_rate": DEBUG_SAMPLE_RATE}
+
+
+def configure(level="DEBUG", stderr_level="WARNING", log_file=LOG_FILE, *,
+              sample_rate=None, force=False, **sink_options):
+    """
+    Replaces every sink with a JSON file sink at level and a plain stderr
+    sink at stderr_level. sample_rate overrides SOCIALNETWORK_LOG_SAMPLE.
+    sink_options are loguru options for the file sink, enqueue=True and
+    serialize=True unless given; enqueue applies to the stderr sink too.
+    Later calls are ignored unless force=True.
+    """
+    if _STATE["configured"] and not force:
+        return
+    _STATE["sample_rate"] = DEBUG_SAMPLE_RATE if sample_rate is None else sample_rate
+    sink_options = {"enqueue": True, "serialize": True, **sink_options}
+    logger.remove()
+    if log_file is not None:
+        logger.add(log_file, level=level, **sink_options)
+    logger.add(sys.stderr, level=stderr_level, enqueue=sink_options["enqueue"])
+    if not _STATE["configured"]:
+        # Flush the enqueued records before the interpreter goes away.
+        atexit.register(logger.remove)
+    _STATE["configured"] = True
+
+
+def disable():
+    """
+    Removes every sink, for benchmarks and quiet scripts.
+    """
+    logger.remove()
+    _STATE["configured"] = True
+
+
+@contextmanager
+def timed(operation, **ids):
+    """
+    Times the block and logs one structured record for it: DEBUG, sampled,
+    on success; INFO, always, with the error type if the block raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as error:
+        logger.bind(operation=operation, duration_ms=1000 * (time.perf_counter() - start),
+                    error=type(error).__name__, **ids).info(operation)
+        raise
+    sample_rate = _STATE["sample_rate"]
+    if sample_rate >= 1.0 or random.random() < sample_rate:
+        logger.bind(operation=operation, duration_ms=1000 * (time.perf_counter() - start),
+                    **ids).debug(operation)
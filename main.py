@@ -5,37 +5,138 @@ import sys
 from csv import DictReader
 
 from pymongo.errors import DuplicateKeyError, BulkWriteError
-from loguru import logger
 import users
 import user_status
-from socialnetwork_model import database, mongo
+from change_feed import ChangeFeed
+from user_directory import UserDirectory
+from status_tags import StatusTagCollection
+from status_blobs import StatusBlobCollection
+from trending import TrendingEngine
+from rate_limit import MongoTokenBucket, TokenBucket
+from purge import PurgeWorker
+from socialnetwork_model import (install_validator, search_read_preference, block_compressor,
+                                  router, DEFAULT_TENANT, USER_SCHEMA, STATUS_SCHEMA)
 
+# Statuses per getMore round trip when scanning all of a user's statuses.
+STREAM_BATCH_SIZE = 1000
 
-logger.remove()
-logger.add('loguru_file_{time:YYYY-MM-DD}.log', level='DEBUG')
-logger.add(sys.stderr, level='WARNING')
 
-logger.debug("This is a debug")
-logger.info("This is an info")
-logger.warning("This is a warning")
-logger.error("This is an error")
+def init_user_collection(tenant=DEFAULT_TENANT):
+    """
+    Creates and returns a new instance of UserCollection, and
+    binds it to the database of tenant (a socialnetwork_model.TenantContext,
+    by default the UserStatuses database). Installs the users $jsonSchema
+    validator first, creating the collection with the block compressor of
+    the compression profile (SOCIALNETWORK_COMPRESSION). Searches follow the
+    configured search read preference.
+    """
+    tenant_database = router.database(tenant)
+    install_validator(tenant_database, tenant.users_collection, USER_SCHEMA,
+                      block_compressor())
+    return users.UserCollection(tenant_database, read_preference=search_read_preference(),
+                                collection_name=tenant.users_collection)
+
+
+def init_status_collection(routed=False, tenant=DEFAULT_TENANT, dedupe=False,
+                           user_collection=None):
+    """
+    Creates and returns a new instance of StatusCollection in the database
+    of tenant. Pass routed=True when the status collection is sharded on
+    USER_ID. Installs the status $jsonSchema validator first (with the
+    profile's block compressor, like init_user_collection), attaches the
+    hashtag/mention index, and hides the statuses of soft-deleted users.
+    Pass the tenant's UserCollection as user_collection so a soft delete
+    made through it hides the statuses at once, not after its deleted_ttl.
+    Searches follow the configured search read preference. The tag index
+    lives in the tenant's status collection name + "_tags" (status_tags by
+    default), so tenants sharing a database keep separate indexes. With
+    dedupe=True each distinct status text is stored once, in the status
+    collection name + "_blobs" (status_blobs by default).
+    """
+    tenant_database = router.database(tenant)
+    install_validator(tenant_database, tenant.status_collection, STATUS_SCHEMA,
+                      block_compressor())
+    return user_status.StatusCollection(
+        tenant_database, routed=routed,
+        tags=StatusTagCollection(tenant_database,
+                                 collection_name=f'{tenant.status_collection}_tags'),
+        users=user_collection if user_collection is not None else
+        users.UserCollection(tenant_database, collection_name=tenant.users_collection),
+        read_preference=search_read_preference(), collection_name=tenant.status_collection,
+        blobs=StatusBlobCollection(tenant_database,
+                                   collection_name=f'{tenant.status_collection}_blobs')
+        if dedupe else None)
+
+
+def init_change_feed(tenant=DEFAULT_TENANT):
+    """
+    Creates and returns a ChangeFeed over the users and status collections
+    of tenant. Subscribe callbacks to it and call start() to begin listening.
+    """
+    return ChangeFeed(router.database(tenant),
+                      (tenant.users_collection, tenant.status_collection))
+
+
+def init_user_directory(user_collection, change_feed=None):
+    """
+    Loads the users table into an in-memory UserDirectory. If a change_feed
+    is given, the directory subscribes to it and stays up to date.
+    """
+    directory = UserDirectory(user_collection)
+    directory.refresh()
+    if change_feed is not None:
+        directory.attach(change_feed)
+    return directory
+
+
+def init_trending_engine(status_collection, window_seconds=3600, k=10, change_feed=None):
+    """
+    Creates a TrendingEngine that counts every status status_collection adds,
+    including the ones loaded from CSV. If a change_feed is given, the engine
+    follows the inserts of every process from it instead, reading deduped
+    texts back from the collection's blobs.
+    """
+    engine = TrendingEngine(window_seconds=window_seconds, k=k)
+    if change_feed is None:
+        status_collection.add_listener(engine.observe_status)
+    else:
+        engine.attach(change_feed, status_collection.database.name, status_collection.blobs)
+    return engine
 
 
+def show_trending(engine, k=None):
+    """
+    Prints the trending terms and hashtags of the current window.
+    """
+    trending = engine.top(k)
+    if not trending:
+        print('Nothing is trending yet.')
+    for rank, (term, count) in enumerate(trending, start=1):
+        print(f'{rank}. {term} ({count})')
+
 
-def init_user_collection():
+def init_rate_limiter(rate=1.0, capacity=10, shared=False, tenant=DEFAULT_TENANT):
     """
-    Creates and returns a new instance of UserCollection, and
-    binds it to the UserStatuses database I created in
-    socialnetwork_model.py
+    Creates a per-user rate limiter for add_status/update_status: each user
+    may burst capacity posts, refilled at rate posts per second. With
+    shared=True the buckets live in tenant's database and apply across app
+    processes.
     """
-    return users.UserCollection(database)
+    if shared:
+        return MongoTokenBucket(router.database(tenant), rate, capacity)
+    return TokenBucket(rate, capacity)
 
 
-def init_status_collection():
+def init_purge_worker(user_collection, status_collection, batch_size=500,
+                      batches_per_second=5.0):
     """
-    Creates and returns a new instance of StatusCollection
+    Creates and starts the background job that purges soft-deleted users
+    and their statuses in rate-limited batches.
     """
-    return user_status.StatusCollection(database)
+    worker = PurgeWorker(user_collection, status_collection, batch_size,
+                         batches_per_second)
+    worker.start()
+    return worker
 
 
 def add_user(user_id, first_name, last_name, email, user_collection):
@@ -46,13 +147,28 @@ def add_user(user_id, first_name, last_name, email, user_collection):
 
     Requirements:
     - user_id cannot already exist in the database.
-    - Returns False if there are any errors (for example, if
-      user_collection.add_user() returns False).
-    - Otherwise, it returns True.
+    - email must pass the users schema; user_collection.add_user() returns
+      None when it doesn't.
     """
-    if not user_collection.add_user(user_id, first_name, last_name, email):
+    added = user_collection.add_user(user_id, first_name, last_name, email)
+    if added is None:
+        print(f'{user_id} cannot be added: {email} is not a valid email address.')
+    elif not added:
         print(f'{user_id} already exists.')
-    print(f'{user_id} added.')
+    else:
+        print(f'{user_id} added.')
+
+
+def posting_allowed(user_id, rate_limiter):
+    """
+    Returns True if user_id may post under rate_limiter (always when it is
+    None). Otherwise tells the user they are posting too fast and returns
+    False, so the caller can reject the post before touching any table.
+    """
+    if rate_limiter is None or rate_limiter.allow(user_id):
+        return True
+    print(f'{user_id} is posting too fast, please try again later.')
+    return False
 
 
 def add_status(status_id, user_id, status_text, user_collection, status_collection):
@@ -63,31 +179,37 @@ def add_status(status_id, user_id, status_text, user_collection, status_collecti
 
     Requirements:
     - User_id must exist in the users table before we can add a status.
-    If our search_user returns None, the code skips insert_one and prints
+    If user_exists returns False, the code skips insert_one and prints
     a message to remind user to add a user before adding a status.
     - Next, it checks that the status_id is new. If the status_id already
     exists, it prints an error message.
     - Otherwise, it returns True and alerts the user that their status was added.
+    - To rate limit posts, call posting_allowed first: an over-limit status
+    is then rejected before the users or status tables are touched.
     """
-    result = user_collection.search_user(user_id)
-    # users.search_user returns None if the user_id can't be found.
-    if result is None:
+    # user_exists only reads the _id index, we don't need the user's fields.
+    # It always reads the primary: a lagging secondary could still show a
+    # user who was just deleted.
+    if not user_collection.user_exists(user_id):
         print(f'{user_id} does not exist! Please add a user first before adding a status')
     # if user_id exists, call user_status.add_status
     else:
-        status = status_collection.add_status(status_id, user_id, status_text)
-        # if status_id does not exist, user_status.add_status will write the new status to
-        # database and return True.
-        if status: # status should be True.
-            print(f'{status_id} added.')
-            # if status is False owing to duplicate key, print error message
+        try:
+            status = status_collection.add_status(status_id, user_id, status_text)
+        except ValueError:
+            # a routed status collection only takes status_ids that start with their user_id
+            print(f'{status_id} must start with {user_id}_ to be added for {user_id}.')
         else:
-            print(f'{status_id} already exists.')
-
+            # if status_id does not exist, user_status.add_status will write the new status to
+            # database and return True.
+            if status: # status should be True.
+                print(f'{status_id} added.')
+                # if status is False owing to duplicate key, print error message
+            else:
+                print(f'{status_id} already exists.')
 
 
-
-def delete_user(user_id, user_collection, status_collection):
+def delete_user(user_id, user_collection, status_collection, soft=False):
     """
     Delete a user in our status_collection by calling delete_user in users.py
     which does a delete_one in our users table.
@@ -105,9 +227,19 @@ def delete_user(user_id, user_collection, status_collection):
     once user is successfully deleted.
     - If the user_id exists, but no statuses are found in status
     collection, the code skips to delete_user.
+    - With soft=True the user is only marked deleted, in one write. The user
+    and their statuses disappear from searches straight away and the
+    PurgeWorker (see init_purge_worker) deletes them in the background.
     """
+    if soft:
+        if user_collection.soft_delete_user(user_id) is None:
+            print(f'{user_id} cannot be deleted because it does not exist.')
+        else:
+            print(f'{user_id} deleted. Their statuses will be removed shortly.')
+        return
     # if user is to be deleted, search for their statuses and delete them before
-    for status in status_collection.search_status_by_id(user_id):
+    for status in status_collection.search_status_by_id(user_id, {"_id": 1}, primary=True,
+                                                        batch_size=STREAM_BATCH_SIZE):
         if status:
             status_collection.delete_status(status["_id"])
             print(f'Since {user_id} no longer exists, we took care to delete '
@@ -121,18 +253,102 @@ def delete_user(user_id, user_collection, status_collection):
     else:
         print(f'{user_id} deleted.')
 
-def search_status_by_id(user_id, status_collection):
+def search_status_by_id(user_id, status_collection, out=None):
     """
     This method allows us to query all statuses published by user_id
-    and is called by main.delete_user to make sure we can delete the
-    statuses associated by a user account when we delete the user.
+    and writes them to out (stdout by default) with stream_statuses.
+    Returns how many statuses were written.
+    """
+    written = stream_statuses(user_id, status_collection, out)
+    if not written:
+        print(f'{user_id} has not published any statuses.')
+    return written
+
+
+def format_statuses(statuses, chunk_size=500):
+    """
+    Generator turning an iterable of statuses into text chunks of up to
+    chunk_size lines, formatted like print_status.
+    """
+    lines = []
+    for status in statuses:
+        lines.append(f'#{status["_id"]}: {status["USER_ID"]} wrote "{status["STATUS_TEXT"]}"\n')
+        if len(lines) == chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def write_statuses(statuses, out=None, chunk_size=500):
+    """
+    Writes an iterable of statuses to out (stdout by default) in chunks of
+    chunk_size lines from format_statuses. Returns how many were written.
+    """
+    out = sys.stdout if out is None else out
+    written = 0
 
-    Since the corresponding user_status.search_status_by_id function
-    returns an iterable status object, we can use a for loop to iterate
-    through each status it finds to delete them one by one.
+    def counted():
+        nonlocal written
+        for status in statuses:
+            written += 1
+            yield status
+    for chunk in format_statuses(counted(), chunk_size):
+        out.write(chunk)
+    return written
+
+
+def stream_statuses(user_id, status_collection, out=None, *, chunk_size=500,
+                    **cursor_options):
+    """
+    Writes every status of user_id to out (stdout by default) in chunks of
+    chunk_size lines while the cursor fetches batch_size statuses per round
+    trip (STREAM_BATCH_SIZE by default), so a heavy user's statuses are
+    never all held in memory or written line by line. The cursor options
+    (batch_size, no_cursor_timeout) go to search_status_by_id; pass
+    no_cursor_timeout=True for a slow consumer. The cursor is closed even
+    if writing fails. Returns how many statuses were written.
+    """
+    cursor_options.setdefault("batch_size", STREAM_BATCH_SIZE)
+    cursor = status_collection.search_status_by_id(
+        user_id, {"USER_ID": 1, "STATUS_TEXT": 1}, **cursor_options)
+    try:
+        return write_statuses(cursor, out, chunk_size)
+    finally:
+        if hasattr(cursor, "close"):
+            cursor.close()
+
+
+def search_latest_statuses(user_id, limit, status_collection, out=None):
     """
-    for status in status_collection.search_status_by_id(user_id):
-        return status
+    Writes the limit most recent statuses published by user_id to out
+    (stdout by default), newest first. Prints a message if the user has
+    no statuses.
+    """
+    if not write_statuses(status_collection.latest_statuses(user_id, limit), out):
+        print(f'{user_id} has not published any statuses.')
+
+
+def search_statuses_by_tag(tag, status_collection, after=None, page_size=20):
+    """
+    Prints one page of the statuses carrying a hashtag ("#python") or a
+    mention ("@Livia.Atalanti89"). Returns the value to pass as after to
+    get the next page, or None if this was the last one.
+
+    The page is fetched with one search_statuses query and written with
+    write_statuses. Tag entries left behind by deleted statuses, and the
+    statuses of soft-deleted users, are skipped.
+    """
+    if status_collection.tags is None:
+        print('Tag search is not enabled for this status collection.')
+        return None
+    status_ids, next_after = status_collection.tags.statuses_with_tag(tag, after, page_size)
+    statuses = status_collection.search_statuses(status_ids, {"USER_ID": 1, "STATUS_TEXT": 1})
+    if not write_statuses(statuses):
+        print(f'No statuses found for {tag}.')
+    return next_after
+
+
 def delete_status(status_id, status_collection):
     """
     Delete a status in our status_collection by calling delete_status in users.py
@@ -176,16 +392,17 @@ def search_status(status_id, status_collection):
 
     Requirements:
     - If the status_id exists, user_status.search_status
-    returns a pymongo object. main calls print_status to
+    returns a pymongo object. main writes it out with write_statuses to
     allow us to look inside that object.
     - Returns None and prints an error message if status_id
-    does not exist.
+    does not exist, or if its owner is soft-deleted (a stale tag entry can
+    also point at a status that has gone).
     """
-    for status in status_collection.search_status(status_id):
-        if status is None:
-            print(f'{status_id} does not exist.')
-        else:
-            print_status(status)
+    result = status_collection.search_status(status_id)
+    if result is None:
+        print(f'{status_id} does not exist.')
+        return
+    write_statuses(result)
 
 
 def print_user(user):
@@ -218,16 +435,27 @@ def update_user(user_id, first_name, last_name, email, user_collection):
     updated_user = user_collection.update_user(user_id, first_name, last_name, email)
     if updated_user is None:
         print(f'{user_id} cannot be updated because it does not.')
+    elif not updated_user:
+        print(f'{user_id} cannot be updated: {email} is not a valid email address.')
     else:
         print("User updated.")
 
 
-def update_status(status_id, status_text, status_collection):
+def update_status(status_id, status_text, status_collection, rate_limiter=None):
     """
     Updates a status text if the status_id already exists.
     Returns True if successful.
     Returns None if the status_id can't be found in the status table.
-    """
+    If a rate_limiter is given, updates count against the limit of the user
+    the status is stored under, not the one its status_id spells out.
+    """
+    if rate_limiter is not None:
+        owner = status_collection.status_user(status_id)
+        if owner is None:
+            print(f'{status_id} cannot be updated because it does not exist.')
+            return
+        if not posting_allowed(owner, rate_limiter):
+            return
     updated_status = status_collection.update_status(status_id, status_text)
     if updated_status is None:
         print(f'{status_id} cannot be updated because it does not exist.')
@@ -255,28 +483,53 @@ def load_users(user_file, user_collection):
         print("User file not found.")
 
 
-def load_status(status_file, status_collection):
+def load_status(status_file, status_collection, chunk_size=5000):
     """
-    Loads status data from status_updates.csv row by row. Raises an exception if the seed
-    data already exists in our users table.
+    Loads status data from status_updates.csv in chunks of chunk_size rows.
+    Each chunk is one insert_many, and the hashtag/mention index for the chunk
+    is built in one bulk write as well. Rows whose STATUS_ID already exists are
+    skipped and reported; the rest of the file is still loaded. So are rows a
+    routed status collection can't take, whose STATUS_ID doesn't start with
+    their USER_ID.
     """
     try:
         with open(status_file, 'r', encoding="utf-8") as file:
-            data = list(DictReader(file))
-            for row in data:
-                status_collection.add_status(row["STATUS_ID"], row["USER_ID"], row["STATUS_TEXT"])
-    except (DuplicateKeyError, BulkWriteError):
-        print("Already seeded status data...")
+            data = [(row["STATUS_ID"], row["USER_ID"], row["STATUS_TEXT"])
+                    for row in DictReader(file)]
     except FileNotFoundError:
         print("Status file not found")
+        return
+    if status_collection.routed:
+        rows = len(data)
+        data = [row for row in data if user_status.status_owner(row[0]) == row[1]]
+        if len(data) < rows:
+            print(f"Skipped {rows - len(data)} statuses whose STATUS_ID doesn't "
+                  "start with their USER_ID.")
+    skipped = 0
+    try:
+        for start in range(0, len(data), chunk_size):
+            results = status_collection.add_statuses(data[start:start + chunk_size])
+            skipped += results.count(False)
+    except (DuplicateKeyError, BulkWriteError):
+        print("Already seeded status data...")
+        return
+    if skipped:
+        print(f"Already seeded status data... skipped {skipped} existing statuses.")
 
 
-def exit_program():
+def exit_program(tenant=DEFAULT_TENANT):
     """
-    Exits the program and wipes out our users and status tables from memory.
+    Exits the program, wiping out the users and status tables of tenant first
+    if asked to, along with the status table's tag index and text blobs so a
+    reload doesn't find stale tags. The shared MongoClient is left open for the rest of the
+    process (other tenants, the purge worker); the router closes it when
+    the process exits.
     """
     user_input = input("Would you like to drop the tables? [y/n]").lower()
     if user_input == "y":
-        database["users"].drop()
-        database["status"].drop()
-        mongo.close()
+        tenant_database = router.database(tenant)
+        tenant_database[tenant.users_collection].drop()
+        tenant_database[tenant.status_collection].drop()
+        tenant_database[f'{tenant.status_collection}_tags'].drop()
+        tenant_database[f'{tenant.status_collection}_blobs'].drop()
+    sys.exit()
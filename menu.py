@@ -3,13 +3,9 @@ Provides a basic frontend
 """
 
 import sys
-from loguru import logger
 import main
-
-logger.remove()
-logger.add('loguru_file_{time:YYYY-MM-DD}.log', level='DEBUG')
-logger.add(sys.stderr, level='WARNING')
-
+import log_config
+from socialnetwork_model import tenant_from_env
 
 
 def load_users(user_collection):
@@ -57,6 +53,14 @@ def delete_user(user_collection, status_collection):
     main.delete_user(user_id, user_collection, status_collection)
 
 
+def soft_delete_user(user_collection, status_collection):
+    """
+    Marks a user as deleted right away; their statuses are purged in the background
+    """
+    user_id = input("User ID: ")
+    main.delete_user(user_id, user_collection, status_collection, soft=True)
+
+
 def delete_status(status_collection):
     """
     Deletes status from the database
@@ -89,6 +93,28 @@ def search_status_by_id(status_collection):
     user_id = input ("Enter a user_id to search their statuses")
     main.search_status_by_id(user_id, status_collection)
 
+def search_latest_statuses(status_collection):
+    """
+    Shows the most recent statuses published by a user
+    """
+    user_id = input("Enter a user_id to see their latest statuses: ")
+    limit = input("How many statuses? [10] ") or "10"
+    if not limit.isdigit():
+        print("Please enter a number.", file=sys.stderr)
+        return
+    main.search_latest_statuses(user_id, int(limit), status_collection)
+
+
+def search_statuses_by_tag(status_collection):
+    """
+    Lists the statuses carrying a hashtag or mentioning a user, a page at a time
+    """
+    tag = input("Enter a #hashtag or @user_id to search: ")
+    after = main.search_statuses_by_tag(tag, status_collection)
+    while after is not None and input("Show more? [y/n] ").lower() == "y":
+        after = main.search_statuses_by_tag(tag, status_collection, after)
+
+
 def update_user(user_collection):
     """
     Updates information for an existing user
@@ -110,8 +136,11 @@ def update_status(status_collection):
 
 
 if __name__ == "__main__":
-    uc = main.init_user_collection()
-    sc = main.init_status_collection()
+    log_config.configure()
+    tenant = tenant_from_env()
+    uc = main.init_user_collection(tenant)
+    sc = main.init_status_collection(tenant=tenant, user_collection=uc)
+    purge_worker = main.init_purge_worker(uc, sc)
     try:
         while True:
             response = input(
@@ -126,6 +155,9 @@ if __name__ == "__main__":
                 "k to load users\n"
                 "l to load status\n"
                 "m to search for all statuses by user_id\n"
+                "n to show the latest statuses by user_id\n"
+                "o to search statuses by #hashtag or @mention\n"
+                "p to remove from users, purging their statuses in the background\n"
                 "q to quit\n"
                 "Enter option: "
             ).lower()
@@ -151,9 +183,15 @@ if __name__ == "__main__":
                 load_status(sc)
             elif response == "m":
                 search_status_by_id(sc)
+            elif response == "n":
+                search_latest_statuses(sc)
+            elif response == "o":
+                search_statuses_by_tag(sc)
+            elif response == "p":
+                soft_delete_user(uc, sc)
             elif response == "q":
-                main.exit_program()
+                main.exit_program(tenant)
             else:
                 print("Unknown command", file=sys.stderr)
     except KeyboardInterrupt:
-        main.exit_program()
+        main.exit_program(tenant)
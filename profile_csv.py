@@ -0,0 +1,204 @@
+"""
+Data-quality profiling of the seed CSVs before they are loaded.
+
+Checks accounts.csv and status_updates.csv for empty ids and fields, duplicate
+ids within the file, malformed emails and statuses whose USER_ID isn't in the
+accounts file. The columns are read in chunks into NumPy arrays and every check
+is a vectorized pass over a whole column, not a Python loop per row:
+
+    python profile_csv.py accounts.csv status_updates.csv --clean-dir clean
+
+prints a report and, with --clean-dir, writes copies of both files holding only
+the rows that passed, ready for main.load_users / main.load_status.
+"""
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+
+USER_COLUMNS = ("USER_ID", "EMAIL", "NAME", "LASTNAME")
+STATUS_COLUMNS = ("STATUS_ID", "USER_ID")
+# Must be in the header but is never loaded: no check reads it, and a
+# fixed-width array of the texts would take 4 bytes x longest text x rows.
+STATUS_HEADER_ONLY = ("STATUS_TEXT",)
+# str.translate table deleting every character str.isspace() accepts (the
+# last is U+3000). Covers the \s of USER_SCHEMA's EMAIL pattern: \v and \f
+# as well as space, \t, \n and \r, and the Unicode spaces.
+WHITESPACE = {code: None for code in range(0x3001) if chr(code).isspace()}
+
+
+def read_columns(path, columns, chunk_size=50000, header_only=()):
+    """
+    Reads the named columns of a CSV file into NumPy string arrays, chunk_size
+    rows at a time, and returns one concatenated array per column. Raises
+    ValueError if the header lacks any of the columns, or of the header_only
+    columns, which are checked but not read.
+    """
+    chunks = {name: [] for name in columns}
+    with open(path, 'r', encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        missing = [name for name in (*columns, *header_only) if name not in header]
+        if missing:
+            raise ValueError(f'Missing column in {path}: {", ".join(missing)}')
+        positions = [header.index(name) for name in columns]
+        while True:
+            rows = [row for _, row in zip(range(chunk_size), reader)]
+            if not rows:
+                break
+            for name, position in zip(columns, positions):
+                chunks[name].append(np.array(
+                    [row[position] if position < len(row) else "" for row in rows], dtype=str))
+    return {name: np.concatenate(parts) if parts else np.array([], dtype=str)
+            for name, parts in chunks.items()}
+
+
+def empty(column):
+    """
+    Mask of the values that are empty or only whitespace.
+    """
+    return np.char.str_len(np.char.strip(column)) == 0
+
+
+def duplicated(column):
+    """
+    Mask of every occurrence of a value after its first one.
+    """
+    mask = np.ones(len(column), dtype=bool)
+    _, first = np.unique(column, return_index=True)
+    mask[first] = False
+    return mask
+
+
+def bad_email(column):
+    """
+    Mask of the values that don't look like local@domain: exactly one "@",
+    something on both sides, and no whitespace. Same rule as USER_SCHEMA.
+    A value holds whitespace if deleting the WHITESPACE shortens it.
+    """
+    local, _, domain = (np.char.partition(column, "@")[:, part] for part in range(3))
+    lengths = np.char.str_len(column)
+    whitespace = np.char.str_len(np.char.translate(column, WHITESPACE)) != lengths
+    return ((np.char.count(column, "@") != 1) | (np.char.str_len(local) == 0)
+            | (np.char.str_len(domain) == 0) | whitespace)
+
+
+def profile_users(path):
+    """
+    Profiles an accounts CSV. Returns (report, keep mask, user_id column).
+    """
+    data = read_columns(path, USER_COLUMNS)
+    checks = {
+        "empty USER_ID": empty(data["USER_ID"]),
+        "duplicate USER_ID": duplicated(data["USER_ID"]),
+        "malformed EMAIL": bad_email(data["EMAIL"]),
+        "empty NAME": empty(data["NAME"]),
+        "empty LASTNAME": empty(data["LASTNAME"]),
+    }
+    return summarize(path, len(data["USER_ID"]), checks), keep_mask(checks), data["USER_ID"]
+
+
+def profile_statuses(path, user_ids=None):
+    """
+    Profiles a status CSV. If user_ids (an array of valid user ids) is given,
+    statuses of unknown users are flagged too. Returns (report, keep mask).
+    """
+    data = read_columns(path, STATUS_COLUMNS, header_only=STATUS_HEADER_ONLY)
+    checks = {
+        "empty STATUS_ID": empty(data["STATUS_ID"]),
+        "duplicate STATUS_ID": duplicated(data["STATUS_ID"]),
+        "empty USER_ID": empty(data["USER_ID"]),
+    }
+    if user_ids is not None:
+        checks["USER_ID not in accounts"] = ~np.isin(data["USER_ID"], user_ids)
+    # Not an error, but routed mode (StatusCollection(routed=True)) needs it.
+    owners = np.char.rpartition(data["STATUS_ID"], "_")[:, 0]
+    report = summarize(path, len(data["STATUS_ID"]), checks)
+    report["STATUS_ID not prefixed by its USER_ID (warning)"] = int(
+        np.count_nonzero(owners != data["USER_ID"]))
+    return report, keep_mask(checks)
+
+
+def keep_mask(checks):
+    """
+    Mask of the rows that passed every check.
+    """
+    failed = None
+    for mask in checks.values():
+        failed = mask if failed is None else failed | mask
+    return ~failed
+
+
+def summarize(path, rows, checks):
+    """
+    Builds the report dict: the row count and the number of rows failing each check.
+    """
+    report = {"file": path, "rows": rows}
+    report.update({name: int(np.count_nonzero(mask)) for name, mask in checks.items()})
+    return report
+
+
+def write_clean(path, keep, clean_path):
+    """
+    Copies the header and the rows of path whose keep flag is set to clean_path.
+    Returns the number of rows written.
+    """
+    written = 0
+    with open(path, 'r', encoding="utf-8", newline="") as source, \
+            open(clean_path, 'w', encoding="utf-8", newline="") as target:
+        reader = csv.reader(source)
+        writer = csv.writer(target)
+        writer.writerow(next(reader))
+        for row, keep_row in zip(reader, keep):
+            if keep_row:
+                writer.writerow(row)
+                written += 1
+    return written
+
+
+def print_report(report, out=sys.stdout):
+    """
+    Prints one file's report.
+    """
+    print(f'{report["file"]}: {report["rows"]} rows', file=out)
+    for name, count in report.items():
+        if name not in ("file", "rows"):
+            print(f'  {name:<48}{count:>8}', file=out)
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Profile the seed CSVs before loading.")
+    parser.add_argument("user_file")
+    parser.add_argument("status_file", nargs="?")
+    parser.add_argument("--clean-dir", help="write the rows that passed here")
+    args = parser.parse_args()
+
+    try:
+        user_report, user_keep, user_ids = profile_users(args.user_file)
+        print_report(user_report)
+        results = [(args.user_file, user_keep)]
+        if args.status_file:
+            status_report, status_keep = profile_statuses(args.status_file,
+                                                          user_ids[user_keep])
+            print_report(status_report)
+            results.append((args.status_file, status_keep))
+    except FileNotFoundError as error:
+        print(f'File not found: {error.filename}', file=sys.stderr)
+        return
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return
+    if args.clean_dir:
+        os.makedirs(args.clean_dir, exist_ok=True)
+        for path, keep in results:
+            clean_path = os.path.join(args.clean_dir, os.path.basename(path))
+            print(f'wrote {write_clean(path, keep, clean_path)} rows to {clean_path}')
+
+
+if __name__ == "__main__":
+    main()
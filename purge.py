@@ -0,0 +1,87 @@
+"""
+Background purge of soft-deleted users and their statuses
+"""
+import threading
+
+from pymongo.errors import PyMongoError
+
+from loguru import logger
+
+
+class PurgeWorker:
+    """
+    Finishes what UserCollection.soft_delete_user starts: deletes the
+    statuses of soft-deleted users in delete_many batches of batch_size,
+    pausing after every batch, across users too, so at most
+    batches_per_second run, then removes the user document itself.
+
+    run_once() does one sweep; start() runs a sweep every interval seconds
+    in a daemon thread until stop().
+    """
+    def __init__(self, user_collection, status_collection, batch_size=500,
+                 batches_per_second=5.0, interval=30.0):
+        self.user_collection = user_collection
+        self.status_collection = status_collection
+        self.batch_size = batch_size
+        self.pause = 1.0 / batches_per_second
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def purge_user(self, user_id):
+        """
+        Deletes all statuses of user_id batch by batch, then the user.
+        Returns the number of statuses deleted, or None if stopped midway.
+        """
+        deleted = 0
+        while True:
+            batch = self.status_collection.purge_statuses_batch(user_id, self.batch_size)
+            deleted += batch
+            if self._stop.wait(self.pause):
+                return None
+            if batch < self.batch_size:
+                break
+        self.user_collection.purge_user(user_id)
+        logger.info(f'Purged {user_id} and {deleted} statuses')
+        return deleted
+
+    def run_once(self):
+        """
+        Purges every user currently marked deleted. Returns {user_id: statuses deleted}.
+        """
+        purged = {}
+        for user_id in self.user_collection.deleted_user_ids():
+            deleted = self.purge_user(user_id)
+            if deleted is None:
+                break
+            purged[user_id] = deleted
+        return purged
+
+    def run(self):
+        """
+        Sweeps every interval seconds until stop() is called.
+        """
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except PyMongoError as error:
+                logger.warning(f'Purge sweep failed, will retry: {error}')
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        Starts sweeping in a background daemon thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="purge", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the background thread after its current batch.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
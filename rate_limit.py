@@ -0,0 +1,134 @@
+"""
+Per-user token bucket rate limiting for status posting
+"""
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from loguru import logger
+
+
+class LimiterStats:
+    """
+    Counts a limiter's decisions and the time spent making them.
+    """
+    def __init__(self):
+        self.allowed = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, allowed, seconds):
+        """
+        Records one decision.
+        """
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.rejected += 1
+            self.seconds += seconds
+
+    def as_dict(self):
+        """
+        Returns the counters and the mean decision time in microseconds.
+        """
+        decisions = self.allowed + self.rejected
+        return {"allowed": self.allowed, "rejected": self.rejected,
+                "mean_decision_us": 1e6 * self.seconds / decisions if decisions else 0.0}
+
+
+class TokenBucket:
+    """
+    In-process token bucket per key (we key by user_id). Each key holds up to
+    capacity tokens and regains rate tokens per second; a request costs one.
+    Only limits the requests this process sees; use MongoTokenBucket to share
+    the buckets between processes.
+    """
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.buckets = {}
+        self.stats = LimiterStats()
+        self._lock = threading.Lock()
+
+    def allow(self, key, cost=1):
+        """
+        Takes cost tokens from key's bucket and returns True, or returns
+        False without taking any if there aren't enough.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self.buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now)
+        self.stats.record(allowed, time.perf_counter() - start)
+        if not allowed:
+            logger.debug(f'Rate limited {key}')
+        return allowed
+
+    def prune(self):
+        """
+        Forgets the keys whose bucket has refilled; they behave the same
+        as keys never seen. Call it now and then to bound memory.
+        """
+        with self._lock:
+            now = self.clock()
+            full = [key for key, (tokens, updated) in self.buckets.items()
+                    if tokens + (now - updated) * self.rate >= self.capacity]
+            for key in full:
+                del self.buckets[key]
+        return len(full)
+
+
+class MongoTokenBucket:
+    """
+    Token buckets kept in a rate_limits collection, so every app process
+    shares the same limits. Each decision is one atomic find_one_and_update
+    with an aggregation-pipeline update, timed by the server's clock ($$NOW).
+    Buckets idle for idle_seconds are removed by a TTL index.
+    """
+    def __init__(self, database, rate, capacity, idle_seconds=3600):
+        self.database = database["rate_limits"]
+        self.rate = rate
+        self.capacity = capacity
+        self.stats = LimiterStats()
+        self.database.create_index("UPDATED", expireAfterSeconds=idle_seconds)
+
+    def update_pipeline(self, cost):
+        """
+        Refills the bucket for the time since UPDATED, then takes cost
+        tokens if there are enough and records the decision in ALLOWED.
+        """
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$UPDATED", "$$NOW"]}]},
+                               1000]}
+        refilled = {"$min": [self.capacity,
+                             {"$add": [{"$ifNull": ["$TOKENS", self.capacity]},
+                                       {"$multiply": [self.rate, elapsed]}]}]}
+        return [
+            {"$set": {"TOKENS": refilled, "UPDATED": "$$NOW"}},
+            {"$set": {"ALLOWED": {"$gte": ["$TOKENS", cost]}}},
+            {"$set": {"TOKENS": {"$cond": ["$ALLOWED", {"$subtract": ["$TOKENS", cost]},
+                                           "$TOKENS"]}}},
+        ]
+
+    def allow(self, key, cost=1):
+        """
+        Takes cost tokens from key's shared bucket and returns True, or
+        returns False if there aren't enough.
+        """
+        start = time.perf_counter()
+        bucket = self.database.find_one_and_update(
+            {"_id": key}, self.update_pipeline(cost), projection={"ALLOWED": 1},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        allowed = bool(bucket["ALLOWED"])
+        self.stats.record(allowed, time.perf_counter() - start)
+        if not allowed:
+            logger.debug(f'Rate limited {key}')
+        return allowed
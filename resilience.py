@@ -0,0 +1,192 @@
+"""
+Retry, deadline and circuit-breaker policy shared by the collection classes
+"""
+import functools
+import random
+import threading
+import time
+
+import pymongo
+from pymongo.errors import AutoReconnect, ExecutionTimeout, PyMongoError
+
+from loguru import logger
+from log_config import timed
+
+
+class CircuitOpenError(PyMongoError):
+    """
+    Raised without calling the database while the circuit breaker is open.
+    It is a PyMongoError so callers handle it like any other database failure.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls; while open every
+    call fails fast. After reset_timeout seconds one trial call is let
+    through (half-open): success closes the breaker, failure opens it again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        "closed", "open" or "half_open".
+        """
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError unless the call may go ahead.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return
+        raise CircuitOpenError("database circuit breaker is open")
+
+    def record_success(self):
+        """
+        Closes the breaker.
+        """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """
+        Counts a failed call and opens the breaker at the threshold.
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning("Database circuit breaker opened")
+                self.opened_at = self.clock()
+
+    def release(self):
+        """
+        Ends a call whose error says nothing about the database's health (a
+        duplicate key, a bad argument) without changing the state, so a
+        half-open breaker lets the next call try.
+        """
+        with self._lock:
+            self._trial = False
+
+
+class Resilience:
+    """
+    Runs a database call under a deadline, retrying transient network errors
+    (AutoReconnect, which covers NetworkTimeout and server selection timeouts)
+    with full-jitter exponential backoff, behind a CircuitBreaker.
+
+    Only idempotent calls are retried: re-running an insert whose first
+    attempt reached the server would turn a success into a duplicate key.
+    """
+    def __init__(self, deadline=5.0, attempts=3, base_delay=0.05, max_delay=1.0,
+                 breaker=None, sleep=time.sleep, clock=time.monotonic):
+        self.deadline = deadline
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker(clock=clock)
+        self.sleep = sleep
+        self.clock = clock
+
+    def backoff(self, attempt):
+        """
+        Returns the jittered delay before retry number attempt (1-based).
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, *args, idempotent=True, **kwargs):
+        """
+        Calls func(*args, **kwargs) under the policy and returns its result,
+        or raises the last error once attempts or the deadline run out.
+        Network errors and an exceeded deadline (ExecutionTimeout) count as
+        breaker failures; any other error just releases a half-open trial.
+        """
+        self.breaker.before_call()
+        try:
+            result = self.attempt(func, args, kwargs, idempotent)
+        except (AutoReconnect, ExecutionTimeout):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def attempt(self, func, args, kwargs, idempotent):
+        """
+        Runs func until it succeeds, retrying AutoReconnect with backoff
+        while attempts and the deadline allow.
+        """
+        give_up_at = self.clock() + self.deadline
+        attempts = self.attempts if idempotent else 1
+        for attempt in range(1, attempts + 1):
+            remaining = give_up_at - self.clock()
+            try:
+                with pymongo.timeout(max(remaining, 0.001)):
+                    return func(*args, **kwargs)
+            except AutoReconnect as error:
+                delay = self.backoff(attempt)
+                if attempt == attempts or self.clock() + delay >= give_up_at:
+                    raise
+                logger.info(f'{func.__name__} failed ({error}), retry {attempt} in {delay:.3f}s')
+                self.sleep(delay)
+        raise AssertionError("unreachable")
+
+
+# One policy for the whole process, so both collections share a breaker:
+# when MongoDB is down, users and statuses both fail fast.
+DEFAULT_RESILIENCE = Resilience()
+
+
+_active = threading.local()
+
+
+def resilient(idempotent=True):
+    """
+    Decorates a collection method to run under self.resilience (a Resilience),
+    if the instance has one, and logs it with log_config.timed: the method
+    name, the id it was called with and its duration, retries included.
+    A decorated method called from another one (search_status asking
+    users.is_soft_deleted) runs under the outer call's policy and record,
+    so retries don't multiply and failures are counted once.
+    """
+    def decorator(method):
+        operation = method.__qualname__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if getattr(_active, "depth", 0):
+                return method(self, *args, **kwargs)
+            policy = getattr(self, "resilience", None)
+            _active.depth = 1
+            try:
+                with timed(operation, id=args[0] if args and isinstance(args[0], str) else None):
+                    if policy is None:
+                        return method(self, *args, **kwargs)
+                    return policy.call(method, self, *args, idempotent=idempotent, **kwargs)
+            finally:
+                _active.depth = 0
+        return wrapper
+    return decorator
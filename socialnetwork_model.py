@@ -1,6 +1,234 @@
+"""
+MongoDB client, database and collection schemas for the social network
+"""
+import atexit
+import importlib.util
+import os
+import re
+import threading
+
+from loguru import logger
 from pymongo import MongoClient
+from pymongo.read_preferences import Primary, read_pref_mode_from_name, make_read_preference
+
+# Connection string, e.g. "mongodb://h1,h2,h3/?replicaSet=rs0" for a replica
+# set. Unset means a mongod on localhost.
+MONGO_URI = os.environ.get("SOCIALNETWORK_MONGO_URI")
+
+# Where search reads go: primary, primaryPreferred, secondary,
+# secondaryPreferred or nearest. Writes, and the reads that guard writes
+# (user_exists before adding a status), always use the primary.
+SEARCH_READ_PREFERENCE = os.environ.get("SOCIALNETWORK_READ_PREFERENCE", "primary")
+
+# How far behind the primary (in seconds) a secondary may be and still
+# serve searches. The server's minimum is 90; -1 means no bound.
+SEARCH_MAX_STALENESS = int(os.environ.get("SOCIALNETWORK_MAX_STALENESS", "-1"))
+
+# Compression profiles: the wire compressors the client offers (the server
+# uses the first one it also has enabled, see net.compression in
+# mongo_config_dev.yml) and the WiredTiger block compressor of the
+# collections created at init. "default" keeps the server's defaults: no
+# wire compression and snappy blocks.
+COMPRESSION_PROFILES = {
+    "default": {"wire": [], "block": None},
+    "none": {"wire": [], "block": "none"},
+    "snappy": {"wire": ["snappy"], "block": "snappy"},
+    "zstd": {"wire": ["zstd"], "block": "zstd"},
+    "zlib": {"wire": ["zlib"], "block": "zlib"},
+}
+COMPRESSION_PROFILE = os.environ.get("SOCIALNETWORK_COMPRESSION", "default")
+
+# pymongo needs these modules for wire compression (zlib is built in).
+WIRE_COMPRESSOR_MODULES = {"snappy": "snappy", "zstd": "zstandard", "zlib": "zlib"}
+
+
+def compression_profile(name=None):
+    """
+    Returns the named compression profile, by default SOCIALNETWORK_COMPRESSION.
+    """
+    name = COMPRESSION_PROFILE if name is None else name
+    if name not in COMPRESSION_PROFILES:
+        raise ValueError(f'Unknown compression profile {name!r}, '
+                         f'expected one of {", ".join(COMPRESSION_PROFILES)}')
+    return COMPRESSION_PROFILES[name]
+
 
-mongo = MongoClient()
+def client_options(profile_name=None):
+    """
+    Returns the MongoClient keyword arguments of a compression profile.
+    Wire compressors whose Python module isn't installed are left out.
+    """
+    wire = []
+    for compressor in compression_profile(profile_name)["wire"]:
+        if importlib.util.find_spec(WIRE_COMPRESSOR_MODULES[compressor]) is None:
+            logger.warning(f'{compressor} wire compression needs the '
+                           f'{WIRE_COMPRESSOR_MODULES[compressor]} package, not using it')
+        else:
+            wire.append(compressor)
+    return {"compressors": ",".join(wire)} if wire else {}
+
+
+def block_compressor(profile_name=None):
+    """
+    Returns the block compressor of a compression profile, or None for the
+    server's default.
+    """
+    return compression_profile(profile_name)["block"]
+
+
+mongo = MongoClient(MONGO_URI, **client_options())
 database = mongo.UserStatuses
-user_collection = database["users"]
-status_collection = database["status"]
\ No newline at end of file
+
+# Letters, digits, "_" and "-" only: a tenant id ends up in a database name.
+TENANT_ID = re.compile(r"^[A-Za-z0-9_-]{1,40}$")
+
+
+class TenantContext:
+    """
+    Names where one tenant's data lives: the cluster (uri, None for
+    SOCIALNETWORK_MONGO_URI), the database and the users/status collections.
+    The default context is the single-tenant UserStatuses database.
+    """
+    def __init__(self, database_name="UserStatuses", users_collection="users",
+                 status_collection="status", uri=None):
+        self.database_name = database_name
+        self.users_collection = users_collection
+        self.status_collection = status_collection
+        self.uri = uri
+
+    @classmethod
+    def for_tenant(cls, tenant_id, uri=None):
+        """
+        Returns the context of tenant_id, whose data lives in its own
+        UserStatuses_<tenant_id> database.
+        """
+        if not TENANT_ID.match(tenant_id):
+            raise ValueError(f'Invalid tenant id {tenant_id!r}')
+        return cls(f'UserStatuses_{tenant_id}', uri=uri)
+
+    def __repr__(self):
+        return (f'TenantContext({self.database_name!r}, {self.users_collection!r}, '
+                f'{self.status_collection!r}, uri={self.uri!r})')
+
+
+class TenantRouter:
+    """
+    Hands out each tenant's database from one MongoClient per cluster, so
+    every tenant on a cluster shares that client's connection pool: a
+    hundred tenants cost no more connections than one.
+    """
+    def __init__(self, client_factory=None):
+        self.client_factory = client_factory if client_factory is not None else \
+            (lambda uri: MongoClient(uri, **client_options()))
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, uri=None):
+        """
+        Returns the shared client for uri (None for SOCIALNETWORK_MONGO_URI),
+        creating it on first use.
+        """
+        uri = MONGO_URI if uri is None else uri
+        with self._lock:
+            if uri not in self.clients:
+                self.clients[uri] = self.client_factory(uri)
+            return self.clients[uri]
+
+    def database(self, tenant):
+        """
+        Returns the database of a TenantContext.
+        """
+        return self.client(tenant.uri)[tenant.database_name]
+
+    def close(self):
+        """
+        Closes every client.
+        """
+        with self._lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+
+
+DEFAULT_TENANT = TenantContext()
+
+
+def tenant_from_env():
+    """
+    Returns the context of the tenant named by SOCIALNETWORK_TENANT, or
+    DEFAULT_TENANT if it's unset.
+    """
+    tenant_id = os.environ.get("SOCIALNETWORK_TENANT")
+    return DEFAULT_TENANT if not tenant_id else TenantContext.for_tenant(tenant_id)
+
+
+# The process-wide router. It starts out with mongo, so the default tenant
+# and the module-level database above share one client.
+router = TenantRouter()
+router.clients[MONGO_URI] = mongo
+atexit.register(router.close)
+
+# $jsonSchema validators installed on the collections at init. Only the
+# fields every document must carry are required, so later optional fields
+# don't need a schema change. Every write stamps MODIFIED_AT, which the
+# change feed's polling fallback follows (see change_feed.ChangeFeed).
+USER_SCHEMA = {
+    "bsonType": "object",
+    "required": ["_id", "NAME", "LASTNAME", "EMAIL"],
+    "properties": {
+        "_id": {"bsonType": "string", "minLength": 1},
+        "NAME": {"bsonType": "string"},
+        "LASTNAME": {"bsonType": "string"},
+        "EMAIL": {"bsonType": "string", "pattern": "^[^@\\s]+@[^@\\s]+$"},
+        "CREATED_AT": {"bsonType": "date"},
+        "MODIFIED_AT": {"bsonType": "date"},
+        "DELETED_AT": {"bsonType": "date"},
+    },
+}
+
+# A status holds its text inline (STATUS_TEXT) or, with a
+# StatusBlobCollection, as a reference to it (STATUS_TEXT_REF).
+STATUS_SCHEMA = {
+    "bsonType": "object",
+    "required": ["_id", "USER_ID"],
+    "anyOf": [{"required": ["STATUS_TEXT"]}, {"required": ["STATUS_TEXT_REF"]}],
+    "properties": {
+        "_id": {"bsonType": "string", "minLength": 1},
+        "USER_ID": {"bsonType": "string", "minLength": 1},
+        "STATUS_TEXT": {"bsonType": "string"},
+        "STATUS_TEXT_REF": {"bsonType": "binData"},
+        "CREATED_AT": {"bsonType": "date"},
+        "MODIFIED_AT": {"bsonType": "date"},
+    },
+}
+
+
+def install_validator(db, name, schema, compressor=None):
+    """
+    Installs schema as the $jsonSchema validator of collection name in db,
+    creating the collection if it doesn't exist yet. A new collection gets
+    compressor ("snappy", "zstd", "zlib" or "none") as its WiredTiger block
+    compressor; an existing one keeps the compressor it was created with.
+    """
+    validator = {"$jsonSchema": schema}
+    if name in db.list_collection_names(filter={"name": name}):
+        db.command("collMod", name, validator=validator)
+    elif compressor is None:
+        db.create_collection(name, validator=validator)
+    else:
+        db.create_collection(name, validator=validator, storageEngine={
+            "wiredTiger": {"configString": f"block_compressor={compressor}"}})
+
+
+def search_read_preference(mode=None, max_staleness=None):
+    """
+    Returns the read preference for search paths, from the arguments or
+    else from SOCIALNETWORK_READ_PREFERENCE / SOCIALNETWORK_MAX_STALENESS.
+    The staleness bound is ignored for primary, which is never stale.
+    """
+    mode = SEARCH_READ_PREFERENCE if mode is None else mode
+    max_staleness = SEARCH_MAX_STALENESS if max_staleness is None else max_staleness
+    mode_number = read_pref_mode_from_name(mode)
+    if mode_number == Primary().mode:
+        return Primary()
+    return make_read_preference(mode_number, None, max_staleness)
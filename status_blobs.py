@@ -0,0 +1,116 @@
+"""
+Content-addressed storage of status texts
+"""
+import hashlib
+
+from pymongo import UpdateOne
+
+
+def text_ref(status_text):
+    """
+    Returns the reference of a status text: its 16-byte BLAKE2b digest,
+    which pymongo stores as BSON binary and reads back as bytes. 128 bits
+    keep collisions out of reach (about 1 in 10**20 at a billion distinct
+    texts) while the reference stays shorter than most texts.
+    """
+    return hashlib.blake2b(status_text.encode("utf-8"), digest_size=16).digest()
+
+
+class StatusBlobCollection:
+    """
+    Stores each distinct status text once, in a collection keyed by its
+    digest (text_ref) and named after the status collection it serves
+    (status_blobs for status, see main.init_status_collection). A
+    StatusCollection created with blobs= keeps a STATUS_TEXT_REF on its
+    statuses instead of the text, so a text reposted a thousand times is
+    stored, cached and read once.
+
+    Texts shorter than min_length bytes stay inline: their reference would
+    take about as much room as the text itself (see dedupe_report.py).
+
+    Blobs are immutable and shared, so deleting a status leaves its blob in
+    place; an orphaned blob costs one small document.
+    """
+    def __init__(self, database, min_length=32, collection_name="status_blobs"):
+        self.database = database[collection_name]
+        self.min_length = min_length
+
+    def inline(self, status_text):
+        """
+        Returns True if status_text is short enough to store inline.
+        """
+        return len(status_text.encode("utf-8")) < self.min_length
+
+    def text_fields(self, status_text):
+        """
+        Returns the status fields holding status_text: STATUS_TEXT for
+        inline texts, STATUS_TEXT_REF otherwise. Call store() or
+        store_many() for the blob.
+        """
+        if self.inline(status_text):
+            return {"STATUS_TEXT": status_text}
+        return {"STATUS_TEXT_REF": text_ref(status_text)}
+
+    def store(self, status_text):
+        """
+        Stores status_text unless it's inline or already stored, and returns
+        the status fields to save (see text_fields).
+        """
+        return self.store_many([status_text])[0]
+
+    def store_many(self, status_texts):
+        """
+        Stores the distinct new texts among status_texts with one unordered
+        bulk write of upserts, and returns the status fields for each text.
+        """
+        fields = [self.text_fields(status_text) for status_text in status_texts]
+        blobs = {field["STATUS_TEXT_REF"]: status_text
+                 for field, status_text in zip(fields, status_texts)
+                 if "STATUS_TEXT_REF" in field}
+        if blobs:
+            self.database.bulk_write(
+                [UpdateOne({"_id": ref}, {"$setOnInsert": {"STATUS_TEXT": status_text}},
+                           upsert=True) for ref, status_text in blobs.items()],
+                ordered=False)
+        return fields
+
+    def lookup(self, refs):
+        """
+        Returns {ref: status text} for refs, fetched with one query.
+        """
+        refs = list(set(refs))
+        if not refs:
+            return {}
+        return {blob["_id"]: blob["STATUS_TEXT"]
+                for blob in self.database.find({"_id": {"$in": refs}})}
+
+    def resolve(self, statuses, batch_size=1000):
+        """
+        Generator over statuses with STATUS_TEXT filled in from the blobs,
+        batch_size statuses (one blob query) at a time. Statuses without a
+        STATUS_TEXT_REF pass through unchanged. The statuses cursor is
+        closed when the generator is.
+        """
+        batch = []
+        try:
+            for status in statuses:
+                batch.append(status)
+                if len(batch) == batch_size:
+                    yield from self.fill(batch)
+                    batch = []
+            yield from self.fill(batch)
+        finally:
+            if hasattr(statuses, "close"):
+                statuses.close()
+
+    def fill(self, statuses):
+        """
+        Sets STATUS_TEXT on the statuses that hold a reference and returns them.
+        """
+        texts = self.lookup(status["STATUS_TEXT_REF"] for status in statuses
+                            if "STATUS_TEXT_REF" in status)
+        for status in statuses:
+            ref = status.pop("STATUS_TEXT_REF", None)
+            if ref is not None:
+                status["STATUS_TEXT"] = texts.get(ref)
+        return statuses
@@ -0,0 +1,115 @@
+"""
+Hashtag and mention index for statuses
+"""
+import re
+
+from pymongo import ASCENDING, DeleteMany, InsertOne
+from pymongo.errors import BulkWriteError
+
+
+HASHTAG = re.compile(r'(?<![\w#])#(\w+)')
+# user ids look like Livia.Atalanti89, so mentions may contain dots
+MENTION = re.compile(r'(?<![\w@])@(\w+(?:\.\w+)*)')
+
+
+def extract_tags(status_text):
+    """
+    Returns the sorted, de-duplicated tags of a status: hashtags lowercased
+    with their "#", and mentions with their "@" and the user_id's case kept.
+    """
+    tags = {f'#{tag.lower()}' for tag in HASHTAG.findall(status_text)}
+    tags.update(f'@{user_id}' for user_id in MENTION.findall(status_text))
+    return sorted(tags)
+
+
+def normalize_tag(tag):
+    """
+    Returns tag the way extract_tags indexes it: hashtags lowercased,
+    mentions left as typed.
+    """
+    return tag.lower() if tag.startswith("#") else tag
+
+
+class StatusTagCollection:
+    """
+    Inverted index from tag ("#python", "@Livia.Atalanti89") to the ids of
+    the statuses carrying it. One small document per (tag, status) pair,
+    so a popular tag never grows a single document without bound.
+
+    The index lives in collection_name, named after the status collection
+    it serves (status_tags for status, see main.init_status_collection).
+    """
+    def __init__(self, database, collection_name="status_tags"):
+        self.database = database[collection_name]
+        self.database.create_index([("TAG", ASCENDING), ("STATUS_ID", ASCENDING)],
+                                   unique=True)
+        self.database.create_index("STATUS_ID")
+
+    @staticmethod
+    def inserts(status_id, status_text):
+        """
+        Returns the InsertOne operations indexing one status.
+        """
+        return [InsertOne({"TAG": tag, "STATUS_ID": status_id})
+                for tag in extract_tags(status_text)]
+
+    def write(self, operations, ordered=True):
+        """
+        Sends operations as one bulk write. Duplicate (tag, status) pairs,
+        e.g. from re-running a loader, are ignored.
+        """
+        if not operations:
+            return
+        try:
+            self.database.bulk_write(operations, ordered=ordered)
+        except BulkWriteError as error:
+            if any(write_error["code"] != 11000
+                   for write_error in error.details["writeErrors"]):
+                raise
+
+    def index_status(self, status_id, status_text):
+        """
+        Indexes the tags of a new status.
+        """
+        self.write(self.inserts(status_id, status_text), ordered=False)
+
+    def index_statuses(self, rows):
+        """
+        Indexes many new statuses in one bulk write. rows is a list of
+        (status_id, user_id, status_text) tuples, like add_statuses takes.
+        """
+        operations = []
+        for status_id, _, status_text in rows:
+            operations.extend(self.inserts(status_id, status_text))
+        self.write(operations, ordered=False)
+
+    def reindex_status(self, status_id, status_text):
+        """
+        Replaces the tags of an updated status: the old entries are deleted
+        and the new ones inserted in the same ordered bulk write.
+        """
+        self.write([DeleteMany({"STATUS_ID": status_id})]
+                   + self.inserts(status_id, status_text))
+
+    def remove_statuses(self, status_ids):
+        """
+        Removes every tag entry of the given statuses.
+        """
+        if status_ids:
+            self.database.delete_many({"STATUS_ID": {"$in": list(status_ids)}})
+
+    def statuses_with_tag(self, tag, after=None, limit=20):
+        """
+        Returns one page of status ids carrying tag, in status_id order, and
+        the value to pass as after to get the next page (None on the last page).
+        "#Python" finds the statuses indexed under "#python".
+        """
+        query = {"TAG": normalize_tag(tag)}
+        if after is not None:
+            query["STATUS_ID"] = {"$gt": after}
+        cursor = self.database.find(query, {"_id": 0, "STATUS_ID": 1}).sort(
+            "STATUS_ID", ASCENDING).limit(limit + 1)
+        status_ids = [entry["STATUS_ID"] for entry in cursor]
+        if len(status_ids) > limit:
+            return status_ids[:limit], status_ids[limit - 1]
+        return status_ids, None
@@ -0,0 +1,239 @@
+"""
+Unit testing the HTTP API routing with mocked collections
+"""
+import io
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from pymongo.errors import AutoReconnect, ExecutionTimeout
+
+from api_server import MAX_LIMIT, SocialNetworkAPI, read_body
+
+
+class TestSocialNetworkAPI(TestCase):
+    """
+    Calls SocialNetworkAPI.handle directly, no sockets involved.
+    """
+    def setUp(self):
+        """
+        Mock both collections.
+        """
+        self.user_collection = MagicMock()
+        self.status_collection = MagicMock()
+        self.api = SocialNetworkAPI(self.user_collection, self.status_collection,
+                                    max_in_flight=2)
+
+    def test_add_user(self):
+        """
+        POST /users creates the user.
+        """
+        self.user_collection.add_user.return_value = True
+        status, _ = self.api.handle("POST", "/users", {
+            "user_id": "velma2", "first_name": "Velma", "last_name": "Dinkley",
+            "email": "velma2@gmail.com"})
+        self.assertEqual(status, 201)
+
+    def test_add_duplicate_user(self):
+        """
+        POST /users with an existing user_id is a conflict.
+        """
+        self.user_collection.add_user.return_value = False
+        status, _ = self.api.handle("POST", "/users", {
+            "user_id": "velma2", "first_name": "Velma", "last_name": "Dinkley",
+            "email": "velma2@gmail.com"})
+        self.assertEqual(status, 409)
+
+    def test_schema_rejected_user(self):
+        """
+        POST and PUT /users with an email the users schema refuses are bad
+        requests, not a conflict or a success.
+        """
+        self.user_collection.add_user.return_value = None
+        self.user_collection.update_user.return_value = False
+        user = {"first_name": "Velma", "last_name": "Dinkley", "email": "velma2"}
+        status, _ = self.api.handle("POST", "/users", {"user_id": "velma2", **user})
+        self.assertEqual(status, 400)
+        status, _ = self.api.handle("PUT", "/users/velma2", user)
+        self.assertEqual(status, 400)
+
+    def test_missing_field(self):
+        """
+        A body without a required field is a bad request.
+        """
+        status, body = self.api.handle("POST", "/users", {"user_id": "velma2"})
+        self.assertEqual(status, 400)
+        self.assertIn("first_name", body["error"])
+
+    def test_get_user(self):
+        """
+        GET /users/<id> returns the user document.
+        """
+        self.user_collection.search_user.return_value = iter([{"_id": "velma2"}])
+        self.assertEqual(self.api.handle("GET", "/users/velma2"), (200, {"_id": "velma2"}))
+
+    def test_get_status(self):
+        """
+        GET /statuses/<id> returns the status document.
+        """
+        self.status_collection.search_status.return_value = iter([{"_id": "velma2_00001"}])
+        self.assertEqual(self.api.handle("GET", "/statuses/velma2_00001"),
+                         (200, {"_id": "velma2_00001"}))
+
+    def test_get_status_closes_the_result(self):
+        """
+        GET /statuses/<id> closes what search_status returned once it has
+        the status, so the cursor behind it isn't left open.
+        """
+        closed = []
+
+        def statuses():
+            try:
+                yield {"_id": "velma2_00001"}
+                yield {"_id": "velma2_00001"}
+            finally:
+                closed.append(True)
+        self.status_collection.search_status.return_value = statuses()
+        self.assertEqual(self.api.handle("GET", "/statuses/velma2_00001")[0], 200)
+        self.assertEqual(closed, [True])
+
+    def test_get_missing_status(self):
+        """
+        GET /statuses/<id> for an unknown status is a 404.
+        """
+        self.status_collection.search_status.return_value = None
+        status, _ = self.api.handle("GET", "/statuses/velma2_00009")
+        self.assertEqual(status, 404)
+
+    def test_add_status_for_unknown_user(self):
+        """
+        Statuses can only be added for existing users.
+        """
+        self.user_collection.existing_user_ids.return_value = set()
+        status, _ = self.api.handle("POST", "/statuses", {
+            "status_id": "shaggy_00001", "user_id": "shaggy", "status_text": "Zoinks!"})
+        self.assertEqual(status, 404)
+        self.status_collection.add_status.assert_not_called()
+
+    def test_delete_user_cascades(self):
+        """
+        DELETE /users/<id> deletes the user's statuses first.
+        """
+        self.status_collection.delete_statuses_by_user.return_value = 3
+        status, body = self.api.handle("DELETE", "/users/velma2")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["deleted_statuses"], 3)
+
+    def test_latest_statuses_limit(self):
+        """
+        GET /users/<id>/statuses passes the limit along, rejects limit=0 and
+        caps large limits at MAX_LIMIT.
+        """
+        self.status_collection.latest_statuses.return_value = []
+        self.assertEqual(self.api.handle("GET", "/users/velma2/statuses?limit=0")[0], 400)
+        self.status_collection.latest_statuses.assert_not_called()
+        self.api.handle("GET", "/users/velma2/statuses?limit=5")
+        self.status_collection.latest_statuses.assert_called_with("velma2", 5)
+        self.api.handle("GET", "/users/velma2/statuses?limit=100000")
+        self.status_collection.latest_statuses.assert_called_with("velma2", MAX_LIMIT)
+
+    def test_unknown_route(self):
+        """
+        Anything else is a 404.
+        """
+        self.assertEqual(self.api.handle("PATCH", "/users/velma2")[0], 404)
+
+    def test_database_errors(self):
+        """
+        Timeouts map to 504, other database failures to 503.
+        """
+        self.status_collection.delete_status.side_effect = ExecutionTimeout("slow")
+        self.assertEqual(self.api.handle("DELETE", "/statuses/velma2_00001")[0], 504)
+        self.status_collection.delete_status.side_effect = AutoReconnect("down")
+        self.assertEqual(self.api.handle("DELETE", "/statuses/velma2_00001")[0], 503)
+
+    def test_value_error_is_bad_request(self):
+        """
+        A status the collection refuses with ValueError (a routed status_id
+        naming another user) is a 400, not a crash.
+        """
+        self.user_collection.existing_user_ids.return_value = {"velma2"}
+        self.status_collection.add_status.side_effect = ValueError("shaggy_00001 is not velma2's")
+        status, body = self.api.handle("POST", "/statuses", {
+            "status_id": "shaggy_00001", "user_id": "velma2", "status_text": "Zoinks!"})
+        self.assertEqual(status, 400)
+        self.assertIn("shaggy_00001", body["error"])
+
+    def test_field_types_are_checked(self):
+        """
+        Ids that aren't non-empty strings are a 400 before any collection is
+        called, so a routed status_owner never sees an int.
+        """
+        for status_id in (5, "", None):
+            status, body = self.api.handle("POST", "/statuses", {
+                "status_id": status_id, "user_id": "velma2", "status_text": "Zoinks!"})
+            self.assertEqual(status, 400)
+            self.assertIn("status_id", body["error"])
+        status, _ = self.api.handle("PUT", "/statuses/velma2_00001", {"status_text": 7})
+        self.assertEqual(status, 400)
+        self.status_collection.add_status.assert_not_called()
+        self.status_collection.update_status.assert_not_called()
+
+    def test_read_body(self):
+        """
+        Bodies are JSON objects; a bad length, bad UTF-8 or bad JSON is a ValueError.
+        """
+        self.assertEqual(read_body("2", io.BytesIO(b"{}")), {})
+        self.assertIsNone(read_body(None, io.BytesIO(b"")))
+        for length, data in (("ten", b"{}"), ("-1", b"{}"), ("2", b"\xff\xfe"),
+                             ("1", b"{"), ("2", b"[]")):
+            with self.assertRaises(ValueError):
+                read_body(length, io.BytesIO(data))
+
+    def test_backpressure(self):
+        """
+        With every slot taken, new requests are rejected with 503.
+        """
+        release = threading.Event()
+        self.user_collection.search_user.side_effect = lambda _: release.wait(5) and None
+        workers = [threading.Thread(target=self.api.handle, args=("GET", "/users/velma2"))
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        deadline = time.monotonic() + 5
+        while self.user_collection.search_user.call_count < 2:
+            self.assertLess(time.monotonic(), deadline, "workers never reached the database")
+            time.sleep(0.001)
+        self.assertEqual(self.api.handle("GET", "/users/velma2")[0], 503)
+        release.set()
+        for worker in workers:
+            worker.join()
+
+    def test_rate_limited_put_charges_stored_owner(self):
+        """
+        PUT /statuses/<id> is charged to the user the status is stored under,
+        whatever the status_id says.
+        """
+        limiter = MagicMock()
+        limiter.allow.return_value = False
+        self.status_collection.status_user.return_value = "velma2"
+        api = SocialNetworkAPI(self.user_collection, self.status_collection,
+                               rate_limiter=limiter)
+        status, _ = api.handle("PUT", "/statuses/shaggy_00001", {"status_text": "Zoinks!"})
+        self.assertEqual(status, 429)
+        limiter.allow.assert_called_with("velma2")
+        self.status_collection.update_status.assert_not_called()
+
+    def test_rate_limited_post(self):
+        """
+        Posting over the limit is a 429 and never reaches the collections.
+        """
+        limiter = MagicMock()
+        limiter.allow.return_value = False
+        api = SocialNetworkAPI(self.user_collection, self.status_collection,
+                               rate_limiter=limiter)
+        status, _ = api.handle("POST", "/statuses", {
+            "status_id": "velma2_00001", "user_id": "velma2", "status_text": "Jinkies!"})
+        self.assertEqual(status, 429)
+        self.user_collection.existing_user_ids.assert_not_called()
@@ -0,0 +1,154 @@
+"""
+Unit testing the NDJSON batch runner with mocked collections
+"""
+import io
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from pymongo.errors import OperationFailure
+
+from batch import BatchRunner, percentile
+
+
+class TestBatchRunner(TestCase):
+    """
+    Testing that runs of adds are batched and every op is accounted for.
+    """
+    def setUp(self):
+        """
+        Mock both collections; only velma2 exists in the users table.
+        """
+        self.user_collection = MagicMock()
+        self.user_collection.add_users_codes.side_effect = lambda rows: [None] * len(rows)
+        self.user_collection.existing_user_ids.return_value = {"velma2"}
+        self.status_collection = MagicMock(routed=False)
+        self.status_collection.add_statuses_codes.side_effect = lambda rows: [None] * len(rows)
+        self.runner = BatchRunner(self.user_collection, self.status_collection)
+
+    @staticmethod
+    def lines(*operations):
+        """
+        Encodes operations as NDJSON lines.
+        """
+        return [json.dumps(operation) for operation in operations]
+
+    def test_consecutive_adds_are_one_bulk_write(self):
+        """
+        Three add_status lines should produce a single add_statuses_codes call.
+        """
+        self.runner.run(self.lines(
+            *({"op": "add_status", "status_id": f"velma2_0000{n}", "user_id": "velma2",
+               "status_text": "Jinkies!"} for n in range(3))))
+        self.assertEqual(self.status_collection.add_statuses_codes.call_count, 1)
+        self.assertEqual(len(self.runner.latencies["add_status"]), 3)
+
+    def test_status_for_unknown_user_fails(self):
+        """
+        Statuses of users that don't exist are not inserted and count as failures.
+        """
+        self.runner.run(self.lines(
+            {"op": "add_status", "status_id": "velma2_00001", "user_id": "velma2",
+             "status_text": "Jinkies!"},
+            {"op": "add_status", "status_id": "shaggy_00001", "user_id": "shaggy",
+             "status_text": "Zoinks!"}))
+        self.status_collection.add_statuses_codes.assert_called_with(
+            [("velma2_00001", "velma2", "Jinkies!")])
+        self.assertEqual(self.runner.failures["add_status"], 1)
+
+    def test_other_ops_flush_the_batch(self):
+        """
+        A non-add op between adds splits them into two bulk writes.
+        """
+        add = {"op": "add_user", "user_id": "velma2", "first_name": "Velma",
+               "last_name": "Dinkley", "email": "velma2@gmail.com"}
+        self.runner.run(self.lines(add, {"op": "search_user", "user_id": "velma2"}, add))
+        self.assertEqual(self.user_collection.add_users_codes.call_count, 2)
+        self.user_collection.search_user.assert_called_with("velma2")
+
+    def test_invalid_and_unknown_lines(self):
+        """
+        Bad JSON and unknown ops are counted, not raised.
+        """
+        self.runner.run(["not json", json.dumps({"op": "launch_rocket"}), ""])
+        self.assertEqual(self.runner.failures, {"invalid": 1, "unknown": 1})
+
+    def test_failed_batch_does_not_stop_the_run(self):
+        """
+        A batch the server rejects as a whole fails with the server's code,
+        and the operations after it still run.
+        """
+        self.user_collection.add_users_codes.side_effect = OperationFailure("no", code=121)
+        add = {"op": "add_user", "user_id": "velma2", "first_name": "Velma",
+               "last_name": "Dinkley", "email": "velma2@gmail.com"}
+        self.runner.run(self.lines(add, {"op": "delete_status", "status_id": "velma2_00001"}))
+        self.assertEqual(self.runner.failed, [(add, 121)])
+        self.status_collection.delete_status.assert_called_with("velma2_00001")
+
+    def test_refused_rows_fail_with_their_code(self):
+        """
+        Rows the server refuses in a bulk insert fail with its code per row:
+        11000 for a duplicate, 121 for a schema violation.
+        """
+        self.user_collection.add_users_codes.side_effect = None
+        self.user_collection.add_users_codes.return_value = [None, 11000, 121]
+        adds = [{"op": "add_user", "user_id": user_id, "first_name": "Velma",
+                 "last_name": "Dinkley", "email": "velma2@gmail.com"}
+                for user_id in ("velma3", "velma2", "")]
+        self.runner.run(self.lines(*adds))
+        self.assertEqual(self.runner.failed, [(adds[1], 11000), (adds[2], 121)])
+
+    def test_rejected_update_fails(self):
+        """
+        An update_user the users schema refuses is failed as "rejected".
+        """
+        self.user_collection.update_user.return_value = False
+        update = {"op": "update_user", "user_id": "velma2", "first_name": "Velma",
+                  "last_name": "Dinkley", "email": "velma2"}
+        self.runner.run(self.lines(update))
+        self.assertEqual(self.runner.failures, {"update_user": 1})
+        self.assertEqual(self.runner.failed, [(update, "rejected")])
+
+    def test_routed_owner_mismatch_fails_only_that_status(self):
+        """
+        On a routed collection a status whose id names another user is failed
+        up front, and the rest of its batch is inserted.
+        """
+        self.status_collection.routed = True
+        good = {"op": "add_status", "status_id": "velma2_00001", "user_id": "velma2",
+                "status_text": "Jinkies!"}
+        bad = {"op": "add_status", "status_id": "shaggy_00001", "user_id": "velma2",
+               "status_text": "Zoinks!"}
+        self.runner.run(self.lines(good, bad))
+        self.status_collection.add_statuses_codes.assert_called_with(
+            [("velma2_00001", "velma2", "Jinkies!")])
+        self.assertEqual(self.runner.failed, [(bad, "owner_mismatch")])
+
+    def test_write_failed(self):
+        """
+        Failed operations are written back as NDJSON with their error code.
+        """
+        self.runner.run(["not json", json.dumps({"op": "add_user", "user_id": "velma2"})])
+        out = io.StringIO()
+        self.runner.write_failed(out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()],
+                         [{"line": "not json", "error": "invalid_json"},
+                          {"op": "add_user", "user_id": "velma2", "error": "missing_fields"}])
+
+    def test_report(self):
+        """
+        The report lists each op and the totals.
+        """
+        self.runner.run(self.lines({"op": "delete_status", "status_id": "velma2_00001"}))
+        out = io.StringIO()
+        self.runner.report(1.0, out)
+        self.assertIn("delete_status", out.getvalue())
+        self.assertIn("1 operations", out.getvalue())
+
+    def test_percentile(self):
+        """
+        Nearest-rank percentiles.
+        """
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 99), 4)
+        self.assertEqual(percentile([], 50), 0.0)
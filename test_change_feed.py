@@ -0,0 +1,196 @@
+"""
+Unit testing the ChangeFeed class
+"""
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from bson.timestamp import Timestamp
+from pymongo.errors import OperationFailure
+
+from change_feed import ChangeFeed
+
+
+class Cursor(list):
+    """
+    Just enough of a pymongo cursor for the polling queries.
+    """
+    def sort(self, key, direction):
+        """
+        Sorts ascending on key.
+        """
+        del direction
+        return Cursor(sorted(self, key=lambda document: document[key]))
+
+
+class TestChangeFeed(TestCase):
+    """
+    Testing the polling fallback and event publishing with a mocked database,
+    so no replica set is needed.
+    """
+    def setUp(self):
+        """
+        Seed a fake users collection with two users and subscribe a collector.
+        """
+        self.now = datetime(2026, 10, 19, 12, 0, 0)
+        self.users = {"jerry.tom1": self.user("jerry.tom1", "Jerry", -60),
+                      "scooby.doo1": self.user("scooby.doo1", "Scooby", -60)}
+        self.database = MagicMock()
+        self.database["users"].find.side_effect = self.find
+        self.feed = ChangeFeed(self.database, collections=("users",), sweep_interval=0)
+        self.feed.watched["users"].watermark = self.now
+        self.events = []
+        self.feed.subscribe(self.events.append)
+        self.feed.poll_once()
+
+    def user(self, user_id, name, seconds, created=None):
+        """
+        A user document written seconds from self.now.
+        """
+        modified_at = self.now + timedelta(seconds=seconds)
+        created_at = modified_at if created is None else self.now + timedelta(seconds=created)
+        return {"_id": user_id, "NAME": name, "CREATED_AT": created_at,
+                "MODIFIED_AT": modified_at}
+
+    def find(self, query, projection=None, **_):
+        """
+        Answers the MODIFIED_AT poll and the _id sweep from self.users.
+        """
+        del projection
+        if "MODIFIED_AT" in query:
+            since = query["MODIFIED_AT"]["$gt"]
+            return Cursor(document for document in self.users.values()
+                          if document["MODIFIED_AT"] > since)
+        return Cursor({"_id": key} for key in self.users)
+
+    def test_poll_once_no_changes(self):
+        """
+        Nothing changed, so nothing should be published.
+        """
+        self.assertEqual(self.feed.poll_once(), 0)
+        self.assertEqual(self.events, [])
+
+    def test_poll_once_insert_update_delete(self):
+        """
+        The poll should publish one event per insert, update and delete.
+        """
+        self.users["jerry.tom1"] = self.user("jerry.tom1", "Jerome", 5, created=-60)
+        self.users["velma2"] = self.user("velma2", "Velma", 6)
+        del self.users["scooby.doo1"]
+        self.assertEqual(self.feed.poll_once(), 3)
+        operations = {(event["operation"], event["_id"]) for event in self.events}
+        self.assertEqual(operations, {("update", "jerry.tom1"), ("insert", "velma2"),
+                                      ("delete", "scooby.doo1")})
+
+    def test_backdated_insert_is_an_insert(self):
+        """
+        A new document whose CREATED_AT was backdated is still published as
+        an insert; a known one with matching stamps is an update.
+        """
+        self.users["velma2"] = self.user("velma2", "Velma", 5, created=-3600)
+        self.users["jerry.tom1"] = self.user("jerry.tom1", "Jerome", 6)
+        self.feed.poll_once()
+        operations = {(event["operation"], event["_id"]) for event in self.events}
+        self.assertEqual(operations, {("insert", "velma2"), ("update", "jerry.tom1")})
+
+    def test_poll_reads_only_past_the_watermark(self):
+        """
+        Each poll asks for the writes since the last one, and a write seen
+        again inside the lookback is not published twice.
+        """
+        self.users["velma2"] = self.user("velma2", "Velma", 5)
+        self.feed.poll_once()
+        self.assertEqual(self.feed.poll_once(), 0)
+        self.assertEqual(len(self.events), 1)
+        query = self.database["users"].find.call_args_list[-2].args[0]
+        self.assertEqual(query, {"MODIFIED_AT": {"$gt": self.now + timedelta(seconds=3)}})
+
+    def test_late_stamp_inside_lookback(self):
+        """
+        A write stamped a little behind the watermark by a lagging clock is
+        still published.
+        """
+        self.users["velma2"] = self.user("velma2", "Velma", 5)
+        self.feed.poll_once()
+        self.users["shaggy"] = self.user("shaggy", "Norville", 4)
+        self.assertEqual(self.feed.poll_once(), 1)
+
+    def test_unresumable_stream_falls_back_from_last_event(self):
+        """
+        When the stream's history is lost, polling picks up from the time of
+        the last event, not from a fresh snapshot, so the gap isn't lost.
+        """
+        stream = MagicMock(alive=True, resume_token={"_data": "token"})
+        seen = Timestamp(self.now + timedelta(seconds=10), 1)
+        stream.try_next.side_effect = [
+            {"operationType": "insert", "ns": {"coll": "users"}, "clusterTime": seen,
+             "documentKey": {"_id": "velma2"}, "fullDocument": self.user("velma2", "Velma", 10)},
+            OperationFailure("history lost", code=286)]
+        self.database.watch.return_value.__enter__.return_value = stream
+        with self.assertRaises(OperationFailure):
+            self.feed.watch()
+        self.users["velma2"] = self.user("velma2", "Velma", 10)
+        self.users["shaggy"] = self.user("shaggy", "Norville", 20)
+        self.events.clear()
+        self.feed.poll_once()
+        self.assertEqual([event["_id"] for event in self.events], ["shaggy"])
+
+    def test_stream_forgets_old_writes(self):
+        """
+        A long-running stream only remembers the writes within LOOKBACK of
+        its watermark, not every document it ever saw.
+        """
+        for second in range(1000):
+            document = self.user(f'user{second}', "Velma", second)
+            self.feed.advance({"collection": "users", "operation": "insert",
+                               "_id": document["_id"], "document": document},
+                              Timestamp(document["MODIFIED_AT"], 1))
+        published = self.feed.watched["users"].published
+        self.assertLessEqual(len(published), 3)
+        self.assertIn("user999", published)
+
+    def test_stream_resumes_after_server_error(self):
+        """
+        A resumable server error mid-stream resumes from the last token.
+        """
+        self.feed.schedule.poll_interval = 0
+        self.feed.resume_token = {"_data": "token"}
+        stream = MagicMock(alive=True)
+        stream.try_next.side_effect = OperationFailure("interrupted", code=11601)
+        self.database.watch.return_value.__enter__.return_value = stream
+
+        def resumed(*_, **kwargs):
+            self.assertEqual(kwargs["resume_after"], {"_data": "token"})
+            if self.database.watch.call_count == 2:
+                self.feed.stop()
+            return self.database.watch.return_value
+        self.database.watch.side_effect = resumed
+        self.feed.watch()
+        self.assertEqual(self.database.watch.call_count, 2)
+
+    def test_failing_subscriber_does_not_block_others(self):
+        """
+        A subscriber that raises should not stop the others receiving events.
+        """
+        self.feed.subscribe(MagicMock(side_effect=ValueError), "users")
+        later = []
+        self.feed.subscribe(later.append, "users")
+        self.feed.publish({"collection": "users", "operation": "delete",
+                           "_id": "jerry.tom1", "document": None})
+        self.assertEqual(len(later), 1)
+
+    def test_to_event_maps_replace_to_update(self):
+        """
+        A replace from the change stream is published as an update.
+        """
+        change = {"operationType": "replace", "ns": {"db": "UserStatuses", "coll": "status"},
+                  "documentKey": {"_id": "velma2_00002"}, "fullDocument": {"_id": "velma2_00002"}}
+        event = ChangeFeed.to_event(change)
+        self.assertEqual(event["operation"], "update")
+        self.assertEqual(event["collection"], "status")
+
+    def test_to_event_ignores_drop(self):
+        """
+        Drops are not published.
+        """
+        self.assertIsNone(ChangeFeed.to_event({"operationType": "drop"}))
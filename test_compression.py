@@ -0,0 +1,50 @@
+"""
+Unit testing the compression profiles
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from socialnetwork_model import (client_options, block_compressor, install_validator,
+                                 USER_SCHEMA)
+
+
+class TestCompressionProfiles(TestCase):
+    """
+    Testing client options and collection creation for each profile.
+    """
+    def test_default_profile_changes_nothing(self):
+        """
+        The default profile keeps the server's defaults.
+        """
+        self.assertEqual(client_options("default"), {})
+        self.assertIsNone(block_compressor("default"))
+
+    def test_wire_compressors(self):
+        """
+        zlib ships with Python, so its profile always compresses the wire.
+        """
+        self.assertEqual(client_options("zlib"), {"compressors": "zlib"})
+
+    def test_missing_module_skipped(self):
+        """
+        A compressor whose package isn't installed is left out.
+        """
+        with patch("importlib.util.find_spec", return_value=None):
+            self.assertEqual(client_options("zstd"), {})
+
+    def test_unknown_profile(self):
+        """
+        A typo in SOCIALNETWORK_COMPRESSION fails loudly.
+        """
+        with self.assertRaises(ValueError):
+            client_options("lz4")
+
+    def test_new_collection_gets_block_compressor(self):
+        """
+        install_validator creates a missing collection with the compressor.
+        """
+        database = MagicMock()
+        database.list_collection_names.return_value = []
+        install_validator(database, "users", USER_SCHEMA, "zstd")
+        self.assertEqual(database.create_collection.call_args.kwargs["storageEngine"],
+                         {"wiredTiger": {"configString": "block_compressor=zstd"}})
@@ -0,0 +1,280 @@
+"""
+Unit testing the incremental CSV import
+"""
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from delta_import import (DeltaImporter, USER_FIELDS, read_documents, row_hash,
+                          status_importer, user_importer)
+from status_blobs import StatusBlobCollection, text_ref
+from user_status import StatusCollection
+
+ACCOUNTS = [("evmiles97", "Eve", "Miles", "eve.miles@uw.edu"),
+            ("dave03", "David", "Yuen", "david.yuen@gmail.com"),
+            ("velma2", "Velma", "Dinkley", "velma@mystery.inc")]
+
+
+def write_accounts(directory, rows, name="accounts.csv"):
+    """
+    Writes an accounts export and returns its path.
+    """
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding="utf-8", newline="") as file:
+        file.write("USER_ID,NAME,LASTNAME,EMAIL\n")
+        for row in rows:
+            file.write(",".join(row) + "\n")
+    return path
+
+
+def imported(path):
+    """
+    The {_id: ROW_HASH} a collection holds after a full import of path.
+    """
+    return {key: digest for key, (_, digest) in read_documents(path, USER_FIELDS).items()}
+
+
+def stand_in(collection, stored):
+    """
+    Makes a mock collection answer the importer's reads from stored
+    ({_id: ROW_HASH}) and report every bulk write operation as applied.
+    """
+    def find(query, projection=None, **_):
+        del projection
+        keys = query["_id"]["$in"] if "_id" in query else list(stored)
+        return [{"_id": key, "ROW_HASH": stored[key]} for key in keys if key in stored]
+
+    def bulk_write(operations, ordered=True):
+        del ordered
+        kinds = [type(operation).__name__ for operation in operations]
+        return MagicMock(bulk_api_result={"nInserted": kinds.count("InsertOne"),
+                                          "nMatched": kinds.count("UpdateOne"),
+                                          "nRemoved": kinds.count("DeleteOne")})
+
+    collection.find.side_effect = find
+    collection.bulk_write.side_effect = bulk_write
+    return collection
+
+
+def sent_operations(collection):
+    """
+    The operations of every bulk_write sent to a mock collection.
+    """
+    return [operation for call in collection.bulk_write.call_args_list
+            for operation in call.args[0]]
+
+
+class TestDeltaImporter(TestCase):
+    """
+    Testing the hash diff and the bulk writes it sends, against mocks.
+    """
+    def setUp(self):
+        """
+        A scratch directory holding the previous export.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.previous = write_accounts(self.directory, ACCOUNTS, "previous.csv")
+        self.stored = imported(self.previous)
+        self.user_collection = MagicMock()
+        stand_in(self.user_collection.database, self.stored)
+
+    def test_missing_column(self):
+        """
+        An export without one of the columns is reported by name, before
+        anything is written.
+        """
+        path = os.path.join(self.directory, "no_email.csv")
+        with open(path, 'w', encoding="utf-8", newline="") as file:
+            file.write("USER_ID,NAME,LASTNAME\nvelma2,Velma,Dinkley\n")
+        with self.assertRaisesRegex(ValueError, "Missing column in .*: EMAIL"):
+            user_importer(self.user_collection).sync(path)
+        self.user_collection.database.bulk_write.assert_not_called()
+
+    def test_unchanged_export_writes_nothing(self):
+        """
+        Re-importing the same export is only a read.
+        """
+        result = user_importer(self.user_collection).sync(self.previous)
+        self.assertEqual(result.writes(), 0)
+        self.assertEqual(result.unchanged, 3)
+        self.user_collection.database.bulk_write.assert_not_called()
+
+    def test_only_changes_written(self):
+        """
+        One changed, one new and one dropped row give exactly three writes.
+        """
+        path = write_accounts(self.directory, [
+            ACCOUNTS[0], ("dave03", "David", "Yuen", "dave@yuen.dev"),
+            ("shaggy", "Norville", "Rogers", "shaggy@mystery.inc")])
+        result = user_importer(self.user_collection).sync(path)
+        self.assertEqual((result.inserted, result.updated, result.deleted, result.unchanged),
+                         (1, 1, 1, 1))
+        sent = sent_operations(self.user_collection.database)
+        self.assertEqual([type(operation).__name__ for operation in sent],
+                         ["InsertOne", "UpdateOne", "DeleteOne"])
+        for call in self.user_collection.database.bulk_write.call_args_list:
+            self.assertFalse(call.kwargs["ordered"])
+
+    def test_batches(self):
+        """
+        Writes go out in bulk writes of at most batch_size operations.
+        """
+        self.stored.clear()
+        result = user_importer(self.user_collection, batch_size=2).sync(self.previous)
+        self.assertEqual(result.inserted, 3)
+        self.assertEqual([len(call.args[0]) for call in
+                          self.user_collection.database.bulk_write.call_args_list], [2, 1])
+
+    def test_dry_run(self):
+        """
+        A dry run counts the changes without writing them.
+        """
+        path = write_accounts(self.directory, ACCOUNTS[:2])
+        result = user_importer(self.user_collection).sync(path, dry_run=True)
+        self.assertEqual(result.deleted, 1)
+        self.user_collection.database.bulk_write.assert_not_called()
+
+    def test_deleted_users_take_their_statuses(self):
+        """
+        A user dropped from the export is deleted with their statuses.
+        """
+        status_collection = MagicMock()
+        path = write_accounts(self.directory, ACCOUNTS[:2])
+        user_importer(self.user_collection, status_collection).sync(path)
+        status_collection.delete_statuses_by_user.assert_called_once_with("velma2")
+
+    def test_rejected_rows_counted(self):
+        """
+        Rows the schema rejects are counted and the rest still go through.
+        """
+        self.stored.clear()
+        self.user_collection.database.bulk_write.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 121}], "nInserted": 2, "nMatched": 0,
+             "nRemoved": 0})
+        result = user_importer(self.user_collection).sync(self.previous)
+        self.assertEqual((result.inserted, result.rejected), (2, 1))
+
+    def test_manifest_skips_database_read(self):
+        """
+        With a manifest the imported hashes come from the last sync, and a
+        rejected insert is retried next time.
+        """
+        manifest = os.path.join(self.directory, "users.json")
+        stored = {}
+        collection = stand_in(MagicMock(), stored)
+        collection.bulk_write.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 2, "code": 121}], "nInserted": 2, "nMatched": 0,
+             "nRemoved": 0})
+        DeltaImporter(collection, USER_FIELDS, manifest_path=manifest).sync(self.previous)
+        stored.update(imported(self.previous))
+        del stored["velma2"]
+        stand_in(collection, stored)
+        collection.find.reset_mock()
+
+        result = DeltaImporter(collection, USER_FIELDS, manifest_path=manifest).sync(self.previous)
+        self.assertEqual(collection.find.call_args.args[0], {})
+        self.assertEqual(collection.find.call_args.kwargs["hint"], [("_id", 1)])
+        self.assertEqual((result.inserted, result.unchanged), (1, 2))
+
+    def test_manifest_row_removed_out_of_band(self):
+        """
+        A manifest row whose document was deleted through the app is
+        imported again instead of staying "unchanged" for ever.
+        """
+        manifest = os.path.join(self.directory, "users.json")
+        user_importer(self.user_collection, manifest_path=manifest).sync(self.previous)
+        del self.stored["dave03"]
+        result = user_importer(self.user_collection, manifest_path=manifest).sync(self.previous)
+        self.assertEqual((result.inserted, result.unchanged), (1, 2))
+
+    def test_writes_matching_nothing_not_counted(self):
+        """
+        Changed or dropped rows whose document has gone meanwhile are not
+        counted, don't reach on_written, and drop out of the manifest.
+        """
+        manifest = os.path.join(self.directory, "users.json")
+        user_importer(self.user_collection, manifest_path=manifest).sync(self.previous)
+        path = write_accounts(self.directory, [
+            ACCOUNTS[0], ("dave03", "David", "Yuen", "dave@yuen.dev")])
+        status_collection = MagicMock()
+        importer = user_importer(self.user_collection, status_collection,
+                                 manifest_path=manifest)
+        importer.imported_hashes = lambda: imported(self.previous)
+        del self.stored["dave03"], self.stored["velma2"]
+        result = importer.sync(path)
+        self.assertEqual((result.updated, result.deleted, result.missing), (0, 0, 2))
+        status_collection.delete_statuses_by_user.assert_not_called()
+        with open(manifest, 'r', encoding="utf-8") as file:
+            self.assertEqual(list(json.load(file)), ["evmiles97"])
+
+    def test_update_racing_a_delete(self):
+        """
+        An update the server matched nothing for is found by re-reading.
+        """
+        path = write_accounts(self.directory, [
+            ACCOUNTS[0], ("dave03", "David", "Yuen", "dave@yuen.dev"), ACCOUNTS[2]])
+        importer = user_importer(self.user_collection)
+        importer.imported_hashes = lambda: imported(self.previous)
+        importer.present = set
+        self.user_collection.database.bulk_write.side_effect = None
+        self.user_collection.database.bulk_write.return_value = MagicMock(
+            bulk_api_result={"nInserted": 0, "nMatched": 0, "nRemoved": 0})
+        del self.stored["dave03"]
+        result = importer.sync(path)
+        self.assertEqual((result.updated, result.missing), (0, 1))
+
+
+class TestStatusImporter(TestCase):
+    """
+    Testing that status syncs keep CREATED_AT, blobs and tags consistent.
+    """
+    def setUp(self):
+        """
+        A status export with two statuses.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "status_updates.csv")
+        with open(self.path, 'w', encoding="utf-8", newline="") as file:
+            file.write("STATUS_ID,USER_ID,STATUS_TEXT\n"
+                       "velma2_00001,velma2,Jinkies! #mystery\n"
+                       "velma2_00002,velma2,Zoinks\n")
+
+    def test_new_statuses_indexed(self):
+        """
+        Inserted statuses get CREATED_AT and their tags indexed.
+        """
+        status_collection = StatusCollection(MagicMock(), tags=MagicMock(), resilience=None)
+        stand_in(status_collection.database, {})
+        status_importer(status_collection).sync(self.path)
+        self.assertIn("'CREATED_AT'", repr(sent_operations(status_collection.database)[0]))
+        self.assertEqual(status_collection.tags.index_statuses.call_args.args[0][0],
+                         ("velma2_00001", "velma2", "Jinkies! #mystery"))
+
+    def test_changed_text_moves_to_blob(self):
+        """
+        With blobs, an updated text is stored by reference and the stale
+        inline field unset.
+        """
+        blobs = StatusBlobCollection(MagicMock(), min_length=0)
+        status_collection = StatusCollection(MagicMock(), blobs=blobs, resilience=None)
+        stand_in(status_collection.database, {"velma2_00001": b"stale"})
+        moment = datetime(2026, 10, 19, tzinfo=timezone.utc)
+        with patch("delta_import.datetime") as clock:
+            clock.now.return_value = moment
+            status_importer(status_collection).sync(self.path)
+        text = "Jinkies! #mystery"
+        self.assertIn(UpdateOne(
+            {"_id": "velma2_00001", "ROW_HASH": {"$exists": True}},
+            {"$set": {"USER_ID": "velma2", "STATUS_TEXT_REF": text_ref(text),
+                      "ROW_HASH": row_hash(["velma2_00001", "velma2", text]),
+                      "MODIFIED_AT": moment},
+             "$unset": {"STATUS_TEXT": ""}}), sent_operations(status_collection.database))
@@ -0,0 +1,60 @@
+"""
+Unit testing the structured, sampled operation records
+"""
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from loguru import logger
+
+import log_config
+from users import UserCollection
+
+
+class TestTimed(TestCase):
+    """
+    Testing log_config.timed against an in-memory JSON sink.
+    """
+    def setUp(self):
+        """
+        Log every record, as JSON, to self.records only.
+        """
+        self.records = []
+        log_config.configure(log_file=None, stderr_level="CRITICAL", sample_rate=1.0,
+                             enqueue=False, force=True)
+        logger.add(lambda message: self.records.append(json.loads(message)),
+                   level="DEBUG", serialize=True)
+
+    def tearDown(self):
+        """
+        Drop the test sinks.
+        """
+        log_config.disable()
+
+    def test_operation_record(self):
+        """
+        A collection call is logged once with its name, id and duration.
+        """
+        users = UserCollection(MagicMock(), resilience=None)
+        users.user_exists("velma2")
+        self.assertEqual(len(self.records), 1)
+        extra = self.records[0]["record"]["extra"]
+        self.assertEqual(extra["operation"], "UserCollection.user_exists")
+        self.assertEqual(extra["id"], "velma2")
+        self.assertGreaterEqual(extra["duration_ms"], 0)
+
+    def test_failures_always_logged(self):
+        """
+        With sampling at zero, successes are dropped but failures are not.
+        """
+        log_config.configure(log_file=None, stderr_level="CRITICAL", sample_rate=0.0,
+                             enqueue=False, force=True)
+        logger.add(lambda message: self.records.append(json.loads(message)),
+                   level="DEBUG", serialize=True)
+        with log_config.timed("quiet"):
+            pass
+        with self.assertRaises(KeyError):
+            with log_config.timed("loud", id="velma2"):
+                raise KeyError("velma2")
+        self.assertEqual(len(self.records), 1)
+        self.assertEqual(self.records[0]["record"]["extra"]["error"], "KeyError")
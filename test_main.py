@@ -20,30 +20,35 @@ import io
 from unittest import TestCase
 from unittest.mock import MagicMock, patch, mock_open
 
+import pytest
+
 import main
 import user_status
 import users
-from socialnetwork_model import database
+from test_model import test_database as database, test_tenant
 
 
 class TestMain(TestCase):
     """
     Creating a test class for main menu
     """
+    @pytest.mark.mongo
     def test_init_user_collection(self):
         """
         Testing the function that creates a user collection instance
         """
         expected = type(users.UserCollection(database))
-        self.assertEqual(type(main.init_user_collection()), expected)
+        self.assertEqual(type(main.init_user_collection(test_tenant)), expected)
 
+    @pytest.mark.mongo
     def test_init_status_collection(self):
         """
         Testing the function that creates a status collection instance
         """
-        expected = type(user_status.UserStatusCollection(database))
-        self.assertEqual(type(main.init_status_collection()), expected)
+        expected = type(user_status.StatusCollection(database))
+        self.assertEqual(type(main.init_status_collection(tenant=test_tenant)), expected)
 
+    @pytest.mark.mongo
     def test_load_account_csv_to_db_success(self):
         """
         Testing loading csv data to UsersTable in database.
@@ -70,12 +75,13 @@ class TestMain(TestCase):
                                  ['Detailed error message:'])  # the error message cuts
                 # out for some reason
 
+    @pytest.mark.mongo
     def test_load_status_csv_to_db_success(self):
         """
         Testing loading status data to UserStatusTable in database.
         Caution: It will actually write to the database.
         """
-        test_status_collection = user_status.UserStatusCollection(database)
+        test_status_collection = user_status.StatusCollection(database)
         # I actually created a test file so I could check the database UserStatusTable
         # in my database to verify it works
         self.assertTrue(main.load_status_csv_to_db('test_main_load_status_file.csv',
@@ -284,6 +290,36 @@ class TestMain(TestCase):
         # Verify that main.search_status also returns None
         self.assertIsNone(main.search_status(mock_status.status_id, status_collection))
 
+    def test_search_status_owner_soft_deleted(self):
+        """
+        A status whose owner is soft-deleted is reported as missing.
+        """
+        status_collection = user_status.StatusCollection(MagicMock(), resilience=None,
+                                                         users=MagicMock())
+        status_collection.search_reads.find_one.return_value = {"USER_ID": "velma2"}
+        status_collection.users.is_soft_deleted.return_value = True
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertIsNone(main.search_status("velma2_00001", status_collection))
+        self.assertEqual(mock_stdout.getvalue(), 'velma2_00001 does not exist.\n')
+
+    def test_search_statuses_by_tag_one_query(self):
+        """
+        The page is fetched with one search_statuses call; a tag entry left
+        behind by a deleted status is skipped.
+        """
+        status_collection = MagicMock()
+        status_collection.tags.statuses_with_tag.return_value = (
+            ["velma2_00001", "velma2_00002"], None)
+        status_collection.search_statuses.return_value = [
+            {"_id": "velma2_00002", "USER_ID": "velma2", "STATUS_TEXT": "#jinkies"}]
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            main.search_statuses_by_tag("#jinkies", status_collection)
+        self.assertEqual(mock_stdout.getvalue().splitlines(),
+                         ['#velma2_00002: velma2 wrote "#jinkies"'])
+        status_collection.search_statuses.assert_called_once_with(
+            ["velma2_00001", "velma2_00002"], {"USER_ID": 1, "STATUS_TEXT": 1})
+        status_collection.search_status.assert_not_called()
+
     def test_delete_status_success(self):
         """
         Mocking delete_status in main.py
@@ -346,3 +382,93 @@ class TestMain(TestCase):
         # Verify that main.delete_status also returns None
         self.assertIsNone(main.update_status(mock_status.status_id, mock_status.status_text,
                                             status_collection))
+
+    def test_stream_statuses_in_chunks(self):
+        """
+        Mocking a heavy user's cursor: stream_statuses writes every status
+        in chunks, asks for big batches and closes the cursor.
+        """
+        status_collection = MagicMock()
+        cursor = MagicMock()
+        cursor.__iter__.return_value = iter(
+            [{"_id": f"velma2_{n}", "USER_ID": "velma2", "STATUS_TEXT": "Jinkies!"}
+             for n in range(5)])
+        status_collection.search_status_by_id.return_value = cursor
+        out = io.StringIO()
+        out.write = MagicMock(wraps=out.write)
+        self.assertEqual(main.stream_statuses("velma2", status_collection, out,
+                                              batch_size=1000, chunk_size=2), 5)
+        self.assertEqual(out.write.call_count, 3)
+        self.assertIn('#velma2_4: velma2 wrote "Jinkies!"', out.getvalue())
+        self.assertEqual(status_collection.search_status_by_id.call_args.kwargs["batch_size"],
+                         1000)
+        cursor.close.assert_called_once()
+
+    def test_add_status_routed_owner_mismatch(self):
+        """
+        A routed status collection refusing a status_id that names another
+        user is reported, not raised.
+        """
+        user_collection = MagicMock()
+        status_collection = MagicMock()
+        status_collection.add_status.side_effect = ValueError("shaggy_00001 does not belong")
+        with patch('sys.stdout', new_callable=io.StringIO) as out:
+            main.add_status("shaggy_00001", "velma2", "Zoinks!",
+                            user_collection, status_collection)
+        self.assertIn("must start with velma2_", out.getvalue())
+
+    def test_load_status_routed_skips_owner_mismatch(self):
+        """
+        Rows a routed status collection can't take are skipped and counted,
+        and the rest of the file is loaded.
+        """
+        status_collection = MagicMock(routed=True)
+        status_collection.add_statuses.side_effect = lambda rows: [True] * len(rows)
+        csv = ("STATUS_ID,USER_ID,STATUS_TEXT\n"
+               "velma2_00001,velma2,Jinkies!\n"
+               "shaggy_00001,velma2,Zoinks!\n")
+        with patch('builtins.open', mock_open(read_data=csv)), \
+                patch('sys.stdout', new_callable=io.StringIO) as out:
+            main.load_status("status.csv", status_collection)
+        status_collection.add_statuses.assert_called_once_with(
+            [("velma2_00001", "velma2", "Jinkies!")])
+        self.assertIn("Skipped 1 statuses", out.getvalue())
+
+    def test_search_latest_statuses_written_in_one_chunk(self):
+        """
+        The latest statuses go out through format_statuses, one write for
+        the page instead of a print per status.
+        """
+        status_collection = MagicMock()
+        status_collection.latest_statuses.return_value = iter(
+            [{"_id": f"velma2_{n}", "USER_ID": "velma2", "STATUS_TEXT": "Jinkies!"}
+             for n in range(3)])
+        out = io.StringIO()
+        out.write = MagicMock(wraps=out.write)
+        main.search_latest_statuses("velma2", 3, status_collection, out)
+        self.assertEqual(out.write.call_count, 1)
+        self.assertIn('#velma2_2: velma2 wrote "Jinkies!"', out.getvalue())
+
+    def test_search_latest_statuses_none(self):
+        """
+        A user without statuses gets a message.
+        """
+        status_collection = MagicMock()
+        status_collection.latest_statuses.return_value = iter([])
+        with patch('sys.stdout', new_callable=io.StringIO) as out:
+            main.search_latest_statuses("velma2", 3, status_collection)
+        self.assertEqual(out.getvalue(), 'velma2 has not published any statuses.\n')
+
+    def test_exit_program_leaves_the_client_open(self):
+        """
+        Quitting drops the tenant's tables if asked, exits, and leaves the
+        shared client to be closed at process exit.
+        """
+        with patch('main.router') as router, patch('builtins.input', return_value='y'):
+            with self.assertRaises(SystemExit):
+                main.exit_program(test_tenant)
+        dropped = [call.args[0] for call in router.database(test_tenant).__getitem__.call_args_list]
+        self.assertEqual(dropped, [test_tenant.users_collection, test_tenant.status_collection,
+                                   f'{test_tenant.status_collection}_tags',
+                                   f'{test_tenant.status_collection}_blobs'])
+        router.close.assert_not_called()
@@ -1,6 +1,48 @@
-from pymongo import MongoClient
+"""
+Test database shared by the test modules. Every pytest-xdist worker (and
+every plain pytest run) gets its own uniquely named database, so parallel
+runs never see each other's data; conftest.py drops it when the session ends.
+"""
+import os
+import uuid
 
+from socialnetwork_model import TenantContext, router
 
-mongo = MongoClient()
-test_database = mongo.TestDatabase
+WORKER = os.environ.get("PYTEST_XDIST_WORKER", "main")
+TEST_DATABASE_NAME = f'TestDatabase_{WORKER}_{uuid.uuid4().hex[:8]}'
 
+# One client for every worker database, through the tenant router.
+mongo = router.client()
+test_database = mongo[TEST_DATABASE_NAME]
+test_tenant = TenantContext(TEST_DATABASE_NAME)
+
+# Seed snapshots, written with one insert_many each (add_users/add_statuses)
+# instead of a round trip per row.
+USERS_SNAPSHOT = [
+    ("jerry.tom1", "Jerry", "Mouse", "jerry.tom1@gmail.com"),
+    ("scooby.doo1", "Scooby", "Doo", "scooby.doo1@gmail.com"),
+]
+
+STATUSES_SNAPSHOT = [
+    ("jerry.tom1_00001", "jerry.tom1", "Tom never saw it coming"),
+    ("scooby.doo1_00001", "scooby.doo1", "Scooby, Scooby Dooo!"),
+    ("velma2_00002", "velma2", "Jinkies!"),
+]
+
+
+class FakeClock:
+    """
+    A clock the tests move by hand, for the rate limiters, the trending
+    window and the retry policy; sleeping advances it.
+    """
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Moves the clock seconds forward instead of waiting.
+        """
+        self.now += seconds
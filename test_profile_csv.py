@@ -0,0 +1,111 @@
+"""
+Unit testing the vectorized seed CSV profiler
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from profile_csv import (STATUS_COLUMNS, STATUS_HEADER_ONLY, bad_email, duplicated, empty,
+                         profile_statuses, profile_users, read_columns, write_clean)
+
+
+class TestProfileCsv(TestCase):
+    """
+    Profiling small accounts and status files written to a temp directory.
+    """
+    def setUp(self):
+        """
+        An accounts file with one duplicate, one empty id and one bad email,
+        and a status file with one duplicate and one orphan status.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.user_file = os.path.join(self.directory, "accounts.csv")
+        self.status_file = os.path.join(self.directory, "status_updates.csv")
+        with open(self.user_file, 'w', encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\n"
+                       "jerry.tom1,jerry.tom1@gmail.com,Jerry,Mouse\n"
+                       "jerry.tom1,jerry.mouse@gmail.com,Jerry,Mouse\n"
+                       ",nobody@gmail.com,No,Body\n"
+                       "velma2,velma at gmail,Velma,Dinkley\n"
+                       "scooby.doo1,scooby.doo1@gmail.com,Scooby,Doo\n")
+        with open(self.status_file, 'w', encoding="utf-8") as file:
+            file.write("STATUS_ID,USER_ID,STATUS_TEXT\n"
+                       "jerry.tom1_00001,jerry.tom1,Tom never saw it coming\n"
+                       "jerry.tom1_00001,jerry.tom1,Tom never saw it coming\n"
+                       "velma2_00001,velma2,Jinkies!\n"
+                       "scooby.doo1_00001,scooby.doo1,Scooby Dooo!\n")
+
+    def tearDown(self):
+        """
+        Remove the temp directory.
+        """
+        shutil.rmtree(self.directory)
+
+    def test_column_checks(self):
+        """
+        The individual vectorized checks.
+        """
+        column = np.array(["a", " ", "a", "b@c", "b@@c", "@c", "b c@d"])
+        self.assertEqual(empty(column).tolist(),
+                         [False, True, False, False, False, False, False])
+        self.assertEqual(duplicated(column).tolist(),
+                         [False, False, True, False, False, False, False])
+        self.assertEqual(bad_email(column).tolist(),
+                         [True, True, True, False, True, True, True])
+        spaced = np.array(["b\vc@d", "b@c\fd", "b\u00a0c@d", "b@c\u3000"])
+        self.assertEqual(bad_email(spaced).tolist(), [True] * 4)
+
+    def test_profile_users(self):
+        """
+        One row fails each user check; two users are clean.
+        """
+        report, keep, user_ids = profile_users(self.user_file)
+        self.assertEqual(report["rows"], 5)
+        self.assertEqual(report["duplicate USER_ID"], 1)
+        self.assertEqual(report["empty USER_ID"], 1)
+        self.assertEqual(report["malformed EMAIL"], 1)
+        self.assertEqual(sorted(user_ids[keep]), ["jerry.tom1", "scooby.doo1"])
+
+    def test_profile_statuses_referential_integrity(self):
+        """
+        velma2 was rejected from the accounts, so her status is an orphan.
+        """
+        _, user_keep, user_ids = profile_users(self.user_file)
+        report, keep = profile_statuses(self.status_file, user_ids[user_keep])
+        self.assertEqual(report["duplicate STATUS_ID"], 1)
+        self.assertEqual(report["USER_ID not in accounts"], 1)
+        self.assertEqual(keep.tolist(), [True, False, False, True])
+
+    def test_write_clean(self):
+        """
+        The clean file keeps the header and only the rows that passed.
+        """
+        _, keep, _ = profile_users(self.user_file)
+        clean_path = os.path.join(self.directory, "clean.csv")
+        self.assertEqual(write_clean(self.user_file, keep, clean_path), 2)
+        with open(clean_path, 'r', encoding="utf-8") as file:
+            self.assertEqual(file.readline().strip(), "USER_ID,EMAIL,NAME,LASTNAME")
+
+    def test_missing_column(self):
+        """
+        A file without one of the expected columns is reported by name.
+        """
+        with open(self.user_file, 'w', encoding="utf-8") as file:
+            file.write("USER_ID,NAME,LASTNAME\njerry.tom1,Jerry,Mouse\n")
+        with self.assertRaisesRegex(ValueError, "Missing column .*: EMAIL"):
+            profile_users(self.user_file)
+
+    def test_status_text_checked_not_loaded(self):
+        """
+        STATUS_TEXT must be in the header, but only the id columns are read.
+        """
+        self.assertEqual(set(read_columns(self.status_file, STATUS_COLUMNS,
+                                          header_only=STATUS_HEADER_ONLY)),
+                         {"STATUS_ID", "USER_ID"})
+        with open(self.status_file, 'w', encoding="utf-8") as file:
+            file.write("STATUS_ID,USER_ID\njerry.tom1_1,jerry.tom1\n")
+        with self.assertRaisesRegex(ValueError, "Missing column .*: STATUS_TEXT"):
+            profile_statuses(self.status_file)
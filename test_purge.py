@@ -0,0 +1,58 @@
+"""
+Unit testing the background purge of soft-deleted users
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from purge import PurgeWorker
+
+
+class TestPurgeWorker(TestCase):
+    """
+    Testing the purge against mocked collections.
+    """
+    def setUp(self):
+        """
+        velma2 is soft-deleted and has 5 statuses left to purge.
+        """
+        self.user_collection = MagicMock()
+        self.user_collection.deleted_user_ids.return_value = ["velma2"]
+        self.status_collection = MagicMock()
+        self.remaining = {"velma2": 5}
+
+        def purge_batch(user_id, batch_size):
+            deleted = min(batch_size, self.remaining[user_id])
+            self.remaining[user_id] -= deleted
+            return deleted
+        self.status_collection.purge_statuses_batch.side_effect = purge_batch
+        self.worker = PurgeWorker(self.user_collection, self.status_collection,
+                                  batch_size=2, batches_per_second=1000)
+
+    def test_run_once_purges_in_batches(self):
+        """
+        Five statuses in batches of two take three delete batches, then the
+        user document goes.
+        """
+        self.assertEqual(self.worker.run_once(), {"velma2": 5})
+        self.assertEqual(self.status_collection.purge_statuses_batch.call_count, 3)
+        self.user_collection.purge_user.assert_called_once_with("velma2")
+
+    def test_pauses_after_every_batch(self):
+        """
+        Users with fewer than batch_size statuses still get a pause after
+        their batch, so many small users don't purge at full speed.
+        """
+        self.user_collection.deleted_user_ids.return_value = ["velma2", "shaggy"]
+        self.remaining.update(velma2=1, shaggy=1)
+        self.worker._stop = MagicMock()  # pylint: disable=protected-access
+        self.worker._stop.wait.return_value = False  # pylint: disable=protected-access
+        self.assertEqual(self.worker.run_once(), {"velma2": 1, "shaggy": 1})
+        self.assertEqual(self.worker._stop.wait.call_count, 2)  # pylint: disable=protected-access
+
+    def test_stop_interrupts_purge(self):
+        """
+        A stopped worker leaves the user marked deleted for the next sweep.
+        """
+        self.worker.stop()
+        self.assertEqual(self.worker.run_once(), {})
+        self.user_collection.purge_user.assert_not_called()
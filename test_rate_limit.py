@@ -0,0 +1,113 @@
+"""
+Unit testing the token bucket rate limiters
+"""
+import io
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import main
+from rate_limit import MongoTokenBucket, TokenBucket
+from test_model import FakeClock
+
+
+class TestTokenBucket(TestCase):
+    """
+    Testing the in-process limiter.
+    """
+    def setUp(self):
+        """
+        Two posts per second with bursts of three.
+        """
+        self.clock = FakeClock(100.0)
+        self.limiter = TokenBucket(rate=2, capacity=3, clock=self.clock)
+
+    def test_burst_then_reject(self):
+        """
+        A user can burst up to capacity, then gets rejected.
+        """
+        self.assertEqual([self.limiter.allow("velma2") for _ in range(4)],
+                         [True, True, True, False])
+        self.assertEqual(self.limiter.stats.as_dict()["rejected"], 1)
+
+    def test_refill(self):
+        """
+        Tokens come back at rate per second, up to capacity.
+        """
+        for _ in range(3):
+            self.limiter.allow("velma2")
+        self.clock.now += 0.5
+        self.assertTrue(self.limiter.allow("velma2"))
+        self.assertFalse(self.limiter.allow("velma2"))
+
+    def test_users_are_independent(self):
+        """
+        One user hitting the limit doesn't affect another.
+        """
+        for _ in range(4):
+            self.limiter.allow("velma2")
+        self.assertTrue(self.limiter.allow("scooby.doo1"))
+
+    def test_prune(self):
+        """
+        Buckets that have refilled are forgotten.
+        """
+        self.limiter.allow("velma2")
+        self.clock.now += 10
+        self.assertEqual(self.limiter.prune(), 1)
+        self.assertEqual(self.limiter.buckets, {})
+
+
+class TestMongoTokenBucket(TestCase):
+    """
+    Testing the shared limiter against a mocked rate_limits collection.
+    """
+    def test_one_atomic_update_per_decision(self):
+        """
+        Each decision is a single upserting find_one_and_update.
+        """
+        database = MagicMock()
+        collection = database["rate_limits"]
+        collection.find_one_and_update.return_value = {"_id": "velma2", "ALLOWED": False}
+        limiter = MongoTokenBucket(database, rate=1, capacity=5)
+        self.assertFalse(limiter.allow("velma2"))
+        args, kwargs = collection.find_one_and_update.call_args
+        self.assertEqual(args[0], {"_id": "velma2"})
+        self.assertTrue(kwargs["upsert"])
+        self.assertEqual(len(args[1]), 3)
+
+
+class TestMainRateLimiting(TestCase):
+    """
+    Over-limit posts are rejected before any collection is touched.
+    """
+    def test_posting_rejected(self):
+        """
+        main.posting_allowed turns an over-limit user away with a message.
+        """
+        limiter = MagicMock()
+        limiter.allow.return_value = False
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertFalse(main.posting_allowed("velma2", limiter))
+        self.assertIn("too fast", mock_stdout.getvalue())
+        limiter.allow.assert_called_with("velma2")
+
+    def test_posting_unlimited(self):
+        """
+        Without a limiter every post is allowed.
+        """
+        self.assertTrue(main.posting_allowed("velma2", None))
+
+    def test_update_status_keyed_by_owner(self):
+        """
+        main.update_status charges the user the status is stored under, not
+        the one its status_id names.
+        """
+        limiter = MagicMock()
+        limiter.allow.return_value = False
+        status_collection = MagicMock()
+        status_collection.status_user.return_value = "velma2"
+        with patch("sys.stdout", new_callable=io.StringIO):
+            main.update_status("shaggy_00001", "Jinkies!", status_collection, limiter)
+        status_collection.status_user.assert_called_with("shaggy_00001")
+        limiter.allow.assert_called_with("velma2")
+        status_collection.update_status.assert_not_called()
@@ -0,0 +1,208 @@
+"""
+Unit testing the retry, deadline and circuit-breaker policy with injected faults
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from pymongo.errors import (AutoReconnect, DuplicateKeyError, ExecutionTimeout,
+                            NetworkTimeout)
+
+from resilience import CircuitBreaker, CircuitOpenError, Resilience
+from test_model import FakeClock
+from user_status import StatusCollection
+from users import UserCollection
+
+
+def policy(clock, **kwargs):
+    """
+    A Resilience driven by clock, with its own breaker.
+    """
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=2, reset_timeout=10,
+                                                clock=clock))
+    return Resilience(sleep=clock.sleep, clock=clock, **kwargs)
+
+
+class TestResilience(TestCase):
+    """
+    Testing Resilience.call against functions that fail on demand.
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+        self.call = MagicMock(__name__="call")
+
+    def test_retries_transient_errors(self):
+        """
+        An idempotent call survives two network errors.
+        """
+        self.call.side_effect = [AutoReconnect("down"), NetworkTimeout("slow"), "ok"]
+        self.assertEqual(policy(self.clock, attempts=3).call(self.call), "ok")
+        self.assertEqual(self.call.call_count, 3)
+
+    def test_gives_up_after_attempts(self):
+        """
+        The last error is raised once attempts run out.
+        """
+        self.call.side_effect = AutoReconnect("down")
+        with self.assertRaises(AutoReconnect):
+            policy(self.clock, attempts=3).call(self.call)
+        self.assertEqual(self.call.call_count, 3)
+
+    def test_non_idempotent_not_retried(self):
+        """
+        A write that may have reached the server is tried only once.
+        """
+        self.call.side_effect = [AutoReconnect("down"), "ok"]
+        with self.assertRaises(AutoReconnect):
+            policy(self.clock).call(self.call, idempotent=False)
+        self.assertEqual(self.call.call_count, 1)
+
+    def test_other_errors_not_retried(self):
+        """
+        Only network errors are transient; a duplicate key is not.
+        """
+        self.call.side_effect = DuplicateKeyError("dup")
+        with self.assertRaises(DuplicateKeyError):
+            policy(self.clock).call(self.call)
+        self.assertEqual(self.call.call_count, 1)
+
+    def test_deadline_stops_retries(self):
+        """
+        No retry is attempted once its backoff would pass the deadline.
+        """
+        self.call.side_effect = AutoReconnect("down")
+        resilience = policy(self.clock, deadline=0.1, attempts=100, base_delay=1.0)
+        with self.assertRaises(AutoReconnect):
+            resilience.call(self.call)
+        self.assertLessEqual(self.clock.now, 0.1)
+
+    def test_breaker_fails_fast_then_recovers(self):
+        """
+        Two failed calls open the breaker; calls then fail without touching
+        the database until reset_timeout, when one trial call closes it.
+        """
+        resilience = policy(self.clock, attempts=1)
+        self.call.side_effect = AutoReconnect("down")
+        for _ in range(2):
+            with self.assertRaises(AutoReconnect):
+                resilience.call(self.call)
+        self.assertEqual(resilience.breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            resilience.call(self.call)
+        self.assertEqual(self.call.call_count, 2)
+
+        self.clock.now += 10
+        self.call.side_effect = None
+        self.call.return_value = "ok"
+        self.assertEqual(resilience.call(self.call), "ok")
+        self.assertEqual(resilience.breaker.state, "closed")
+
+    def test_failed_trial_reopens(self):
+        """
+        A failing half-open trial opens the breaker for another reset_timeout.
+        """
+        resilience = policy(self.clock, attempts=1)
+        self.call.side_effect = AutoReconnect("down")
+        for _ in range(2):
+            with self.assertRaises(AutoReconnect):
+                resilience.call(self.call)
+        self.clock.now += 10
+        with self.assertRaises(AutoReconnect):
+            resilience.call(self.call)
+        self.assertEqual(resilience.breaker.state, "open")
+
+    def test_deadline_errors_open_breaker(self):
+        """
+        Calls that run past their deadline count as failures.
+        """
+        resilience = policy(self.clock)
+        self.call.side_effect = ExecutionTimeout("operation exceeded time limit")
+        for _ in range(2):
+            with self.assertRaises(ExecutionTimeout):
+                resilience.call(self.call)
+        self.assertEqual(self.call.call_count, 2)
+        self.assertEqual(resilience.breaker.state, "open")
+
+    def test_trial_failing_otherwise_is_released(self):
+        """
+        A half-open trial that fails with a timeout reopens the breaker, and
+        one that fails with an unrelated error lets the next call try, rather
+        than leaving every later call failing fast.
+        """
+        resilience = policy(self.clock, attempts=1)
+        self.call.side_effect = AutoReconnect("down")
+        for _ in range(2):
+            with self.assertRaises(AutoReconnect):
+                resilience.call(self.call)
+        self.clock.now += 10
+        self.call.side_effect = ExecutionTimeout("operation exceeded time limit")
+        with self.assertRaises(ExecutionTimeout):
+            resilience.call(self.call)
+        self.assertEqual(resilience.breaker.state, "open")
+
+        self.clock.now += 10
+        self.call.side_effect = ValueError("bad status id")
+        with self.assertRaises(ValueError):
+            resilience.call(self.call)
+        self.assertEqual(resilience.breaker.state, "half_open")
+        self.call.side_effect = None
+        self.call.return_value = "ok"
+        self.assertEqual(resilience.call(self.call), "ok")
+        self.assertEqual(resilience.breaker.state, "closed")
+
+
+class TestCollectionsUnderFaults(TestCase):
+    """
+    Testing the collection classes against a database stand-in that drops
+    connections.
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+        self.resilience = policy(self.clock, attempts=3)
+        self.database = MagicMock()
+
+    def test_user_exists_retried(self):
+        """
+        A read succeeds after a dropped connection.
+        """
+        users = UserCollection(self.database, resilience=self.resilience)
+        users.database.find_one.side_effect = [AutoReconnect("down"), {"_id": "velma2"}]
+        self.assertTrue(users.user_exists("velma2"))
+        self.assertEqual(users.database.find_one.call_count, 2)
+
+    def test_add_user_not_retried(self):
+        """
+        An insert is not replayed after a dropped connection.
+        """
+        users = UserCollection(self.database, resilience=self.resilience)
+        users.database.insert_one.side_effect = AutoReconnect("down")
+        with self.assertRaises(AutoReconnect):
+            users.add_user("velma2", "Velma", "Dinkley", "velma@mystery.inc")
+        self.assertEqual(users.database.insert_one.call_count, 1)
+
+    def test_nested_calls_share_one_policy(self):
+        """
+        search_status checks the owner through UserCollection; a fault in the
+        inner read loading its soft-deleted ids is retried by the outer call
+        only, not by both.
+        """
+        users = UserCollection(self.database, resilience=self.resilience)
+        users.database.find.side_effect = [AutoReconnect("down"), []]
+        statuses = StatusCollection(MagicMock(), users=users, resilience=self.resilience)
+        statuses.database.find_one.return_value = {"_id": "velma2_1", "USER_ID": "velma2"}
+        self.assertIsNotNone(statuses.search_status("velma2_1"))
+        self.assertEqual(users.database.find.call_count, 2)
+        self.assertEqual(statuses.database.find_one.call_count, 2)
+
+    def test_shared_breaker(self):
+        """
+        Once user reads have opened the breaker, status reads fail fast too.
+        """
+        users = UserCollection(self.database, resilience=self.resilience)
+        statuses = StatusCollection(MagicMock(), resilience=self.resilience)
+        users.database.find_one.side_effect = AutoReconnect("down")
+        for _ in range(2):
+            with self.assertRaises(AutoReconnect):
+                users.user_exists("velma2")
+        with self.assertRaises(CircuitOpenError):
+            statuses.status_exists("velma2_1")
+        statuses.database.find_one.assert_not_called()
@@ -1,12 +1,18 @@
 """
 Unit testing the methods in StatusCollection class
 """
+from datetime import datetime
 from unittest import TestCase
+from unittest.mock import MagicMock
 
-from test_model import test_database
-from user_status import StatusCollection
+import pytest
 
+from socialnetwork_model import install_validator, search_read_preference, STATUS_SCHEMA
+from test_model import test_database, STATUSES_SNAPSHOT
+from user_status import StatusCollection, status_owner
 
+
+@pytest.mark.mongo
 class TestStatusCollection(TestCase):
     """
     Creating a test Status class for testing methods in User class
@@ -14,20 +20,13 @@ class TestStatusCollection(TestCase):
     def setUp(self):
         """
         For the unittests to all pass, we need some seed data. I will create a
-        test_status table and bind it to the TestDatabase I imported from test_model.py
-
-        You also have to go to user_status.py and change the database table in __init__
-        to ["test_status"]
+        test_status table in this worker's TestDatabase from test_model.py
         """
         # Bind the test_status table to the TestDatabase
-        self.database = test_database["test_status"]
-        self.test_status_collection = StatusCollection(self.database)
+        self.test_status_collection = StatusCollection(test_database,
+                                                       collection_name="test_status")
         # seed data
-        self.test_status_collection.add_status("jerry.tom1_00001", "jerry.tom1",
-                                               "Tom never saw it coming")
-        self.test_status_collection.add_status("scooby.doo1_00001", "scooby.doo1",
-                                               "Scooby, Scooby Dooo!")
-        self.test_status_collection.add_status("velma2_00002", "velma2", "Jinkies!")
+        self.test_status_collection.add_statuses(STATUSES_SNAPSHOT)
 
 
     def tearDown(self):
@@ -55,6 +54,15 @@ class TestStatusCollection(TestCase):
             "honore_de_balzac_00001", "honore_de_balzac", "All happiness depends "
                                                           "on courage and work."))
 
+    def test_schema_rejects_empty_status_id(self):
+        """
+        With the status validator installed, an empty status_id is rejected
+        and add_status returns False instead of raising.
+        """
+        install_validator(test_database, "test_status", STATUS_SCHEMA)
+        self.assertFalse(self.test_status_collection.add_status("", "king.arthur",
+                                                                "I am a squirrel!"))
+
     def test_search_status_success(self):
         """
         Returns a status pymongo cursor object if the status_id exists in the
@@ -102,3 +110,169 @@ class TestStatusCollection(TestCase):
         Fails to delete status when the status_id can't be found in test_status.test_status
         """
         self.assertIsNone(self.test_status_collection.delete_status("master_shifu"))
+
+    def test_add_status_records_created_at(self):
+        """
+        Every new status should carry a CREATED_AT timestamp.
+        """
+        status = self.test_status_collection.database.find_one({"_id": "velma2_00002"})
+        self.assertIn("CREATED_AT", status)
+
+    def test_latest_statuses_newest_first(self):
+        """
+        latest_statuses should return a user's statuses newest first and
+        respect the limit.
+        """
+        for day in range(1, 4):
+            self.test_status_collection.add_status(f"velma2_0000{day + 2}", "velma2",
+                                                   f"Day {day}",
+                                                   created_at=datetime(2021, 1, day))
+        latest = list(self.test_status_collection.latest_statuses("velma2", 2))
+        self.assertEqual([status["_id"] for status in latest],
+                         ["velma2_00002", "velma2_00005"])
+
+    def test_statuses_since(self):
+        """
+        statuses_since should only return statuses created after the given time.
+        """
+        self.test_status_collection.add_status("velma2_00003", "velma2", "Old news",
+                                               created_at=datetime(2020, 1, 1))
+        recent = list(self.test_status_collection.statuses_since("velma2",
+                                                                datetime(2021, 1, 1)))
+        self.assertEqual([status["_id"] for status in recent], ["velma2_00002"])
+
+    def test_new_status_id_sorts_by_time(self):
+        """
+        Generated status ids should carry the user_id and sort in creation order.
+        """
+        first = StatusCollection.new_status_id("velma2")
+        second = StatusCollection.new_status_id("velma2")
+        self.assertTrue(first.startswith("velma2_"))
+        self.assertLess(first, second)
+
+
+class TestRoutedStatusCollection(TestCase):
+    """
+    Testing the shard-key routed mode with a mocked collection, so we can
+    check the filters that would be sent to mongos.
+    """
+    def setUp(self):
+        """
+        Bind a routed StatusCollection to a MagicMock database.
+        """
+        self.database = MagicMock()
+        self.collection = self.database["status"]
+        self.collection.find_one.return_value = {"_id": "velma2_00002"}
+        self.routed_collection = StatusCollection(self.database, routed=True)
+
+    def test_status_owner(self):
+        """
+        The owner is everything before the last underscore.
+        """
+        self.assertEqual(status_owner("Livia.Atalanti89_919"), "Livia.Atalanti89")
+        self.assertEqual(status_owner("honore_de_balzac_00001"), "honore_de_balzac")
+
+    def test_routed_query_carries_shard_key(self):
+        """
+        Single-status operations should include USER_ID in their filter.
+        """
+        self.routed_collection.update_status("velma2_00002", "Jinkies!")
+        query, update = self.collection.update_one.call_args.args
+        self.assertEqual(query, {"_id": "velma2_00002", "USER_ID": "velma2"})
+        self.assertEqual(update["$set"]["STATUS_TEXT"], "Jinkies!")
+
+    def test_routed_search_statuses_targets_owners(self):
+        """
+        A page of ids is one find, carrying the owners' USER_IDs.
+        """
+        self.routed_collection.search_statuses(["velma2_00002", "shaggy_00001"])
+        self.collection.find.assert_called_once_with(
+            {"_id": {"$in": ["velma2_00002", "shaggy_00001"]},
+             "USER_ID": {"$in": ["shaggy", "velma2"]}}, None)
+
+    def test_routed_add_status_rejects_foreign_id(self):
+        """
+        In routed mode a status_id must encode its owner.
+        """
+        with self.assertRaises(ValueError):
+            self.routed_collection.add_status("velma2_00002", "scooby.doo1", "Ruh roh")
+
+
+class TestSoftDeletedOwner(TestCase):
+    """
+    Statuses of soft-deleted users are hidden from searches.
+    """
+    def setUp(self):
+        """
+        velma2 has been soft-deleted.
+        """
+        self.database = MagicMock()
+        self.collection = self.database["status"]
+        self.collection.find_one.return_value = {"_id": "velma2_00002", "USER_ID": "velma2"}
+        self.users = MagicMock()
+        self.users.is_soft_deleted.return_value = True
+        self.status_collection = StatusCollection(self.database, users=self.users)
+
+    def test_hidden_from_searches(self):
+        """
+        Every search path returns nothing for velma2.
+        """
+        self.assertIsNone(self.status_collection.search_status("velma2_00002"))
+        self.assertEqual(list(self.status_collection.search_status_by_id("velma2")), [])
+        self.assertEqual(list(self.status_collection.latest_statuses("velma2")), [])
+        self.collection.find.assert_not_called()
+
+    def test_hidden_from_page_search(self):
+        """
+        search_statuses drops velma2's statuses with one bulk owner check.
+        """
+        self.collection.find.return_value.sort.return_value = [
+            {"_id": "shaggy_00001", "USER_ID": "shaggy"},
+            {"_id": "velma2_00002", "USER_ID": "velma2"}]
+        self.users.soft_deleted_user_ids.return_value = {"velma2"}
+        self.assertEqual(list(self.status_collection.search_statuses(
+            ["shaggy_00001", "velma2_00002"])), [{"_id": "shaggy_00001", "USER_ID": "shaggy"}])
+        self.users.soft_deleted_user_ids.assert_called_once_with({"shaggy", "velma2"})
+        self.users.is_soft_deleted.assert_not_called()
+
+    def test_unknown_link_rejected(self):
+        """
+        Only tags, users and blobs can be linked to a StatusCollection.
+        """
+        self.assertIs(self.status_collection.users, self.users)
+        with self.assertRaises(TypeError):
+            StatusCollection(self.database, user=self.users)
+
+
+class TestSearchReadPreference(TestCase):
+    """
+    Searches follow the search read preference; checks that guard writes
+    read the primary.
+    """
+    def setUp(self):
+        self.database = MagicMock()
+        self.primary = self.database["status"]
+        self.secondary = self.primary.with_options.return_value
+        self.status_collection = StatusCollection(
+            self.database, read_preference=search_read_preference("secondaryPreferred", 90))
+
+    def test_searches_use_secondaries(self):
+        """
+        search_status and the timelines read through with_options.
+        """
+        self.status_collection.search_status("velma2_00002")
+        self.status_collection.latest_statuses("velma2")
+        self.status_collection.search_status_by_id("velma2")
+        self.secondary.find.assert_called()
+        self.primary.find.assert_not_called()
+
+    def test_write_paths_use_primary(self):
+        """
+        status_exists (in front of updates and deletes) and the delete path
+        of search_status_by_id read the primary.
+        """
+        self.status_collection.status_exists("velma2_00002")
+        self.status_collection.search_status_by_id("velma2", {"_id": 1}, primary=True)
+        self.primary.find_one.assert_called_once()
+        self.primary.find.assert_called_once()
+        self.secondary.find_one.assert_not_called()
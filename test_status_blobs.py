@@ -0,0 +1,71 @@
+"""
+Unit testing the content-addressed status text store
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from status_blobs import StatusBlobCollection, text_ref
+from user_status import StatusCollection
+
+TEXTS = ["good needle deceive spotless bead", "Jinkies!"]
+
+
+class TestStatusBlobCollection(TestCase):
+    """
+    Testing the blob store and StatusCollection(blobs=...) against mocks.
+    """
+    def setUp(self):
+        """
+        A blob store whose find serves the blobs of TEXTS.
+        """
+        stored = {text_ref(text): text for text in TEXTS}
+        self.blobs = StatusBlobCollection(MagicMock(), min_length=0)
+        self.blobs.database.find.side_effect = lambda query: [
+            {"_id": ref, "STATUS_TEXT": stored[ref]} for ref in query["_id"]["$in"]]
+
+    def test_each_text_stored_once(self):
+        """
+        Reposts of one text share one blob, written with one upsert.
+        """
+        fields = self.blobs.store_many(["good needle deceive spotless bead"] * 3 + ["Jinkies!"])
+        self.assertEqual(fields[0], fields[2])
+        self.assertEqual(fields[0], {"STATUS_TEXT_REF": text_ref(
+            "good needle deceive spotless bead")})
+        self.assertEqual(len(self.blobs.database.bulk_write.call_args.args[0]), 2)
+
+    def test_short_texts_inline(self):
+        """
+        Texts under min_length keep STATUS_TEXT and write no blob.
+        """
+        self.blobs.min_length = 16
+        self.assertEqual(self.blobs.store("Jinkies!"), {"STATUS_TEXT": "Jinkies!"})
+        self.blobs.database.bulk_write.assert_not_called()
+
+    def test_resolve_in_batches(self):
+        """
+        Reads fill STATUS_TEXT with one blob query per batch.
+        """
+        statuses = [{"_id": f"velma2_{n}", "USER_ID": "velma2", **fields}
+                    for n, fields in enumerate(self.blobs.store_many(["Jinkies!"] * 5))]
+        statuses.append({"_id": "velma2_inline", "USER_ID": "velma2", "STATUS_TEXT": "Zoinks!"})
+        resolved = list(self.blobs.resolve(statuses, batch_size=2))
+        self.assertEqual([status["STATUS_TEXT"] for status in resolved],
+                         ["Jinkies!"] * 5 + ["Zoinks!"])
+        self.assertNotIn("STATUS_TEXT_REF", resolved[0])
+        self.assertEqual(self.blobs.database.find.call_count, 3)
+
+    def test_status_collection_stores_refs(self):
+        """
+        A StatusCollection with blobs saves references and reads texts back.
+        """
+        status_collection = StatusCollection(MagicMock(), blobs=self.blobs, resilience=None)
+        status_collection.add_status("velma2_00001", "velma2", "Jinkies!")
+        document = status_collection.database.insert_one.call_args.args[0]
+        self.assertNotIn("STATUS_TEXT", document)
+        self.assertEqual(document["STATUS_TEXT_REF"], text_ref("Jinkies!"))
+
+        status_collection.search_reads.find.return_value = [dict(document)]
+        [status] = status_collection.search_status_by_id("velma2", {"STATUS_TEXT": 1})
+        self.assertEqual(status["STATUS_TEXT"], "Jinkies!")
+        self.assertEqual(status_collection.search_reads.find.call_args.args[1],
+                         {"STATUS_TEXT": 1, "STATUS_TEXT_REF": 1})
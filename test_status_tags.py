@@ -0,0 +1,119 @@
+"""
+Unit testing hashtag/mention extraction and the StatusTagCollection
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import pytest
+from pymongo import DeleteMany, InsertOne
+
+from status_tags import StatusTagCollection, extract_tags
+from test_model import test_database
+from user_status import StatusCollection
+
+
+class TestExtractTags(TestCase):
+    """
+    Testing the tag parser on its own, no database needed.
+    """
+    def test_hashtags_and_mentions(self):
+        """
+        Hashtags are lowercased, mentions keep the user_id's case.
+        """
+        self.assertEqual(extract_tags("Loving #Python with @Livia.Atalanti89 #python!"),
+                         ["#python", "@Livia.Atalanti89"])
+
+    def test_no_tags(self):
+        """
+        Plain text and emails have no tags.
+        """
+        self.assertEqual(extract_tags("good needle deceive spotless bead"), [])
+        self.assertEqual(extract_tags("write to jerry.tom1@gmail.com"), [])
+
+    def test_trailing_dot_is_not_part_of_mention(self):
+        """
+        A sentence ending after a mention doesn't put the dot in the user_id.
+        """
+        self.assertEqual(extract_tags("Thanks @velma2."), ["@velma2"])
+
+    def test_reindex_is_one_ordered_write(self):
+        """
+        Reindexing deletes the old entries and inserts the new ones in a
+        single ordered bulk write.
+        """
+        database = MagicMock()
+        StatusTagCollection(database).reindex_status("velma2_00001", "#jinkies @shaggy")
+        database["status_tags"].bulk_write.assert_called_once_with(
+            [DeleteMany({"STATUS_ID": "velma2_00001"}),
+             InsertOne({"TAG": "#jinkies", "STATUS_ID": "velma2_00001"}),
+             InsertOne({"TAG": "@shaggy", "STATUS_ID": "velma2_00001"})],
+            ordered=True)
+
+    def test_hashtag_query_is_lowercased(self):
+        """
+        Hashtags are looked up lowercased, like they are indexed; mentions as typed.
+        """
+        database = MagicMock()
+        tags = StatusTagCollection(database)
+        tags.statuses_with_tag("#Python")
+        tags.statuses_with_tag("@Livia.Atalanti89")
+        queries = [call.args[0] for call in database["status_tags"].find.call_args_list]
+        self.assertEqual(queries, [{"TAG": "#python"}, {"TAG": "@Livia.Atalanti89"}])
+
+
+@pytest.mark.mongo
+class TestStatusTagCollection(TestCase):
+    """
+    Testing that the index follows status adds, updates and deletes.
+    """
+    def setUp(self):
+        """
+        A status collection with the tag index attached, in the TestDatabase.
+        """
+        self.database = test_database["test_tags"]
+        self.tags = StatusTagCollection(self.database)
+        self.status_collection = StatusCollection(self.database, tags=self.tags)
+        self.status_collection.add_status("velma2_00001", "velma2", "#jinkies @scooby.doo1")
+        self.status_collection.add_status("velma2_00002", "velma2", "More #jinkies")
+
+    def tearDown(self):
+        """
+        Drop the test collections.
+        """
+        self.database["status"].drop()
+        self.database["status_tags"].drop()
+
+    def test_add_indexes_tags(self):
+        """
+        Both statuses are found under #jinkies, one under the mention.
+        """
+        self.assertEqual(self.tags.statuses_with_tag("#jinkies"),
+                         (["velma2_00001", "velma2_00002"], None))
+        self.assertEqual(self.tags.statuses_with_tag("@scooby.doo1")[0], ["velma2_00001"])
+
+    def test_pagination(self):
+        """
+        Pages follow on from the after value of the previous page.
+        """
+        first_page, after = self.tags.statuses_with_tag("#jinkies", limit=1)
+        self.assertEqual((first_page, after), (["velma2_00001"], "velma2_00001"))
+        self.assertEqual(self.tags.statuses_with_tag("#jinkies", after, limit=1),
+                         (["velma2_00002"], None))
+
+    def test_update_and_delete(self):
+        """
+        Updating replaces the tags; deleting removes them.
+        """
+        self.status_collection.update_status("velma2_00001", "#zoinks")
+        self.assertEqual(self.tags.statuses_with_tag("@scooby.doo1")[0], [])
+        self.assertEqual(self.tags.statuses_with_tag("#zoinks")[0], ["velma2_00001"])
+        self.status_collection.delete_status("velma2_00002")
+        self.assertEqual(self.tags.statuses_with_tag("#jinkies")[0], [])
+
+    def test_bulk_add_indexes_tags(self):
+        """
+        add_statuses builds the index for the whole batch.
+        """
+        self.status_collection.add_statuses([("velma2_00003", "velma2", "#mystery"),
+                                             ("velma2_00004", "velma2", "#mystery inc")])
+        self.assertEqual(len(self.tags.statuses_with_tag("#mystery")[0]), 2)
@@ -0,0 +1,73 @@
+"""
+Unit testing tenant contexts and the shared-client router
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from socialnetwork_model import TenantContext, TenantRouter
+from status_tags import StatusTagCollection
+from user_status import StatusCollection, shard_status_collection
+from users import UserCollection
+
+
+class TestTenantRouter(TestCase):
+    """
+    Testing that tenants get their own databases over shared clients.
+    """
+    def setUp(self):
+        self.factory = MagicMock(side_effect=lambda uri: MagicMock(name=str(uri)))
+        self.router = TenantRouter(client_factory=self.factory)
+
+    def test_tenants_share_one_client(self):
+        """
+        A hundred tenants on one cluster open a single client.
+        """
+        for n in range(100):
+            self.router.database(TenantContext.for_tenant(f'acme{n}'))
+        self.factory.assert_called_once()
+
+    def test_tenant_database_names(self):
+        """
+        Each tenant reads and writes its own database.
+        """
+        self.router.database(TenantContext.for_tenant("acme"))
+        client = self.router.client()
+        client.__getitem__.assert_called_with("UserStatuses_acme")
+
+    def test_one_client_per_cluster(self):
+        """
+        Tenants on another cluster get that cluster's client.
+        """
+        self.router.database(TenantContext.for_tenant("acme"))
+        self.router.database(TenantContext.for_tenant("globex", uri="mongodb://eu-cluster"))
+        self.assertEqual(self.factory.call_count, 2)
+
+    def test_invalid_tenant_id(self):
+        """
+        Tenant ids can't smuggle characters into the database name.
+        """
+        for tenant_id in ("", "a.b", "a/b", "a b", "x" * 41):
+            with self.assertRaises(ValueError):
+                TenantContext.for_tenant(tenant_id)
+
+    def test_collection_names(self):
+        """
+        The collection classes bind to the collection names they are given.
+        """
+        database = MagicMock()
+        UserCollection(database, collection_name="test_users")
+        StatusCollection(database, collection_name="test_status")
+        StatusTagCollection(database, collection_name="test_status_tags")
+        database.__getitem__.assert_any_call("test_users")
+        database.__getitem__.assert_any_call("test_status")
+        database.__getitem__.assert_any_call("test_status_tags")
+
+    def test_shard_named_status_collection(self):
+        """
+        shard_status_collection shards the status collection it is given.
+        """
+        client = MagicMock()
+        shard_status_collection(client, "UserStatuses_acme", "test_status")
+        client.admin.command.assert_called_with("shardCollection",
+                                                "UserStatuses_acme.test_status",
+                                                key={"USER_ID": "hashed"})
@@ -0,0 +1,129 @@
+"""
+Unit testing the Count-Min Sketch and the TrendingEngine
+"""
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from change_feed import ChangeFeed
+from test_model import FakeClock
+from trending import CountMinSketch, TrendingEngine, epoch, extract_terms
+
+
+class TestCountMinSketch(TestCase):
+    """
+    Testing the sketch's estimates.
+    """
+    def test_never_undercounts(self):
+        """
+        Estimates are at least the true counts, exact with no collisions.
+        """
+        sketch = CountMinSketch(width=1024, depth=4)
+        for _ in range(5):
+            sketch.add("jinkies")
+        sketch.add("zoinks", 3)
+        self.assertEqual(sketch.estimate("jinkies"), 5)
+        self.assertEqual(sketch.estimate("zoinks"), 3)
+        self.assertEqual(sketch.estimate("ruh-roh"), 0)
+
+    def test_clear(self):
+        """
+        Clearing resets every count.
+        """
+        sketch = CountMinSketch(width=64, depth=2)
+        sketch.add("jinkies")
+        sketch.clear()
+        self.assertEqual(sketch.estimate("jinkies"), 0)
+
+
+class TestTrendingEngine(TestCase):
+    """
+    Testing top-K over a sliding window with a fake clock.
+    """
+    def setUp(self):
+        """
+        A one-hour window in 6 slices of 10 minutes.
+        """
+        self.clock = FakeClock(1_000_000.0)
+        self.engine = TrendingEngine(window_seconds=3600, buckets=6, k=2,
+                                     width=1024, clock=self.clock)
+
+    def test_extract_terms(self):
+        """
+        Short words are dropped; hashtags and mentions are kept whole.
+        """
+        self.assertEqual(extract_terms("Go #Team go @velma2 Gang"),
+                         {"gang", "#team", "@velma2"})
+
+    def test_top_k(self):
+        """
+        The most frequent terms come first.
+        """
+        for text in ["#mystery machine", "#mystery van", "#mystery machine", "scooby"]:
+            self.engine.observe(text)
+        self.assertEqual(self.engine.top(), [("#mystery", 3), ("machine", 2)])
+        self.assertEqual(len(self.engine.top(5)), 4)
+
+    def test_window_slides(self):
+        """
+        Terms from slices older than the window stop counting.
+        """
+        self.engine.observe("old news")
+        self.clock.now += 3600
+        self.engine.observe("fresh news")
+        self.assertEqual(dict(self.engine.top(5)), {"fresh": 1, "news": 1})
+
+    def test_old_statuses_ignored(self):
+        """
+        Statuses published before the window are not counted.
+        """
+        self.engine.observe("ancient history", self.clock.now - 7200)
+        self.assertEqual(self.engine.top(), [])
+
+    def test_late_status_keeps_live_counts(self):
+        """
+        A status from the slice just before the window is dropped instead of
+        recycling the current slice, which shares its ring entry.
+        """
+        self.clock.now = 3900
+        for _ in range(5):
+            self.engine.observe("fresh news")
+        self.engine.observe("late news", 400)
+        self.assertEqual(dict(self.engine.top()), {"news": 5, "fresh": 5})
+
+    def test_candidates_bounded(self):
+        """
+        Memory for candidates stays bounded however many distinct terms we see.
+        """
+        for n in range(1000):
+            self.engine.observe(f'term{n}')
+        self.assertLess(len(self.engine.candidates), 2 * self.engine.capacity)
+
+    def test_status_listener_and_change_feed(self):
+        """
+        Both the StatusCollection listener and the change feed feed the engine.
+        """
+        created_at = datetime.utcfromtimestamp(self.clock.now)
+        self.engine.observe_status("velma2_00001", "velma2", "#jinkies", created_at)
+        feed = ChangeFeed(MagicMock(), ("users_acme", "status_acme"))
+        self.engine.attach(feed, "status_acme")
+        feed.publish({"collection": "status_acme", "operation": "insert",
+                      "_id": "velma2_00002",
+                      "document": {"_id": "velma2_00002", "STATUS_TEXT": "#jinkies",
+                                   "CREATED_AT": created_at}})
+        self.assertEqual(self.engine.top(1), [("#jinkies", 2)])
+        self.assertEqual(epoch(created_at), self.clock.now)
+
+    def test_change_feed_resolves_text_refs(self):
+        """
+        With blobs, an inserted status holding only a STATUS_TEXT_REF is
+        counted by the text it refers to.
+        """
+        blobs = MagicMock()
+        blobs.lookup.return_value = {b"ref": "#jinkies"}
+        feed = ChangeFeed(MagicMock(), ("users", "status"))
+        self.engine.attach(feed, "status", blobs)
+        feed.publish({"collection": "status", "operation": "insert", "_id": "velma2_00002",
+                      "document": {"_id": "velma2_00002", "STATUS_TEXT_REF": b"ref"}})
+        self.assertEqual(self.engine.top(1), [("#jinkies", 1)])
+        blobs.lookup.assert_called_once_with([b"ref"])
@@ -0,0 +1,60 @@
+"""
+Unit testing the in-memory UserDirectory
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from change_feed import ChangeFeed
+from user_directory import UserDirectory, UserRecord
+
+
+class TestUserDirectory(TestCase):
+    """
+    Testing the directory against a mocked users collection.
+    """
+    def setUp(self):
+        """
+        A users collection holding two users.
+        """
+        self.user_collection = MagicMock()
+        self.user_collection.database.name = "users"
+        self.user_collection.database.find.return_value = [
+            {"_id": "jerry.tom1", "NAME": "Jerry", "LASTNAME": "Mouse",
+             "EMAIL": "jerry.tom1@gmail.com"},
+            {"_id": "scooby.doo1", "NAME": "Scooby", "LASTNAME": "Doo",
+             "EMAIL": "scooby.doo1@gmail.com"}]
+        self.directory = UserDirectory(self.user_collection)
+        self.directory.refresh()
+
+    def test_refresh_and_lookup(self):
+        """
+        Every user is loaded and can be looked up by user_id.
+        """
+        self.assertEqual(len(self.directory), 2)
+        self.assertEqual(self.directory.lookup("jerry.tom1"),
+                         UserRecord("jerry.tom1", "Jerry", "Mouse", "jerry.tom1@gmail.com"))
+        self.assertIsNone(self.directory.lookup("cara.delevingne"))
+
+    def test_records_have_no_dict(self):
+        """
+        Records use __slots__, not a per-instance dict.
+        """
+        self.assertFalse(hasattr(self.directory.lookup("jerry.tom1"), "__dict__"))
+
+    def test_change_feed_keeps_directory_fresh(self):
+        """
+        Inserts, updates and deletes from the change feed are applied.
+        """
+        feed = ChangeFeed(MagicMock())
+        self.directory.attach(feed)
+        feed.publish({"collection": "users", "operation": "insert", "_id": "velma2",
+                      "document": {"_id": "velma2", "NAME": "Velma", "LASTNAME": "Dinkley",
+                                   "EMAIL": "velma2@gmail.com"}})
+        feed.publish({"collection": "users", "operation": "update", "_id": "jerry.tom1",
+                      "document": {"_id": "jerry.tom1", "NAME": "Jerry", "LASTNAME": "Mouse",
+                                   "EMAIL": "jerry.mouse@yahoo.com"}})
+        feed.publish({"collection": "users", "operation": "delete", "_id": "scooby.doo1",
+                      "document": None})
+        self.assertIn("velma2", self.directory)
+        self.assertEqual(self.directory.lookup("jerry.tom1").email, "jerry.mouse@yahoo.com")
+        self.assertNotIn("scooby.doo1", self.directory)
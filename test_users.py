@@ -2,11 +2,16 @@
 Unit testing the methods in UserCollection class
 """
 from unittest import TestCase
+from unittest.mock import MagicMock
 
-from test_model import test_database
+import pytest
+
+from test_model import test_database, USERS_SNAPSHOT
+from socialnetwork_model import install_validator, USER_SCHEMA
 from users import UserCollection
 
 
+@pytest.mark.mongo
 class TestUserCollection(TestCase):
     """
     Creating a test User class for testing methods in User class
@@ -14,17 +19,12 @@ class TestUserCollection(TestCase):
     def setUp(self):
         """
         For the unittests to all pass, we need some seed data. I will create a
-        test_users table and bind it to the TestDatabase I imported from test_model.py
-
-        You also have to go to users.py and change the database table in __init__
-        to ["test_users"]
+        test_users table in this worker's TestDatabase from test_model.py
         """
         # Bind the test_users table to the TestDatabase
-        self.database = test_database["test_users"]
-        self.test_user_collection = UserCollection(self.database)
+        self.test_user_collection = UserCollection(test_database, collection_name="test_users")
         # seed data
-        self.test_user_collection.add_user("jerry.tom1", "Jerry", "Mouse", "jerry.tom1@gmail.com")
-        self.test_user_collection.add_user("scooby.doo1", "Scooby", "Doo", "scooby.doo1@gmail.com")
+        self.test_user_collection.add_users(USERS_SNAPSHOT)
 
 
     def tearDown(self):
@@ -98,3 +98,85 @@ class TestUserCollection(TestCase):
         Fails to delete status when the user_id can't be found in test_users.test_users.
         """
         self.assertIsNone(self.test_user_collection.delete_user("master_shifu"))
+
+    def test_user_exists(self):
+        """
+        user_exists answers True for seeded users and False for unknown ones.
+        """
+        self.assertTrue(self.test_user_collection.user_exists("jerry.tom1"))
+        self.assertFalse(self.test_user_collection.user_exists("cara.delevingne"))
+
+    def test_search_user_projection(self):
+        """
+        A projection limits the fields returned by search_user.
+        """
+        user = next(self.test_user_collection.search_user("jerry.tom1", {"EMAIL": 1}))
+        self.assertEqual(user, {"_id": "jerry.tom1", "EMAIL": "jerry.tom1@gmail.com"})
+
+    def test_schema_rejects_invalid_email(self):
+        """
+        With the users validator installed, a malformed email is rejected
+        on insert (None) and on update (False).
+        """
+        install_validator(test_database, "test_users", USER_SCHEMA)
+        self.assertIsNone(self.test_user_collection.add_user("velma2", "Velma",
+                                                            "Dinkley", "not an email"))
+        self.assertIs(self.test_user_collection.update_user("jerry.tom1", "Jerry",
+                                                            "Mouse", "jerry"), False)
+
+    def test_soft_delete_user(self):
+        """
+        A soft-deleted user disappears from searches at once and is purged later.
+        """
+        self.assertTrue(self.test_user_collection.soft_delete_user("scooby.doo1"))
+        self.assertIsNone(self.test_user_collection.search_user("scooby.doo1"))
+        self.assertFalse(self.test_user_collection.user_exists("scooby.doo1"))
+        self.assertTrue(self.test_user_collection.is_soft_deleted("scooby.doo1"))
+        self.assertIn("scooby.doo1", self.test_user_collection.deleted_user_ids())
+        self.assertEqual(self.test_user_collection.soft_deleted_user_ids(
+            ["scooby.doo1", "jerry.tom1"]), {"scooby.doo1"})
+        self.assertIsNone(self.test_user_collection.soft_delete_user("scooby.doo1"))
+        self.assertTrue(self.test_user_collection.purge_user("scooby.doo1"))
+
+
+class TestSoftDeletedCache(TestCase):
+    """
+    The soft-deleted ids are cached, so existence checks stay covered _id
+    queries. Runs against a mocked collection.
+    """
+    def setUp(self):
+        """
+        velma2 is soft-deleted in the mocked users table.
+        """
+        self.database = MagicMock()
+        self.collection = self.database["users"]
+        self.collection.find.return_value = [{"_id": "velma2"}]
+        self.users = UserCollection(self.database, resilience=None)
+
+    def test_user_exists_is_an_id_query(self):
+        """
+        user_exists asks for _id only, by _id only, and skips velma2 from the cache.
+        """
+        self.assertTrue(self.users.user_exists("jerry.tom1"))
+        self.collection.find_one.assert_called_once_with({"_id": "jerry.tom1"}, {"_id": 1})
+        self.assertFalse(self.users.user_exists("velma2"))
+        self.collection.find_one.assert_called_once()
+
+    def test_cache_reloaded_once_per_ttl(self):
+        """
+        Many checks within deleted_ttl read the soft-deleted ids once.
+        """
+        for _ in range(10):
+            self.assertTrue(self.users.is_soft_deleted("velma2"))
+        self.assertEqual(self.users.soft_deleted_user_ids(["velma2", "shaggy"]), {"velma2"})
+        self.collection.find.assert_called_once()
+
+    def test_own_soft_delete_seen_at_once(self):
+        """
+        A soft delete through this instance hides the user without a reload.
+        """
+        self.users.is_soft_deleted("velma2")
+        self.collection.update_one.return_value.matched_count = 1
+        self.users.soft_delete_user("shaggy")
+        self.assertTrue(self.users.is_soft_deleted("shaggy"))
+        self.collection.find.assert_called_once()
@@ -0,0 +1,222 @@
+"""
+Approximate trending terms and hashtags over a sliding time window
+"""
+import heapq
+import re
+import sys
+import time
+from array import array
+from datetime import timezone
+
+from status_tags import extract_tags
+
+
+WORD = re.compile(r"[#@]?[\w.']+")
+
+
+def extract_terms(status_text):
+    """
+    Returns the distinct terms of a status: words of three letters or more,
+    lowercased, plus its hashtags and mentions.
+    """
+    terms = {word.lower() for word in WORD.findall(status_text)
+             if len(word) >= 3 and word[0] not in "#@"}
+    terms.update(extract_tags(status_text))
+    return terms
+
+
+class CountMinSketch:
+    """
+    Fixed-size frequency sketch. Estimates never undercount; with
+    width w and depth d they overcount by at most 2N/w with probability
+    1 - 2**-d, N being the total count added.
+
+    Sketches of the same size hash an item to the same columns, so callers
+    summing several sketches can hash once with columns() and pass that on.
+    """
+    def __init__(self, width=8192, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("L", [0]) * width for _ in range(depth)]
+
+    def columns(self, item):
+        """
+        Returns the column of item in each row. The rows' hash functions are
+        derived from one 64-bit hash by double hashing (h1 + i * h2).
+        """
+        value = hash(item) & 0xFFFFFFFFFFFFFFFF
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(first + depth * second) % self.width for depth in range(self.depth)]
+
+    def add(self, item, count=1, columns=None):
+        """
+        Adds count occurrences of item. Uses conservative update: a row is only
+        raised as far as the new estimate, which cuts overcounting a lot
+        without ever undercounting.
+        """
+        columns = columns or self.columns(item)
+        target = self.estimate(item, columns) + count
+        for row, column in zip(self.rows, columns):
+            if row[column] < target:
+                row[column] = target
+
+    def estimate(self, item, columns=None):
+        """
+        Returns the estimated count of item.
+        """
+        return min(row[column] for row, column in zip(self.rows, columns or self.columns(item)))
+
+    def clear(self):
+        """
+        Resets every counter to zero.
+        """
+        self.rows = [array("L", [0]) * self.width for _ in range(self.depth)]
+
+    def memory_bytes(self):
+        """
+        Returns the size of the counters in bytes.
+        """
+        return sum(row.itemsize * len(row) for row in self.rows)
+
+
+def epoch(created_at):
+    """
+    Converts a CREATED_AT datetime to epoch seconds. pymongo returns naive
+    datetimes that are in UTC.
+    """
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+class TrendingEngine:
+    """
+    Keeps the approximate top-K terms over the last window_seconds.
+
+    The window is split into `buckets` time slices, each with its own
+    Count-Min Sketch; a term's count is the sum of its estimates in the live
+    slices, and slices that fall out of the window are cleared and reused.
+    At most 2 * `capacity` candidate terms are tracked, so memory stays the same
+    whether we see a thousand statuses or a hundred million.
+
+    Feed it from StatusCollection.add_listener (statuses added by this
+    process, including the CSV loaders) or attach it to a ChangeFeed to
+    follow every process.
+
+    The TUNING knobs are passed by keyword: capacity (default 8 * k), the
+    sketch width (8192) and depth (4), and extract, the function turning a
+    status text into terms (extract_terms).
+    """
+    TUNING = ("capacity", "width", "depth", "extract")
+
+    def __init__(self, window_seconds=3600, buckets=12, k=10, *, clock=time.time, **tuning):
+        unknown = set(tuning) - set(self.TUNING)
+        if unknown:
+            raise TypeError(f'Unknown TrendingEngine tuning: {", ".join(sorted(unknown))}')
+        self.bucket_seconds = window_seconds / buckets
+        self.k = k
+        self.capacity = tuning.get("capacity") or 8 * k
+        self.extract = tuning.get("extract", extract_terms)
+        self.clock = clock
+        # (time slot, sketch) per slice; the slot is None until first used.
+        self.slices = [(None, CountMinSketch(tuning.get("width", 8192), tuning.get("depth", 4)))
+                       for _ in range(buckets)]
+        self.candidates = {}
+
+    def _sketch_for(self, slot):
+        """
+        Returns the sketch for time slot, recycling the one it replaces.
+        slot must be live (see observe), so the slot it replaces is always
+        one that has left the window.
+        """
+        index = slot % len(self.slices)
+        previous, sketch = self.slices[index]
+        if previous != slot:
+            sketch.clear()
+            self.slices[index] = (slot, sketch)
+        return sketch
+
+    def _live(self, now):
+        """
+        Returns the sketches whose slot is inside the window ending at now.
+        """
+        current = int(now // self.bucket_seconds)
+        oldest = current - len(self.slices) + 1
+        return [sketch for slot, sketch in self.slices
+                if slot is not None and oldest <= slot <= current]
+
+    def window_estimate(self, term, now=None, columns=None, live=None):
+        """
+        Returns the estimated count of term in the window ending at now.
+        """
+        if live is None:
+            live = self._live(self.clock() if now is None else now)
+        columns = columns or self.slices[0][1].columns(term)
+        return sum(sketch.estimate(term, columns) for sketch in live)
+
+    def memory_bytes(self):
+        """
+        Returns the approximate size of the sketches and candidate table in bytes.
+        """
+        return (sum(sketch.memory_bytes() for _, sketch in self.slices)
+                + sys.getsizeof(self.candidates)
+                + sum(sys.getsizeof(term) for term in self.candidates))
+
+    def observe(self, status_text, timestamp=None):
+        """
+        Counts the terms of one status published at timestamp (epoch seconds,
+        default now). Statuses whose slice has left the window are ignored,
+        and ones stamped in the future (clock skew) count in the current slice.
+        """
+        now = self.clock()
+        current = int(now // self.bucket_seconds)
+        slot = current if timestamp is None else min(int(timestamp // self.bucket_seconds),
+                                                     current)
+        if slot <= current - len(self.slices):
+            return
+        sketch = self._sketch_for(slot)
+        live = self._live(now)
+        for term in self.extract(status_text):
+            columns = sketch.columns(term)
+            sketch.add(term, columns=columns)
+            self.candidates[term] = self.window_estimate(term, columns=columns, live=live)
+        # Pruning back to capacity only once we're at twice that keeps
+        # the heap work to one pass per `capacity` new terms.
+        if len(self.candidates) >= 2 * self.capacity:
+            self.candidates = dict(heapq.nlargest(self.capacity, self.candidates.items(),
+                                                  key=lambda item: item[1]))
+
+    def observe_status(self, status_id, user_id, status_text, created_at=None):
+        """
+        StatusCollection listener: counts a newly added status.
+        """
+        del status_id, user_id
+        self.observe(status_text, epoch(created_at) if created_at else None)
+
+    def attach(self, change_feed, collection_name="status", blobs=None):
+        """
+        Counts every status inserted into collection_name (a tenant's
+        status_collection), by any process. Pass the collection's
+        StatusBlobCollection as blobs when it dedupes texts, so statuses
+        holding only a STATUS_TEXT_REF are counted by their text.
+        """
+        def on_event(event):
+            if event["operation"] == "insert" and event["document"]:
+                document = event["document"]
+                status_text = document.get("STATUS_TEXT", "")
+                ref = document.get("STATUS_TEXT_REF")
+                if ref is not None and blobs is not None:
+                    status_text = blobs.lookup([ref]).get(ref) or ""
+                created_at = document.get("CREATED_AT")
+                self.observe(status_text, epoch(created_at) if created_at else None)
+        change_feed.subscribe(on_event, collection_name)
+
+    def top(self, k=None):
+        """
+        Returns the k (default self.k) most frequent terms of the current
+        window as (term, estimated count) pairs, most frequent first.
+        """
+        live = self._live(self.clock())
+        scored = ((term, self.window_estimate(term, live=live)) for term in self.candidates)
+        return [(term, count) for term, count in
+                heapq.nlargest(k or self.k, scored, key=lambda item: item[1]) if count]
@@ -0,0 +1,100 @@
+"""
+Read-optimized, in-memory copy of the users table
+"""
+import sys
+import threading
+
+from loguru import logger
+
+
+class UserRecord:
+    """
+    One user. __slots__ drops the per-instance __dict__, which is most of
+    the weight of the plain dicts pymongo hands back.
+    """
+    __slots__ = ("user_id", "name", "lastname", "email")
+
+    def __init__(self, user_id, name, lastname, email):
+        self.user_id = user_id
+        self.name = name
+        self.lastname = lastname
+        self.email = email
+
+    @classmethod
+    def from_document(cls, document):
+        """
+        Builds a record from a users document. First and last names repeat a
+        lot across users, so they are interned and shared between records.
+        """
+        return cls(sys.intern(document["_id"]), sys.intern(document["NAME"]),
+                   sys.intern(document["LASTNAME"]), document["EMAIL"])
+
+    def __eq__(self, other):
+        if not isinstance(other, UserRecord):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return (f'UserRecord({self.user_id!r}, {self.name!r}, '
+                f'{self.lastname!r}, {self.email!r})')
+
+
+class UserDirectory:
+    """
+    Keeps the whole users table in memory for high-QPS lookups by user_id.
+    Soft-deleted users are left out.
+
+    refresh() loads it from the users collection. To keep it fresh without
+    reloading, attach it to a ChangeFeed: every insert, update and delete
+    on the users collection is then applied to the directory as it happens.
+    """
+    def __init__(self, user_collection):
+        self.user_collection = user_collection
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Reloads every user from the database and returns how many were loaded.
+        The new table is swapped in at once, so readers never see half of it.
+        """
+        cursor = self.user_collection.database.find(
+            {"DELETED_AT": {"$exists": False}}, {"NAME": 1, "LASTNAME": 1, "EMAIL": 1})
+        records = {}
+        for document in cursor:
+            record = UserRecord.from_document(document)
+            records[record.user_id] = record
+        with self._lock:
+            self.records = records
+        logger.info(f'UserDirectory loaded {len(records)} users')
+        return len(records)
+
+    def attach(self, change_feed):
+        """
+        Subscribes to the users events of change_feed for incremental refresh.
+        """
+        change_feed.subscribe(self.apply, self.user_collection.database.name)
+
+    def apply(self, event):
+        """
+        Applies one ChangeFeed event to the directory.
+        """
+        with self._lock:
+            if event["operation"] == "delete" or event["document"] is None \
+                    or "DELETED_AT" in event["document"]:
+                self.records.pop(event["_id"], None)
+            else:
+                record = UserRecord.from_document(event["document"])
+                self.records[record.user_id] = record
+
+    def lookup(self, user_id):
+        """
+        Returns the UserRecord for user_id, or None if there is no such user.
+        """
+        return self.records.get(user_id)
+
+    def __contains__(self, user_id):
+        return user_id in self.records
+
+    def __len__(self):
+        return len(self.records)
@@ -1,14 +1,37 @@
 """
 Database methods for status collection
 """
-import sys
-from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, WriteError
 
 from loguru import logger
+from bulk_writes import DOCUMENT_VALIDATION_FAILURE, insert_many_errors
+from resilience import DEFAULT_RESILIENCE, resilient
+
+
+def status_owner(status_id):
+    """
+    Returns the user_id encoded in a status_id. Our status ids are
+    "<user_id>_<suffix>" (e.g. Livia.Atalanti89_919), so the owner is
+    everything before the last underscore.
+    """
+    return status_id.rsplit("_", 1)[0]
 
-logger.remove()
-logger.add('loguru_file_{time:YYYY-MM-DD}.log', level='DEBUG')
-logger.add(sys.stderr, level='WARNING')
+
+def shard_status_collection(client, database_name="UserStatuses", collection_name="status"):
+    """
+    Shards collection_name, the status collection of database_name (a
+    TenantContext's status_collection), on a hashed USER_ID key.
+    client must be connected to a mongos. Use it together with
+    StatusCollection(database, routed=True) so single-status operations
+    carry the shard key and are sent to one shard instead of all of them.
+    """
+    client.admin.command("enableSharding", database_name)
+    client.admin.command("shardCollection", f"{database_name}.{collection_name}",
+                         key={"USER_ID": "hashed"})
 
 
 class StatusCollection:
@@ -16,41 +39,243 @@ class StatusCollection:
     Creating a StatusCollection class to instantiate a status table
     in my UserStatuses MongoDB database.
     """
-    def __init__(self, database):
+    LINKS = ("tags", "users", "blobs")
+
+    def __init__(self, database, routed=False, *, resilience=DEFAULT_RESILIENCE,
+                 read_preference=None, collection_name="status", **links):
+        """
+        Binds to collection_name in database; a TenantContext carries both
+        (see socialnetwork_model). Everything after routed is passed by
+        keyword; tags, users and blobs are the optional linked collections.
+
+        Set routed=True when the status collection is sharded on USER_ID.
+        Every status_id must then encode its owner (see status_owner) and
+        single-status queries include USER_ID so mongos can target one shard.
+
+        Pass a StatusTagCollection as tags to keep the hashtag/mention index
+        in step with every add, update and delete.
+
+        Pass the UserCollection as users to hide the statuses of soft-deleted
+        users from every search while they wait to be purged.
+
+        resilience is the retry/deadline/circuit-breaker policy, shared with
+        UserCollection by default (see resilience.Resilience).
+
+        read_preference routes the searches and timelines to secondaries
+        (see socialnetwork_model.search_read_preference). Writes and the
+        existence checks in front of them stay on the primary.
+
+        Pass a StatusBlobCollection as blobs to store each distinct text
+        once: statuses then hold a STATUS_TEXT_REF, and every read fills
+        STATUS_TEXT back in with one blob query per batch of statuses.
+        """
+        self.database = database[collection_name]
+        self.resilience = resilience
+        self.search_reads = self.database if read_preference is None else \
+            self.database.with_options(read_preference=read_preference)
+        self.routed = routed
+        unknown = set(links) - set(self.LINKS)
+        if unknown:
+            raise TypeError(f'Unknown StatusCollection links: {", ".join(sorted(unknown))}')
+        self.links = links
+        self.listeners = []
+        # Timelines ("latest N statuses by a user", "statuses since T") are
+        # answered by range scans on this index, newest first.
+        self.database.create_index([("USER_ID", ASCENDING), ("CREATED_AT", DESCENDING)])
+
+    @property
+    def tags(self):
+        """
+        The StatusTagCollection kept in step with the statuses, or None.
+        """
+        return self.links.get("tags")
+
+    @property
+    def users(self):
+        """
+        The UserCollection whose soft-deleted users are hidden, or None.
+        """
+        return self.links.get("users")
+
+    @property
+    def blobs(self):
+        """
+        The StatusBlobCollection holding the status texts, or None.
+        """
+        return self.links.get("blobs")
+
+    def add_listener(self, callback):
+        """
+        Registers callback(status_id, user_id, status_text, created_at) to be
+        called for every status this collection adds, one by one or in bulk.
+        """
+        self.listeners.append(callback)
+
+    def _notify(self, rows, created_at):
         """
-        Please make sure to change "status" to "test_status" for unit testing!
+        Calls the listeners for each newly added (status_id, user_id, status_text).
         """
-        self.database = database["status"]
+        for callback in self.listeners:
+            for status_id, user_id, status_text in rows:
+                callback(status_id, user_id, status_text, created_at)
 
-    def add_status(self, status_id, user_id, status_text):
+    @staticmethod
+    def new_status_id(user_id):
+        """
+        Generates a time-sortable status_id for user_id. The ObjectId suffix
+        starts with a timestamp, so ids of one user sort in creation order.
+        """
+        return f'{user_id}_{ObjectId()}'
+
+    @resilient(idempotent=False)
+    def add_status(self, status_id, user_id, status_text, created_at=None):
         """
         Adds a new status to the status table of my UserStatuses database.
         If the status_id already exists, it raises a DuplicateKeyError and returns
-        False. Otherwise, it returns True.
+        False. It also returns False if the status schema rejects the document
+        (e.g. an empty status_id). Otherwise, it returns True.
+
+        Every status is stamped with a CREATED_AT datetime (UTC) so we can
+        query timelines by time. Pass created_at to backdate a status;
+        MODIFIED_AT always records the write itself.
         """
+        if self.routed and status_owner(status_id) != user_id:
+            raise ValueError(f'{status_id} does not belong to {user_id}')
+        now = datetime.now(timezone.utc)
+        if created_at is None:
+            created_at = now
         try:
             self.database.insert_one(
-                {"_id": status_id, "USER_ID": user_id, "STATUS_TEXT": status_text}
+                {"_id": status_id, "USER_ID": user_id, **self.text_fields([status_text])[0],
+                 "CREATED_AT": created_at, "MODIFIED_AT": now}
             )
+            if self.tags is not None:
+                self.tags.index_status(status_id, status_text)
+            self._notify([(status_id, user_id, status_text)], created_at)
             return True
         except DuplicateKeyError:
             return False
+        except WriteError as error:
+            if error.code != DOCUMENT_VALIDATION_FAILURE:
+                raise
+            logger.warning(f'{status_id} rejected by the status schema')
+            return False
+
+    def add_statuses(self, rows, created_at=None):
+        """
+        Adds many statuses with a single unordered insert_many. rows is a list
+        of (status_id, user_id, status_text) tuples. Returns a list of booleans,
+        one per row: False if that status_id already existed.
+
+        The caller is responsible for checking that the users exist.
+        """
+        return [code is None for code in self.add_statuses_codes(rows, created_at)]
+
+    @resilient(idempotent=False)
+    def add_statuses_codes(self, rows, created_at=None):
+        """
+        Like add_statuses, but returns the server's error code for each row:
+        None if it was inserted, else DUPLICATE_KEY or
+        DOCUMENT_VALIDATION_FAILURE.
+        """
+        if not rows:
+            return []
+        now = datetime.now(timezone.utc)
+        if created_at is None:
+            created_at = now
+        documents = []
+        text_fields = self.text_fields([status_text for _, _, status_text in rows])
+        for (status_id, user_id, _), fields in zip(rows, text_fields):
+            if self.routed and status_owner(status_id) != user_id:
+                raise ValueError(f'{status_id} does not belong to {user_id}')
+            documents.append({"_id": status_id, "USER_ID": user_id, **fields,
+                              "CREATED_AT": created_at, "MODIFIED_AT": now})
+        codes = insert_many_errors(self.database, documents)
+        added = [row for row, code in zip(rows, codes) if code is None]
+        if self.tags is not None:
+            self.tags.index_statuses(added)
+        self._notify(added, created_at)
+        return codes
+
+    def text_fields(self, status_texts):
+        """
+        Returns the fields holding each text: STATUS_TEXT, or with blobs a
+        STATUS_TEXT_REF once the texts are stored.
+        """
+        if self.blobs is None:
+            return [{"STATUS_TEXT": status_text} for status_text in status_texts]
+        return self.blobs.store_many(status_texts)
+
+    def _text_projection(self, projection):
+        """
+        With blobs, adds STATUS_TEXT_REF to a projection asking for STATUS_TEXT.
+        """
+        if self.blobs is None or not projection or not projection.get("STATUS_TEXT"):
+            return projection
+        return {**projection, "STATUS_TEXT_REF": 1}
+
+    def _resolved(self, statuses):
+        """
+        Returns statuses as they are, or with blobs a generator filling in
+        their STATUS_TEXT in bulk.
+        """
+        if self.blobs is None:
+            return statuses
+        return self.blobs.resolve(statuses)
 
+    def _status_query(self, status_id):
+        """
+        Returns the filter that finds status_id. In routed mode the filter
+        also carries the shard key (USER_ID) taken from the status_id.
+        """
+        if self.routed:
+            return {'_id': status_id, 'USER_ID': status_owner(status_id)}
+        return {'_id': status_id}
 
+
+    @resilient(idempotent=False)
     def delete_status(self, status_id):
         """
         Deletes a status in the status table of my UserStatuses database if the
         status_id exists and returns True. If it doesn't, it returns None.
 
         """
-        query = {'_id': status_id}
-        if self.database.count_documents(query) == 0:
+        query = self._status_query(status_id)
+        if not self.status_exists(status_id):
             return None
-        self.database.delete_one({"_id": status_id})
+        self.database.delete_one(query)
+        if self.tags is not None:
+            self.tags.remove_statuses([status_id])
         return True
 
 
-    def search_status(self, status_id):
+    def _owner_visible(self, user_id):
+        """
+        Returns False if user_id has been soft-deleted and their statuses
+        should be hidden. Always True without a users collection. Answered
+        from UserCollection.soft_deleted, without a round trip per read.
+        """
+        return self.users is None or not self.users.is_soft_deleted(user_id)
+
+    @resilient()
+    def status_exists(self, status_id):
+        """
+        Returns True if status_id is in the status table, fetching only _id.
+        """
+        return self.database.find_one(self._status_query(status_id), {"_id": 1}) is not None
+
+    @resilient()
+    def status_user(self, status_id):
+        """
+        Returns the USER_ID stored on status_id, or None if it doesn't exist.
+        Unlike status_owner(status_id) this can't be picked by whoever names
+        the status, so it is the user to charge for a write to it.
+        """
+        status = self.database.find_one(self._status_query(status_id), {"USER_ID": 1})
+        return None if status is None else status["USER_ID"]
+
+    @resilient()
+    def search_status(self, status_id, projection=None):
         """
         Searches for status in the status table of UserStatuses database
         and returns a pymongo status object.
@@ -61,31 +286,138 @@ class StatusCollection:
 
         Also, the corresponding function in main.py can read the object
         and recognize that it is None and print an error message.
+
+        Pass a projection to fetch only some of the fields. The status and
+        its owner are read in one round trip; the result is a list holding it.
         """
-        query = {'_id': status_id}
-        if self.database.count_documents(query) == 0:
+        projection = self._text_projection(projection)
+        fields = {**projection, "USER_ID": 1} if projection else projection
+        status = self.search_reads.find_one(self._status_query(status_id), fields)
+        if status is None or not self._owner_visible(status["USER_ID"]):
             return None
-        return self.database.find({"_id": status_id})
+        if projection and not projection.get("USER_ID"):
+            del status["USER_ID"]
+        return self._resolved([status])
+
+    @resilient()
+    def search_statuses(self, status_ids, projection=None):
+        """
+        Returns the statuses among status_ids, in status_id order, fetched
+        with one query; in routed mode it also carries their owners' USER_IDs
+        so only their shards are asked. Ids that no longer exist are skipped,
+        and so are the statuses of soft-deleted users, found with one more
+        query. Meant for a page of ids, e.g. from the tag index.
+        """
+        status_ids = list(status_ids)
+        if not status_ids:
+            return []
+        query = {"_id": {"$in": status_ids}}
+        if self.routed:
+            query["USER_ID"] = {"$in": sorted({status_owner(status_id)
+                                               for status_id in status_ids})}
+        projection = self._text_projection(projection)
+        if projection:
+            projection = {**projection, "USER_ID": 1}
+        statuses = list(self.search_reads.find(query, projection).sort("_id", ASCENDING))
+        if self.users is not None and statuses:
+            hidden = self.users.soft_deleted_user_ids({status["USER_ID"] for status in statuses})
+            statuses = [status for status in statuses if status["USER_ID"] not in hidden]
+        return self._resolved(statuses)
 
-    def search_status_by_id(self, user_id):
+    @resilient()
+    def search_status_by_id(self, user_id, projection=None, primary=False, batch_size=0,
+                            no_cursor_timeout=False):
         """"
-        Searches for all statuses by user_id in the status table
+        Searches for all statuses by user_id in the status table.
+        main.delete_user only needs the ids, so it passes {"_id": 1}, and
+        primary=True because it deletes what it finds: a lagging secondary
+        could leave statuses of the deleted user behind.
+
+        batch_size sets how many statuses each getMore round trip brings
+        back (0 leaves it to the server: 101 documents, then 16MB batches).
+        no_cursor_timeout=True keeps the server from closing the cursor
+        after 10 idle minutes during a slow scan; the caller must then
+        close it (main.stream_statuses does).
         """
         # query = {'USER_ID': user_id}
         # if self.database.count_documents(query) == 0:
         #     return None
-        return self.database.find({"USER_ID": user_id})
+        if not self._owner_visible(user_id):
+            return []
+        reads = self.database if primary else self.search_reads
+        return self._resolved(reads.find({"USER_ID": user_id}, self._text_projection(projection),
+                                        batch_size=batch_size,
+                                        no_cursor_timeout=no_cursor_timeout))
+
+    @resilient(idempotent=False)
+    def delete_statuses_by_user(self, user_id):
+        """
+        Deletes every status published by user_id with one delete_many and
+        returns how many were deleted.
+        """
+        if self.tags is not None:
+            self.tags.remove_statuses(
+                [status["_id"] for status in
+                 self.database.find({"USER_ID": user_id}, {"_id": 1})])
+        return self.database.delete_many({"USER_ID": user_id}).deleted_count
+
+    @resilient()
+    def purge_statuses_batch(self, user_id, batch_size):
+        """
+        Deletes at most batch_size statuses of user_id (and their tag
+        entries) with one delete_many. Returns how many were deleted, so
+        the purge job knows when it's done.
+        """
+        status_ids = [status["_id"] for status in
+                      self.database.find({"USER_ID": user_id}, {"_id": 1}).limit(batch_size)]
+        if not status_ids:
+            return 0
+        if self.tags is not None:
+            self.tags.remove_statuses(status_ids)
+        self.database.delete_many({"USER_ID": user_id, "_id": {"$in": status_ids}})
+        return len(status_ids)
+
+    @resilient()
+    def latest_statuses(self, user_id, limit=10):
+        """
+        Returns a cursor over the limit most recent statuses of user_id,
+        newest first. Served by the (USER_ID, CREATED_AT) index.
+        """
+        if not self._owner_visible(user_id):
+            return []
+        return self._resolved(self.search_reads.find({"USER_ID": user_id}).sort(
+            "CREATED_AT", DESCENDING).limit(limit))
+
+    @resilient()
+    def statuses_since(self, user_id, since, limit=0):
+        """
+        Returns a cursor over the statuses user_id published after the
+        datetime since, newest first. A limit of 0 means no limit.
+        """
+        if not self._owner_visible(user_id):
+            return []
+        return self._resolved(self.search_reads.find(
+            {"USER_ID": user_id, "CREATED_AT": {"$gt": since}}).sort(
+                "CREATED_AT", DESCENDING).limit(limit))
 
 
+    @resilient()
     def update_status(self, status_id, status_text):
         """"
         Updates a status if a status id can be found in the status table
         of UserStatuses database. If the status_id does not exist,
         it returns None. Otherwise, it returns True.
         """
-        query = {'_id': status_id}
-        if self.database.count_documents(query) == 0:
+        query = self._status_query(status_id)
+        if not self.status_exists(status_id):
             return None
-        new_data = {"STATUS_TEXT": status_text}
-        self.database.update_one(query, {"$set": new_data})
+        new_data = self.text_fields([status_text])[0]
+        update = {"$set": {**new_data, "MODIFIED_AT": datetime.now(timezone.utc)}}
+        if self.blobs is not None:
+            # Switching between inline and referenced text drops the other field.
+            stale = "STATUS_TEXT" if "STATUS_TEXT_REF" in new_data else "STATUS_TEXT_REF"
+            update["$unset"] = {stale: ""}
+        self.database.update_one(query, update)
+        if self.tags is not None:
+            self.tags.reindex_status(status_id, status_text)
         return True
@@ -1,14 +1,19 @@
 """
 Database methods for user collection
 """
-import sys
-from pymongo.errors import DuplicateKeyError
+import time
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError, WriteError
 
 from loguru import logger
+from bulk_writes import DOCUMENT_VALIDATION_FAILURE, insert_many_errors
+from resilience import DEFAULT_RESILIENCE, resilient
 
-logger.remove()
-logger.add('loguru_file_{time:YYYY-MM-DD}.log', level='DEBUG')
-logger.add(sys.stderr, level='WARNING')
+# Soft-deleted users carry a DELETED_AT timestamp until the purge job
+# removes them; every lookup below skips them. search_user filters them out
+# in its query, the existence checks through the soft_deleted() cache.
+NOT_DELETED = {"DELETED_AT": {"$exists": False}}
 
 
 class UserCollection:
@@ -16,59 +21,207 @@ class UserCollection:
     Creating a User Collection class to instantiate users table in
     my UserStatuses MongoDB database.
     """
-    def __init__(self, database):
+    def __init__(self, database, resilience=DEFAULT_RESILIENCE, read_preference=None,
+                 collection_name="users", deleted_ttl=1.0):
         """
-        Please make sure to change "users" to "test_users" for unit testing!
+        Binds to collection_name in database; a TenantContext carries both
+        (see socialnetwork_model), so tenants and test runs never share data.
+
+        Every method runs under resilience (see resilience.Resilience): a
+        deadline, retries of transient network errors for the idempotent
+        ones, and a circuit breaker. Pass None to call the database bare.
+
+        read_preference (see socialnetwork_model.search_read_preference)
+        routes search_user to secondaries; everything else reads the primary.
+
+        The ids of soft-deleted users are cached for deleted_ttl seconds (see
+        soft_deleted), so existence checks stay covered _id queries and
+        StatusCollection hides their statuses without reading the users
+        table. A soft delete made by another process shows up here within
+        deleted_ttl; one made through this instance, straight away.
         """
-        self.database = database["users"]
+        self.database = database[collection_name]
+        self.resilience = resilience
+        self.search_reads = self.database if read_preference is None else \
+            self.database.with_options(read_preference=read_preference)
+        self.deleted_ttl = deleted_ttl
+        self._deleted = frozenset()
+        self._deleted_until = None
+        # Only soft-deleted users have a DELETED_AT, so this index stays tiny
+        # and reloading the cache reads just the users waiting to be purged.
+        self.database.create_index("DELETED_AT", sparse=True)
 
+    @resilient(idempotent=False)
     def add_user(self, user_id, first_name, last_name, email):
         """
         Adds a new user to the users table of my UserStatuses database.
         If the user_id already exists, it raises a DuplicateKeyError and returns
-        False. Otherwise, it returns True.
+        False. It returns None if the users schema rejects the document (e.g. a
+        malformed email), so callers can tell the two apart. Otherwise, it
+        returns True.
         """
+        now = datetime.now(timezone.utc)
         try:
             self.database.insert_one(
-                {"_id": user_id, "NAME": first_name, "LASTNAME": last_name, "EMAIL": email})
+                {"_id": user_id, "NAME": first_name, "LASTNAME": last_name, "EMAIL": email,
+                 "CREATED_AT": now, "MODIFIED_AT": now})
             return True
         except DuplicateKeyError:
             return False
+        except WriteError as error:
+            if error.code != DOCUMENT_VALIDATION_FAILURE:
+                raise
+            logger.warning(f'{user_id} rejected by the users schema')
+            return None
 
+    @resilient()
+    def user_exists(self, user_id):
+        """
+        Returns True if user_id is in the users table and not soft-deleted.
+        A covered query on the _id index: the user's fields never leave the
+        server, and soft-deleted users are skipped through soft_deleted().
+        """
+        if user_id in self.soft_deleted():
+            return False
+        return self.database.find_one({"_id": user_id}, {"_id": 1}) is not None
+
+    def add_users(self, rows):
+        """
+        Adds many users with a single unordered insert_many. rows is a list
+        of (user_id, first_name, last_name, email) tuples. Returns a list of
+        booleans, one per row: False if that user_id already existed.
+        """
+        return [code is None for code in self.add_users_codes(rows)]
 
+    @resilient(idempotent=False)
+    def add_users_codes(self, rows):
+        """
+        Like add_users, but returns the server's error code for each row:
+        None if it was inserted, else DUPLICATE_KEY or
+        DOCUMENT_VALIDATION_FAILURE.
+        """
+        if not rows:
+            return []
+        now = datetime.now(timezone.utc)
+        documents = [{"_id": user_id, "NAME": first_name, "LASTNAME": last_name,
+                      "EMAIL": email, "CREATED_AT": now, "MODIFIED_AT": now}
+                     for user_id, first_name, last_name, email in rows]
+        return insert_many_errors(self.database, documents)
+
+    @resilient()
+    def existing_user_ids(self, user_ids):
+        """
+        Returns the subset of user_ids that exist in the users table (and
+        aren't soft-deleted), answered by one covered query on the _id index.
+        """
+        cursor = self.database.find({"_id": {"$in": list(user_ids)}}, {"_id": 1})
+        return {user["_id"] for user in cursor} - self.soft_deleted()
+
+
+    @resilient(idempotent=False)
     def delete_user(self, user_id):
         """
         Deletes a user in the users table of my UserStatuses database if the
         user_id exists and returns True. If it doesn't, it returns None.
         """
         query = {'_id': user_id}
-        if self.database.count_documents(query) == 0:
+        if not self.user_exists(user_id):
             return None
-        self.database.delete_one({"_id": user_id})
+        self.database.delete_one(query)
         return True
 
+    @resilient(idempotent=False)
+    def soft_delete_user(self, user_id):
+        """
+        Marks user_id as deleted with a single update. From then on the user
+        and their statuses are hidden from every search, and the purge job
+        (purge.PurgeWorker) removes them for good in the background.
+        Returns None if the user does not exist or is already deleted.
+        """
+        now = datetime.now(timezone.utc)
+        result = self.database.update_one({"_id": user_id, **NOT_DELETED},
+                                          {"$set": {"DELETED_AT": now, "MODIFIED_AT": now}})
+        if result.matched_count == 0:
+            return None
+        self._deleted = self._deleted | {user_id}
+        return True
+
+    def soft_deleted(self):
+        """
+        Returns the ids of the soft-deleted users as a frozenset, reloaded
+        with deleted_user_ids once it is deleted_ttl seconds old.
+        """
+        now = time.monotonic()
+        if self._deleted_until is None or now >= self._deleted_until:
+            self._deleted = frozenset(self.deleted_user_ids())
+            self._deleted_until = now + self.deleted_ttl
+        return self._deleted
+
+    def is_soft_deleted(self, user_id):
+        """
+        Returns True if user_id is marked deleted but not purged yet.
+        """
+        return user_id in self.soft_deleted()
+
+    def soft_deleted_user_ids(self, user_ids):
+        """
+        Returns the subset of user_ids marked deleted but not purged yet.
+        """
+        return set(user_ids) & self.soft_deleted()
 
-    def search_user(self, user_id):
+    @resilient()
+    def deleted_user_ids(self):
+        """
+        Returns the ids of the soft-deleted users still waiting to be purged,
+        read from the sparse DELETED_AT index.
+        """
+        return [user["_id"] for user in
+                self.database.find({"DELETED_AT": {"$exists": True}}, {"_id": 1})]
+
+    @resilient(idempotent=False)
+    def purge_user(self, user_id):
+        """
+        Physically removes a soft-deleted user. Returns True if it was removed.
+        """
+        result = self.database.delete_one({"_id": user_id, "DELETED_AT": {"$exists": True}})
+        self._deleted = self._deleted - {user_id}
+        return result.deleted_count == 1
+
+
+    @resilient()
+    def search_user(self, user_id, projection=None):
         """
         Searches for a user in the users table of the UserStatuses database
-        and returns the user object.
+        and returns the user object. Pass a projection (e.g. {"EMAIL": 1})
+        to fetch only the fields you need.
 
-        Returns None if the user does not exist.
+        Returns None if the user does not exist. Both reads follow the
+        search read preference, so a user added a moment ago may not be
+        found yet on a lagging secondary.
         """
-        query = {'_id': user_id}
-        if self.database.count_documents(query) == 0:
+        query = {'_id': user_id, **NOT_DELETED}
+        if self.search_reads.find_one(query, {"_id": 1}) is None:
             return None
-        return self.database.find({"_id": user_id})
+        return self.search_reads.find(query, projection)
 
 
+    @resilient()
     def update_user(self, user_id, first_name, last_name, email):
         """
-        Updates the information on a user. Returns None if the user does not exist.
+        Updates the information on a user. Returns None if the user does not exist,
+        and False if the users schema rejects the new data.
         If the user exists, it returns True.
         """
         query = {'_id': user_id}
-        if self.database.count_documents(query) == 0:
+        if not self.user_exists(user_id):
             return None
-        new_data = {"NAME": first_name, "LASTNAME": last_name, "EMAIL": email}
-        self.database.update_one(query, {"$set": new_data})
+        new_data = {"NAME": first_name, "LASTNAME": last_name, "EMAIL": email,
+                    "MODIFIED_AT": datetime.now(timezone.utc)}
+        try:
+            self.database.update_one(query, {"$set": new_data})
+        except WriteError as error:
+            if error.code != DOCUMENT_VALIDATION_FAILURE:
+                raise
+            logger.warning(f'Update of {user_id} rejected by the users schema')
+            return False
         return True